@@ -7,7 +7,6 @@ in time with `Player` rhythms to give visual aid to which players are creating w
 
 from __future__ import absolute_import, division, print_function
 
-from time import time, sleep
 from threading import Thread
 
 from .Code import execute
@@ -79,9 +78,9 @@ class Bang:
 
                     # wait until the time osc messages are sent
 
-                    while time() < message_time:
+                    while clock.get_machine_time() < message_time:
 
-                        sleep(0.001)
+                        clock.time_source.sleep(0.001)
 
                     self.widget.addTask(target=self.widget.text.tag_add, args=(self.id, start, end))
                     self.widget.addTask(target=self.widget.text.tag_config, args=(self.id,), kwargs=kwargs)
@@ -14,9 +14,14 @@ that can be proggrammed into performance.
 """
 from __future__ import absolute_import, division, print_function
 
+import atexit
 import fnmatch
+import json
 import os
+import re
+import time
 import wave
+from collections import OrderedDict
 from contextlib import closing
 from itertools import chain
 from os.path import abspath, join, isabs, isfile, isdir, splitext
@@ -25,8 +30,13 @@ from .Code import WarningMsg
 from .Logging import Timing
 from .SCLang import SampleSynthDef
 from .ServerManager import Server
-from .Settings import FOXDOT_SND, FOXDOT_LOOP
-from .Extensions import hybriddb
+from .Settings import FOXDOT_SND, FOXDOT_LOOP, FOXDOT_SAMPLE_INFO_FILES
+
+def get_hybriddb():
+    """ Returns the hybrid sample database module. This loads pony and music21 and
+        opens the database so it is only imported the first time a hybrid is used """
+    from .Extensions import hybriddb
+    return hybriddb
 
 alpha    = "abcdefghijklmnopqrstuvwxyz"
 
@@ -130,6 +140,9 @@ class Buffer(object):
         self.fn = fn
         self.bufnum   = int(number)
         self.channels = channels
+        # Players currently using the buffer and when it was last used
+        self.users     = set()
+        self.last_used = 0
 
     def __repr__(self):
         return "<Buffer num {}>".format(self.bufnum)
@@ -150,16 +163,212 @@ class Buffer(object):
 nil = Buffer('', 0)
 
 
+class SampleInfoCache(object):
+    """ Stores the number of channels, frames, and sample rate of sample files so that
+        their headers only need to be read once. Entries are checked against the file's
+        modification time and size. The cache is read from the most recently written of
+        `filenames` and saved back to the same file, or to the first of the others that
+        can be written to. It is only kept in memory if `filenames` is empty """
+    version = 1
+
+    def __init__(self, filenames=()):
+        self.filenames = list(filenames)
+        self.filename = None # file the cache was read from or last saved to
+        self.entries = None
+        self.changed = False
+        self.reads = 0
+
+    def load(self):
+        """ Reads the cache from the newest of the files that exist """
+        self.entries = {}
+        newest = None
+        for filename in self.filenames:
+            try:
+                mtime = os.stat(filename).st_mtime
+                with open(filename) as f:
+                    data = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            if isinstance(data, dict) and data.get("version") == self.version:
+                if newest is None or mtime > newest:
+                    newest = mtime
+                    self.filename = filename
+                    self.entries = data.get("files", {})
+        return
+
+    def save(self):
+        """ Writes the cache if it has changed. Returns the filename used or None """
+        if not self.changed:
+            return None
+        data = json.dumps({"version": self.version, "files": self.entries})
+        filenames = [self.filename] if self.filename is not None else []
+        for filename in filenames + [fn for fn in self.filenames if fn != self.filename]:
+            try:
+                tmp = filename + ".tmp"
+                with open(tmp, "w") as f:
+                    f.write(data)
+                os.replace(tmp, filename)
+            except (IOError, OSError):
+                continue
+            self.filename = filename
+            self.changed = False
+            return filename
+        return None
+
+    def get(self, path):
+        """ Returns a dictionary of information for a sample file """
+        if self.entries is None:
+            self.load()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {"path": path, "channels": 1, "frames": None, "samplerate": None}
+        entry = self.entries.get(path)
+        if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            entry = self.read(path)
+            entry.update(mtime=stat.st_mtime, size=stat.st_size)
+            self.entries[path] = entry
+            self.changed = True
+        return entry
+
+    def read(self, path):
+        """ Reads the header of a sample file """
+        self.reads += 1
+        entry = {"path": path, "channels": 1, "frames": None, "samplerate": None}
+        try:
+            with closing(wave.open(path)) as snd:
+                entry.update(channels=snd.getnchannels(), frames=snd.getnframes(), samplerate=snd.getframerate())
+        except (wave.Error, EOFError, IOError, OSError):
+            pass
+        return entry
+
+    def clear(self):
+        self.entries = {}
+        self.changed = True
+
+
+SampleInfo = SampleInfoCache(FOXDOT_SAMPLE_INFO_FILES)
+
+atexit.register(SampleInfo.save)
+
+
+class SampleIndex(object):
+    """ Caches the contents of sample directories and the results of sample searches
+        so that finding a sample does not need to read the file system every time.
+        Searches that find nothing are remembered too. Every `ttl` seconds the
+        modification times of the directories that have been read are checked, and
+        only the listings of those that changed are removed """
+    def __init__(self, ttl=1.0):
+        self.ttl      = ttl
+        self.mtimes   = {} # dirname -> mtime
+        self.listings = {} # dirname -> (sorted sub-directory names, sorted file names)
+        self.paths    = {} # (filename, index) -> path of sample found, or None
+        self.globs    = {}
+        self.links    = set()
+        self.checked  = time.time()
+        self.version  = 0
+
+    def clear(self):
+        self.mtimes   = {}
+        self.listings = {}
+        self.paths    = {}
+        self.version += 1
+
+    @staticmethod
+    def mtime(dirname):
+        try:
+            return os.stat(dirname).st_mtime
+        except OSError:
+            return None
+
+    def track(self, dirname):
+        """ Keeps an eye on a directory whose contents affect the cached searches """
+        if dirname not in self.mtimes:
+            self.mtimes[dirname] = self.mtime(dirname)
+
+    def validate(self):
+        """ Removes cached information if any of the tracked directories have changed
+            since they were read. Only checks once every `ttl` seconds """
+        now = time.time()
+        if now - self.checked < self.ttl:
+            return
+        self.checked = now
+        changed = [dirname for dirname, mtime in self.mtimes.items() if self.mtime(dirname) != mtime]
+        if changed:
+            for dirname in changed:
+                del self.mtimes[dirname]
+                self.listings.pop(dirname, None)
+            self.paths = {}
+            self.version += 1
+        return
+
+    def listdir(self, dirname):
+        """ Returns lists of the sub-directories and files in a directory, both sorted """
+        listing = self.listings.get(dirname)
+        if listing is None:
+            self.mtimes[dirname] = self.mtime(dirname)
+            dirs, files = [], []
+            for entry in os.scandir(dirname):
+                (dirs if entry.is_dir() else files).append(entry.name)
+                if entry.is_symlink():
+                    self.links.add(entry.path)
+            listing = self.listings[dirname] = (sorted(dirs), sorted(files))
+        return listing
+
+    def walk(self, top):
+        """ Same as os.walk but uses the cached listings """
+        dirs, files = self.listdir(top)
+        yield top, dirs, files
+        for name in dirs:
+            path = join(top, name)
+            # Like os.walk, don't follow symbolic links to directories
+            if path not in self.links:
+                for item in self.walk(path):
+                    yield item
+
+    def glob(self, pattern):
+        """ Returns a compiled match function for a glob pattern """
+        match = self.globs.get(pattern)
+        if match is None:
+            match = self.globs[pattern] = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+        return match
+
+    def __contains__(self, key):
+        """ Returns True if the result of searching for a (filename, index) is known """
+        self.validate()
+        return key in self.paths
+
+    def get(self, filename, index):
+        self.validate()
+        return self.paths.get((filename, index))
+
+    def set(self, filename, index, path):
+        if path is not None:
+            self.track(os.path.dirname(path))
+        elif os.path.isabs(filename):
+            # Nothing was found, so watch the directory the sample would be in
+            self.track(os.path.dirname(filename))
+        self.paths[(filename, index)] = path
+
+
 class BufferManager(object):
-    def __init__(self, server=Server, paths=()):
+    def __init__(self, server=Server, paths=(), info=SampleInfo):
         self._server = server
+        self._info = info
         self._max_buffers = server.max_buffers
         # Keep buffer 0 unallocated because we use it as the "nil" buffer
         self._nextbuf = 1
         self._buffers = [None for _ in range(self._max_buffers)]
         self._fn_to_buf = {}
+        # Loaded buffers from least to most recently used, and the buffers each player uses
+        self._lru = OrderedDict()
+        self._users = {}
+        self.evictions = 0
+        self.freed = 0 # number of buffers freed, so that users can tell when to check theirs
         self._paths = [FOXDOT_LOOP] + list(paths)
         self._ext = ['wav', 'wave', 'aif', 'aiff', 'flac']
+        self._index = SampleIndex()
+        self._symbol_memo = {}
 
         self.loops = [fn.rsplit(".",1)[0] for fn in os.listdir(FOXDOT_LOOP)]
 
@@ -179,8 +388,13 @@ class BufferManager(object):
         """ Clears the cache of loaded buffers """
         files = list(self._fn_to_buf.keys())
         self._fn_to_buf = {}
+        self._buffers = [None for _ in range(self._max_buffers)]
+        self._lru = OrderedDict()
+        self._users = {}
+        self._nextbuf = 1
         for fn in files:
             self.loadBuffer(fn)
+        self._info.save()
         return
 
     def reset(self):
@@ -192,19 +406,62 @@ class BufferManager(object):
             self._nextbuf = 1
 
     def _getNextBufnum(self):
-        """ Get the next free buffer number """
+        """ Get the next free buffer number. If all the buffers are in use, the least
+            recently used buffer that no player is using is freed """
         start = self._nextbuf
         while self._buffers[self._nextbuf] is not None:
             self._incr_nextbuf()
             if self._nextbuf == start:
-                raise RuntimeError("Buffers full! Cannot allocate additional buffers.")
+                return self._evict()
         freebuf = self._nextbuf
         self._incr_nextbuf()
         return freebuf
 
+    def _evict(self):
+        """ Frees the least recently used buffer without any users and returns its number """
+        for buf in self._lru.values():
+            if not buf.users:
+                self.free(buf.bufnum)
+                self.evictions += 1
+                return buf.bufnum
+        raise RuntimeError("Buffers full! Cannot allocate additional buffers.")
+
+    def useBuffer(self, buf, user=None):
+        """ Marks a buffer (or buffer number) as just used, and as being used by
+            `user` (usually a Player) until `release` is called for it """
+        if not isinstance(buf, Buffer):
+            buf = self._buffers[int(buf)] if 0 < int(buf) < len(self._buffers) else None
+        if buf is None or buf is nil:
+            return nil
+        buf.last_used = time.time()
+        if buf.bufnum in self._lru:
+            self._lru.move_to_end(buf.bufnum)
+        if user is not None and user not in buf.users:
+            buf.users.add(user)
+            self._users.setdefault(user, set()).add(buf)
+        return buf
+
+    def release(self, user):
+        """ Stops `user` from referencing any buffers so they can be freed if needed """
+        for buf in self._users.pop(user, ()):
+            buf.users.discard(user)
+        return
+
+    def stats(self):
+        """ Returns a dictionary of information about the loaded buffers """
+        return {"loaded": len(self._lru),
+                "max_buffers": self._max_buffers,
+                "in_use": sum(1 for buf in self._lru.values() if buf.users),
+                "evictions": self.evictions}
+
+    def getLoadedBuffers(self):
+        """ Returns a list of (filename, bufnum) tuples for the loaded buffers """
+        return [(buf.fn, buf.bufnum) for buf in self._fn_to_buf.values()]
+
     def addPath(self, path):
         """ Add a path to the search paths for samples """
         self._paths.append(abspath(path))
+        self._index.clear()
 
     def free(self, filenameOrBuf):
         """ Free a buffer. Accepts a filename or buffer number """
@@ -214,6 +471,11 @@ class BufferManager(object):
             buf = self._fn_to_buf[filenameOrBuf]
         del self._fn_to_buf[buf.fn]
         self._buffers[buf.bufnum] = None
+        self._lru.pop(buf.bufnum, None)
+        for user in buf.users:
+            self._users.get(user, set()).discard(buf)
+        buf.users.clear()
+        self.freed += 1
         self._server.bufferFree(buf.bufnum)
 
     def freeAll(self):
@@ -236,8 +498,18 @@ class BufferManager(object):
         self._max_buffers = max_buffers
         self._nextbuf = self._nextbuf % max_buffers
 
-    def getBufferFromSymbol(self, symbol, index=0):
-        """ Get buffer information from a symbol """
+    def getBufferFromSymbol(self, symbol, index=0, user=None):
+        """ Get buffer information from a symbol. If `user` is given then the
+            buffer will not be freed to make space until `user` is released """
+        # Use the same buffer as last time if it is still loaded and the
+        # sample directories have not changed
+        key = (symbol, index)
+        memo = self._symbol_memo.get(key)
+        if memo is not None:
+            version, buf = memo
+            self._index.validate()
+            if version == self._index.version and self._fn_to_buf.get(buf.fn) is buf:
+                return self.useBuffer(buf, user)
         if symbol.isspace():
             return nil
         dirname = symbolToDir(symbol)
@@ -246,20 +518,57 @@ class BufferManager(object):
         samplepath = self._findSample(dirname, index)
         if samplepath is None:
             return nil
-        return self._allocateAndLoad(samplepath)
+        buf = self._allocateAndLoad(samplepath)
+        self._symbol_memo[key] = (self._index.version, buf)
+        return self.useBuffer(buf, user)
 
     def getBuffer(self, bufnum):
         """ Get buffer information from the buffer number """
         return self._buffers[bufnum]
 
+    def _allocate(self, filename):
+        """ Allocates a buffer number for a filename without loading it """
+        bufnum = self._getNextBufnum()
+        buf = Buffer(filename, bufnum, self._info.get(filename)["channels"])
+        self._fn_to_buf[filename] = buf
+        self._buffers[bufnum] = buf
+        self._lru[bufnum] = buf
+        return buf
+
+    def prefetch(self, samples, user=None):
+        """ Loads the buffers for a list of (symbol, index) tuples, sending all the
+            files that are not already loaded to the server together. Returns the
+            list of buffers, which are used by `user` if it is given """
+        buffers, new = [], []
+        for symbol, index in samples:
+            if symbol.isspace():
+                continue
+            dirname = symbolToDir(symbol)
+            if dirname is None:
+                continue
+            samplepath = self._findSample(dirname, index)
+            if samplepath is None:
+                continue
+            buf = self._fn_to_buf.get(samplepath)
+            if buf is None:
+                buf = self._allocate(samplepath)
+                new.append((samplepath, buf.bufnum))
+            self._symbol_memo[(symbol, index)] = (self._index.version, buf)
+            # Mark the buffer as used straight away so it isn't freed by the next one
+            buffers.append(self.useBuffer(buf, user))
+        if new:
+            self._server.bufferReadBatch(new)
+        return buffers
+
+    def isLoaded(self, buf):
+        """ Returns True if the server has finished loading a buffer """
+        return self._server.isBufferLoaded(int(buf))
+
     def _allocateAndLoad(self, filename, force=False):
         """ Allocates and loads a buffer from a filename, with caching """
         if filename not in self._fn_to_buf:
-            bufnum = self._getNextBufnum()
-            buf = Buffer.fromFile(filename, bufnum)
-            self._server.bufferRead(filename, bufnum)
-            self._fn_to_buf[filename] = buf
-            self._buffers[bufnum] = buf
+            buf = self._allocate(filename)
+            self._server.bufferRead(filename, buf.bufnum)
         elif force:
             buf = self._fn_to_buf[filename]
             self._server.bufferRead(filename, buf.bufnum)
@@ -312,7 +621,8 @@ class BufferManager(object):
     def _getFileInDir(self, dirname, index):
         """ Return nth sample in a directory """
         candidates = []
-        for filename in sorted(os.listdir(dirname)):
+        dirs, files = self._index.listdir(dirname)
+        for filename in files:
             name, ext = splitext(filename)
             if ext.lower()[1:] in self._ext:
                 fullpath = join(dirname, filename)
@@ -340,12 +650,14 @@ class BufferManager(object):
             """ For a path pattern, find all subpaths that match """
             # ** is a special case meaning "all recursive directories"
             if pattern == '**':
-                for dirpath, _, _ in os.walk(path):
+                for dirpath, _, _ in self._index.walk(path):
                     yield dirpath
-            else:
-                children = os.listdir(path)
-                for c in fnmatch.filter(children, pattern):
-                    yield join(path, c)
+            elif isdir(path):
+                dirs, files = self._index.listdir(path)
+                match = self._index.glob(pattern)
+                for c in sorted(dirs + files):
+                    if match(os.path.normcase(c)):
+                        yield join(path, c)
 
         candidates = []
         queue = self._paths[:]
@@ -361,16 +673,20 @@ class BufferManager(object):
         # the full filename. If not, we just match against the basename.
         match_base = not hasext(filepat)
 
+        match = self._index.glob(filepat)
+
         for path in queue:
-            for subpath, _, filenames in os.walk(path):
-                for filename in sorted(filenames):
+            if not isdir(path):
+                continue
+            for subpath, _, filenames in self._index.walk(path):
+                for filename in filenames:
                     basename, ext = splitext(filename)
                     if ext[1:].lower() not in self._ext:
                         continue
                     if match_base:
-                        ismatch = fnmatch.fnmatch(basename, filepat)
+                        ismatch = match(os.path.normcase(basename))
                     else:
-                        ismatch = fnmatch.fnmatch(filename, filepat)
+                        ismatch = match(os.path.normcase(filename))
                     if ismatch:
                         fullpath = join(subpath, filename)
                         if len(candidates) == index:
@@ -380,15 +696,27 @@ class BufferManager(object):
             return candidates[index % len(candidates)]
         return None
 
-    @Timing('bufferSearch', logargs=True)
     def _findSample(self, filename, index=0):
         """
         Find a sample from a filename or pattern
 
         Will first attempt to find an exact match (by abspath or relative to
         the search paths). Then will attempt to pattern match in search paths.
+        Results, including searches that find nothing, are remembered by the
+        sample index until the directories that were searched change.
 
         """
+        if (filename, index) in self._index:
+            return self._index.get(filename, index)
+        path = self._searchSample(filename, index)
+        self._index.set(filename, index, path)
+        return path
+
+    @Timing('bufferSearch', logargs=True)
+    def _searchSample(self, filename, index=0):
+        """ Searches the file system for a sample, see `_findSample` """
+        for root in self._paths:
+            self._index.track(root)
         path = self._searchPaths(filename)
         if path:
             # If it's a file, use that sample
@@ -421,7 +749,7 @@ class BufferManager(object):
             return 0
         else:
             buf = self._allocateAndLoad(samplepath, force=force)
-            return buf.bufnum
+            return self.useBuffer(buf).bufnum
 
 
 def hasext(filename):
@@ -431,6 +759,116 @@ def hasext(filename):
 Samples = BufferManager()
 
 
+class ToneSnapshot(object):
+    """ Read-only copy of a hybrid tone. `notes` holds a (bufnum, rate, amp) tuple
+        for each MIDI note, or None if the tone has no sample for it, so that players
+        do not need to use the database when playing notes """
+    __slots__ = ("id", "name", "notes", "version")
+
+    def __init__(self, id, name, notes, version=0):
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "notes", tuple(notes))
+        object.__setattr__(self, "version", version)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is read-only".format(self.__class__.__name__))
+
+    def __repr__(self):
+        return "<Tone {}: {}>".format(self.id, self.name)
+
+    def get(self, midi):
+        """ Returns the (bufnum, rate, amp) for a MIDI note or None """
+        if 0 <= midi < len(self.notes):
+            return self.notes[midi]
+        return None
+
+    def bufnums(self):
+        """ Returns the set of buffer numbers the tone's notes are played with """
+        return set(note[0] for note in self.notes if note is not None)
+
+    @classmethod
+    def fromNotesMap(cls, id, name, notes_map, buffers, version=0):
+        """ Creates a snapshot from a tone's notes map of midi -> (sample id, rate)
+            and a dictionary of sample id -> buffer number """
+        notes = []
+        for midi in range(128):
+            # The map is stored as JSON so the keys are usually strings
+            value = notes_map.get(str(midi), notes_map.get(midi))
+            if value is not None and value[0] in buffers:
+                sample, rate = value
+                amp = (1 / (rate ** 1.7)) if rate < 1 else rate
+                notes.append((buffers[sample], rate, amp))
+            else:
+                notes.append(None)
+        return cls(id, name, notes, version)
+
+
+class ToneCache(object):
+    """ Keeps a ToneSnapshot for each hybrid tone that has been used. A snapshot
+        is only rebuilt when the database says the tone has changed or when one
+        of its buffers has been freed """
+    def __init__(self, bank=Samples):
+        self.bank    = bank
+        self.tones   = {}
+        self.buffers = {} # name -> Buffer objects the snapshot uses
+        self.freed   = {} # name -> number of buffers the bank had freed when checked
+
+    def __getitem__(self, name):
+        """ Returns the snapshot for a tone name or id, or None if it does not exist """
+        hybriddb = get_hybriddb()
+        snapshot = self.tones.get(name)
+        if snapshot is None or snapshot.version != hybriddb.get_tone_version() or not self.loaded(name):
+            snapshot = self.load(name, hybriddb)
+        return snapshot
+
+    def loaded(self, name):
+        """ Returns True if all the buffers used by the snapshot are still allocated.
+            They are only checked again after the bank has freed a buffer """
+        if self.freed.get(name) == self.bank.freed:
+            return True
+        if all(self.bank.getBuffer(buf.bufnum) is buf for buf in self.buffers.get(name, ())):
+            self.freed[name] = self.bank.freed
+            return True
+        return False
+
+    def load(self, name, hybriddb):
+        info = hybriddb.get_tone_info(name)
+        self.release(name)
+        if info is None:
+            return None
+        # Load the tone's samples (FoxDot naming convention compliant) as buffers
+        buffers = {}
+        for sample in info["samples"]:
+            buffers[sample] = self.bank.loadBuffer(info["folder"], sample)
+        snapshot = ToneSnapshot.fromNotesMap(info["id"], info["name"], info["notes_map"], buffers,
+                                             hybriddb.get_tone_version())
+        self.tones[name] = snapshot
+        # The snapshot only holds buffer numbers, so it uses its buffers to stop
+        # them being freed and reused for other samples while it is cached
+        self.buffers[name] = [self.bank.useBuffer(bufnum, user=snapshot) for bufnum in snapshot.bufnums() if bufnum]
+        return snapshot
+
+    def release(self, name):
+        """ Removes a tone's snapshot and lets its buffers be freed """
+        snapshot = self.tones.pop(name, None)
+        self.buffers.pop(name, None)
+        self.freed.pop(name, None)
+        if snapshot is not None:
+            self.bank.release(snapshot)
+        return
+
+    def clear(self):
+        for name in list(self.tones):
+            self.release(name)
+        self.tones = {}
+        self.buffers = {}
+        self.freed = {}
+
+
+Tones = ToneCache()
+
+
 class LoopSynthDef(SampleSynthDef):
     def __init__(self):
         SampleSynthDef.__init__(self, "loop")
@@ -471,22 +909,9 @@ class HybridSynthDef(SampleSynthDef):
     # Adds looking up tones by name and id
     # and loading all of their samples as buffers for when we need them
     def __call__(self, tonename, pos=0, sample=0, **kwargs):
-        #print("Buffer tonename", tonename)
-        tone = hybriddb.get_tone(tonename)
+        tone = Tones[tonename]
         if(tone == None):
             WarningMsg("Could not find tone matching %r" % tonename)
-        if (tone != None):
-            #hybriddb gives us a sample folder and sample numbers
-            filename = tone.getFolderPath()
-            sampleIDs = tone.getSampleIDs()
-
-            #Create a map of samples (FoxDot naming convetion compliant)
-            # to buffer numbers
-            buffers = {}
-            for sample in sampleIDs:
-                newBuffer = Samples.loadBuffer(filename, sample);
-                buffers[sample] = newBuffer
-            tone.buffers = buffers
 
         kwargs["tone"] = tone
         proxy = SampleSynthDef.__call__(self, pos, **kwargs)
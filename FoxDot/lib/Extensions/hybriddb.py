@@ -2,6 +2,7 @@ from pony.orm import *
 from music21 import pitch
 import os
 from shutil import copyfile
+from contextlib import contextmanager
 import re
 notefilenamepattern = re.compile("([a-gA-G][\_\-\+\b\#\^]*(10|[0-9]))|((10|[0-9])[a-gA-G][\_\-\+\b\# ]*)")
 
@@ -13,7 +14,85 @@ basefolder = os.path.join(os.path.expanduser("~"),".foxdot_samples")
 if not os.path.exists(basefolder):
     os.makedirs(basefolder)
 
-db.bind(provider='sqlite', filename=os.path.join(basefolder, 'database.sqlite'), create_db=True)
+dbfilename = os.path.join(basefolder, 'database.sqlite')
+
+db.bind(provider='sqlite', filename=dbfilename, create_db=True)
+
+# Increased whenever a tone's note mapping changes so cached copies can be refreshed
+tone_version = 0
+
+def tone_changed():
+    global tone_version
+    tone_version += 1
+
+def get_tone_version():
+    """ Returns a value that changes whenever a tone's note mapping may have changed,
+        either in this process or by another one (such as a batch import) writing to
+        the database file """
+    version = [tone_version]
+    for filename in (dbfilename, dbfilename + "-wal"):
+        try:
+            stat = os.stat(filename)
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+# Tones whose maps need rebuilding at the end of a batch import (None when not importing)
+_deferred_tones = None
+
+@contextmanager
+def batch_import():
+    """ Defers rebuilding tone maps when samples are added or removed until the end
+        of the block, so that each tone's map is only made once """
+    global _deferred_tones
+    if _deferred_tones is not None:
+        yield
+        return
+    _deferred_tones = set()
+    try:
+        yield
+    finally:
+        tones, _deferred_tones = _deferred_tones, None
+        with db_session:
+            for toneid in tones:
+                if Tone.exists(id=toneid):
+                    Tone[toneid].makeMap()
+
+TWELFTH_ROOT_OF_TWO = 2.0 ** (1 / 12)
+
+def midi_to_freq(midi):
+    """ Equal temperament frequency (A4 = 440Hz), calculated the same way as music21 """
+    return 440.0 * (TWELFTH_ROOT_OF_TWO ** (midi - 69))
+
+def make_notes_map(samples, notes=range(0,127)):
+    """ Takes a list of (sample id, midi) tuples and returns a dictionary of midi ->
+        (sample id, rate) for the best sample to play each note in `notes` and the rate
+        to play it at. Lower samples are preferred over higher ones at the same distance """
+    if len(samples) == 0:
+        return dict((midi, (None, None)) for midi in notes)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    ids = [s[0] for s in samples]
+    if numpy is not None:
+        # Score matrix of samples x notes, argmin keeps the first of equal scores
+        sample_midi = numpy.array([s[1] for s in samples], dtype=float)[:, None]
+        note_midi = numpy.array(notes, dtype=float)[None, :]
+        scores = (sample_midi - note_midi) ** 2 + 0.6 * (sample_midi > note_midi)
+        best = scores.argmin(axis=0)
+        # numpy's power can differ from Python's in the last digit so use Python for the frequencies
+        note_freqs = numpy.array([midi_to_freq(midi) for midi in notes])
+        sample_freqs = numpy.array([midi_to_freq(s[1]) for s in samples])
+        rates = note_freqs / sample_freqs[best]
+        return dict((midi, (ids[i], float(rate))) for midi, i, rate in zip(notes, best.tolist(), rates))
+    notes_map = {}
+    for midi in notes:
+        scores = [((s_midi - midi) ** 2) + (0.6 if s_midi > midi else 0) for s_id, s_midi in samples]
+        i = scores.index(min(scores))
+        notes_map[midi] = (ids[i], midi_to_freq(midi) / midi_to_freq(samples[i][1]))
+    return notes_map
 
 def getMidiByName(note, oct=4):
     fullnote = notename+str(octave)
@@ -43,23 +122,7 @@ class Tone(db.Entity):
 
     #cache the FoxDot best sample ids and player rate for each midi note
     def makeMap(self):
-        map = {}
-        for midi in range(0,127):
-            #loop around samples
-            lowscore = 1000000000
-            lowsample = None
-            for s in self.samples:
-                currscore = s.score(midi)
-                #print("currscore", currscore,lowscore)
-                if(currscore < lowscore):
-                    #print("lower score midi "+str(pitch.Pitch(midi)) +" to sample "+str(pitch.Pitch(s.midi))+ " score "+str(currscore) )
-                    lowscore = currscore
-                    lowsample = s
-            if(lowsample):
-                transform = lowsample.getTransform(midi)
-                map[midi] = (lowsample.get_pk(), transform)
-            else:
-                map[midi] = (None, None)
+        map = make_notes_map([(s.get_pk(), s.midi) for s in self.samples])
 
         self.notes_map = map
         samples = []
@@ -70,7 +133,17 @@ class Tone(db.Entity):
         self.samples_map = samples
         samplesAsMidi.sort()
         print(self.name, samplesAsMidi)
+        tone_changed()
 
+    def after_delete(self):
+        tone_changed()
+
+    def updateMap(self):
+        """ Rebuilds the map now or at the end of the current batch import """
+        if _deferred_tones is not None:
+            _deferred_tones.add(self.id)
+        else:
+            self.makeMap()
 
     def getClosestSample(self, midi):
         sampleid, transform = self.notes_map[midi]
@@ -90,6 +163,12 @@ def getFileName(name, sample=0):
 
 
 def getNoteFromWavFile(filename, samplerate = 44100):
+    note, confidence = getNoteAndConfidenceFromWavFile(filename, samplerate)
+    return note
+
+def getNoteAndConfidenceFromWavFile(filename, samplerate = 44100, verbose = True):
+    """ Detects the pitch of a sample using aubio and returns the midi note with the
+        fraction of frames that were detected with confidence (0 to 1) """
     from aubio import source, pitch, midi2note
     from numpy import mean, array, ma
 
@@ -139,15 +218,57 @@ def getNoteFromWavFile(filename, samplerate = 44100):
         #cleaned_pitches = ma.masked_where(cleaned_pitches > 120, cleaned_pitches)
         cleaned_pitches = ma.masked_where(confidences < tolerance, cleaned_pitches)
         cleaned_pitches = ma.masked_where(cleaned_pitches==0, cleaned_pitches)
-        note = int(round(mean(cleaned_pitches.compressed())))
+        cleaned_pitches = cleaned_pitches.compressed()
+
+        if len(cleaned_pitches) == 0:
+            if verbose:
+                print ("Could not find note from WAV "+ filename)
+            return None, 0.0
 
-        print(note, midi2note(note))
+        note = int(round(mean(cleaned_pitches)))
 
-        return note
+        if verbose:
+            print(note, midi2note(note))
+
+        return note, len(cleaned_pitches) / float(len(pitches))
     except RuntimeError as err:
         print ("Could not find note from WAV "+ filename)
         print (err)
-        return None
+        return None, 0.0
+
+def detectNote(filename, samplerate = 44100):
+    """ Returns (filename, midi, confidence) for a sample. Notes in the filename are
+        used with full confidence before trying pitch detection. Runs in a worker
+        process when importing samples in a batch """
+    midi = getNoteFromFileName(os.path.basename(filename))
+    if midi is not None:
+        return filename, midi, 1.0
+    try:
+        midi, confidence = getNoteAndConfidenceFromWavFile(filename, samplerate, verbose=False)
+    except ImportError:
+        # aubio is not installed
+        midi, confidence = None, 0.0
+    return filename, midi, confidence
+
+def detectNotes(filenames, samplerate = 44100, workers = None):
+    """ Detects the notes of samples in a process pool and yields (filename, midi, confidence)
+        in the order they are finished """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(detectNote, filename, samplerate) for filename in filenames]
+        for future in as_completed(futures):
+            yield future.result()
+
+def writeReviewReport(filename, rows):
+    """ Writes a CSV of samples that need their notes checking, rows are tuples
+        of (path, midi, confidence, reason) """
+    import csv
+    with open(filename, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["path", "midi", "confidence", "reason"])
+        for path, midi, confidence, reason in rows:
+            writer.writerow([path, "" if midi is None else midi, "{:.2f}".format(confidence), reason])
+    return filename
 
 def getNoteFromFileName(filename):
     #print("getNoteFromFileName", filename)
@@ -256,13 +377,13 @@ class Sample(db.Entity):
         print("Added " + self.name + " to "+tone.name+" as "+ str(loadedPitch) )
 
     def after_delete(self):
-        self.tone.makeMap()
+        self.tone.updateMap()
 
     def after_insert(self):
-        self.tone.makeMap()
+        self.tone.updateMap()
 
-    def after_update():
-        self.tone.makeMap()
+    def after_update(self):
+        self.tone.updateMap()
 
 class Note(db.Entity):
     id          = PrimaryKey(int, auto=True)
@@ -292,6 +413,18 @@ def get_tone(name):
         return Tone.get(name=name)
     return None
 
+@db_session
+def get_tone_info(name):
+    """ Returns a dictionary of the tone's data that can be used outside of a db_session """
+    tone = get_tone(name)
+    if tone is None:
+        return None
+    return {"id"       : tone.id,
+            "name"     : tone.name,
+            "folder"   : tone.getFolderPath(),
+            "samples"  : list(tone.getSampleIDs() or []),
+            "notes_map": dict(tone.notes_map or {})}
+
 @db_session
 def show_list():
     select((t.id, t.name) for t in Tone).show()
@@ -318,6 +451,7 @@ def get_or_create_tone_from_sample(
     octave = None,
     source = None,
     samplerate = 44100,
+    check = True,
     ):
 
     tonefolderpath = os.path.dirname(inputfilepath)
@@ -338,7 +472,7 @@ def get_or_create_tone_from_sample(
 
     #t.makeMap()
     commit()
-    if(checkHybrid(t.id) == False):
+    if(check and checkHybrid(t.id) == False):
         s.delete()
 
     return t,s
@@ -405,6 +539,74 @@ def get_or_create_sample(
         samplerate = samplerate
         )
 
+def import_directory(
+    path,
+    bpm = None,
+    source = None,
+    samplerate = 44100,
+    threshold = 0.8,
+    workers = None,
+    report = None,
+    ):
+    """ Imports every .wav file in a directory as samples for the tone named after it
+        without asking any questions. Notes are detected in parallel and samples whose
+        confidence is below `threshold`, or that repeat a note, are written to a review
+        report instead of being added. All the samples are added in one transaction and
+        the tone's map is made once. Returns the tone id, number added, and the report """
+
+    path = os.path.abspath(path)
+    filenames = sorted(os.path.join(path, entry) for entry in os.listdir(path) if entry.endswith('.wav'))
+    filenames = [filename for filename in filenames if os.path.isfile(filename)]
+
+    accepted = []
+    review = []
+
+    for n, (filename, midi, confidence) in enumerate(detectNotes(filenames, samplerate, workers)):
+        name = os.path.basename(filename)
+        if midi is None:
+            review.append((filename, midi, confidence, "no note found"))
+            status = "no note found"
+        elif confidence < threshold:
+            review.append((filename, midi, confidence, "low confidence"))
+            status = "{} ({:.2f}) needs review".format(midi, confidence)
+        else:
+            accepted.append((filename, midi, confidence))
+            status = "{} ({:.2f})".format(midi, confidence)
+        print("[{}/{}] {}: {}".format(n + 1, len(filenames), name, status))
+
+    # Add samples in the same order every time
+
+    accepted.sort()
+
+    toneid = None
+    added = 0
+
+    with batch_import():
+        with db_session:
+            tone = get_or_create_tone(os.path.basename(path))
+            notes = set(s.midi for s in tone.samples)
+            for filename, midi, confidence in accepted:
+                if midi in notes:
+                    review.append((filename, midi, confidence, "duplicate note"))
+                    continue
+                Sample(inputfilepath=filename, tone=tone, midi=midi, bpm=bpm, source=source or "", samplerate=samplerate)
+                # Sample numbers are counted from the database so write (but don't commit) each one
+                flush()
+                notes.add(midi)
+                added += 1
+            commit()
+            toneid = tone.id
+
+    if review:
+        if report is None:
+            report = os.path.join(basefolder, os.path.basename(path) + "_review.csv")
+        writeReviewReport(report, sorted(review))
+        print("{} samples need reviewing, see {}".format(len(review), report))
+    else:
+        report = None
+
+    return toneid, added, report
+
 def hybrid_main():
     import argparse
 
@@ -437,6 +639,18 @@ def hybrid_main():
     parser.add_argument('-d','--delete', type=int, nargs='?', default=None,
                         help='Delete a Tone')
 
+    parser.add_argument('-a','--batch', action='store_true',
+                        help='Import a directory without prompting, detecting notes in parallel')
+
+    parser.add_argument('-c','--threshold', type=float, nargs='?', default=0.8,
+                        help='Minimum pitch detection confidence (0-1) for batch imports')
+
+    parser.add_argument('-w','--workers', type=int, nargs='?', default=None,
+                        help='Number of processes used for batch imports')
+
+    parser.add_argument('--report', type=str, nargs='?', default=None,
+                        help='Where to write the batch import review report (CSV)')
+
     parser.add_argument('-t','--test', action='store_true', help="Run test suite")
     parser.add_argument('-l','--list', action='store_true', help="List available tones")
     parser.add_argument('-r','--refresh', action='store_true', help="Regenerate Mapping Data")
@@ -447,43 +661,61 @@ def hybrid_main():
     args = parser.parse_args()
 
 
-    if(args.path):
+    if(args.path and args.batch and os.path.isdir(args.path)):
+        toneid, added, report = import_directory(
+            args.path,
+            bpm = args.bpm,
+            source = args.source,
+            samplerate = args.samplerate,
+            threshold = args.threshold,
+            workers = args.workers,
+            report = args.report
+        )
+        print("Added {} samples to tone {}".format(added, toneid))
+
+    elif(args.path):
         ourtone=None
         if os.path.isdir(args.path):
-            for entry in os.listdir(args.path):
-                fullpath = os.path.join(args.path, entry)
-                if os.path.isfile(fullpath) and entry.endswith('.wav'):
-                    with db_session:
-                        try:
-                            t, s = get_or_create_tone_from_sample(
-                                inputfilepath = os.path.abspath(fullpath),
-                                bpm=args.bpm,
-                                source = args.source,
-                                samplerate = args.samplerate
-                            )
-                            ourtone = t
-                        except ValueError as err:
-                            print (err)
-
-            else :
-                with db_session:
-                    try:
-                        t, s = get_or_create_tone_from_sample(
-                            inputfilepath = os.path.abspath(args.path),
-                            bpm=args.bpm,
-                            notename = args.note,
-                            octave = args.octave,
-                            midi=args.midi,
-                            source = args.source,
-                            samplerate = args.samplerate
-                        )
-                        ourtone = t
-                    except ValueError as err:
-                        print (err)
+            # Only make the tone's map once all the samples are added
+            with batch_import():
+                for entry in os.listdir(args.path):
+                    fullpath = os.path.join(args.path, entry)
+                    if os.path.isfile(fullpath) and entry.endswith('.wav'):
+                        with db_session:
+                            try:
+                                t, s = get_or_create_tone_from_sample(
+                                    inputfilepath = os.path.abspath(fullpath),
+                                    bpm=args.bpm,
+                                    source = args.source,
+                                    samplerate = args.samplerate,
+                                    check = False
+                                )
+                                ourtone = t
+                            except ValueError as err:
+                                print (err)
+
+            if(ourtone and checkHybrid(ourtone.id) == False):
+                print("Use --delete {} to remove the tone".format(ourtone.id))
+
+        else :
+            with db_session:
+                try:
+                    t, s = get_or_create_tone_from_sample(
+                        inputfilepath = os.path.abspath(args.path),
+                        bpm=args.bpm,
+                        notename = args.note,
+                        octave = args.octave,
+                        midi=args.midi,
+                        source = args.source,
+                        samplerate = args.samplerate
+                    )
+                    ourtone = t
+                except ValueError as err:
+                    print (err)
 
         if(ourtone):
             with db_session:
-                print(ourtone.getNotePlayInfo(60))
+                print(Tone[ourtone.id].getNotePlayInfo(60))
 
     elif(args.delete):
         with db_session:
@@ -2,14 +2,126 @@
 import inspect
 import functools
 import logging
+import json
 import time
 
+from collections import deque
+
 
 def enablePerfLogging():
     """ This is just a small convenience method """
     logging.getLogger('FoxDot.perf').setLevel(logging.DEBUG)
 
 
+class RingBuffer(object):
+    """
+    Keeps the most recent `size` values added to it, so that it can be used to
+    measure things that happen many times a second without using more memory
+    over time. `count` is the number of values ever added.
+
+        timings = RingBuffer(1024)
+        timings.append(0.002)
+        timings.summary() # {"count": 1, "mean": 0.002, "p50": 0.002, ...}
+
+    """
+
+    percentiles = (50, 90, 99)
+
+    def __init__(self, size=1024):
+        self.data = deque(maxlen=size)
+        self.count = 0
+
+    def __repr__(self):
+        return "<RingBuffer {}/{}>".format(len(self.data), self.data.maxlen)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(list(self.data))
+
+    def append(self, value):
+        self.data.append(value)
+        self.count += 1
+
+    def clear(self):
+        self.data.clear()
+        self.count = 0
+
+    def percentile(self, q, data=None):
+        """ Returns the `q`th percentile (0-100) of the values using the nearest rank """
+        data = sorted(self.data) if data is None else data
+        if len(data) == 0:
+            return 0.0
+        rank = int(round(q / 100 * (len(data) - 1)))
+        return data[min(max(rank, 0), len(data) - 1)]
+
+    def summary(self):
+        """ Returns a dictionary of the count, mean, max and percentiles of the values """
+        data = sorted(self.data)
+        summary = {"count": self.count, "mean": sum(data) / len(data) if data else 0.0, "max": data[-1] if data else 0.0}
+        for q in self.percentiles:
+            summary["p{}".format(q)] = self.percentile(q, data)
+        return summary
+
+
+class Telemetry(object):
+    """
+    A `RingBuffer` for each named measurement, which is created the first time a
+    value is added for it::
+
+        stats = Telemetry()
+        stats.add("send", 0.0004)
+        stats.summary() # {"send": {"count": 1, "mean": 0.0004, ...}}
+        stats.export("stats.json")
+
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.buffers = {}
+
+    def __repr__(self):
+        return "<Telemetry: {}>".format(", ".join(sorted(self.buffers)))
+
+    def __getitem__(self, name):
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = self.buffers.setdefault(name, RingBuffer(self.size))
+        return buffer
+
+    def __contains__(self, name):
+        return name in self.buffers
+
+    def add(self, name, value):
+        self[name].append(value)
+
+    def clear(self):
+        self.buffers = {}
+
+    def summary(self):
+        """ Returns a dictionary of name -> `RingBuffer.summary()` """
+        return dict((name, buffer.summary()) for name, buffer in list(self.buffers.items()))
+
+    def values(self):
+        """ Returns a dictionary of name -> list of the values being kept """
+        return dict((name, list(buffer)) for name, buffer in list(self.buffers.items()))
+
+    def dump(self):
+        """ Returns the summary and values in a dictionary that can be saved as JSON """
+        return {"summary": self.summary(), "values": self.values()}
+
+    def export(self, filename):
+        """ Writes the summary and values to `filename` as JSON """
+        writeStats(filename, self.dump())
+
+
+def writeStats(filename, data):
+    """ Writes a dictionary of statistics to `filename` as JSON """
+    with open(filename, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
 class Timing(object):
     """
     Utility for profiling events
@@ -709,6 +709,44 @@ class OSCBundle(OSCMessage):
         copy.timetag = self.timetag
         return copy
 
+class OSCEncodedBundle(OSCBundle):
+    """An OSCBundle whose binary representation has already been encoded,
+    e.g. by a BundleTemplate.
+    """
+    def __init__(self, binary, time=0):
+        super(OSCEncodedBundle, self).__init__(time=time)
+        self.binary = binary
+
+    def getBinary(self):
+        """Returns the binary representation of the bundle
+        """
+        return self.binary
+
+def packBundles(bundles, max_size=1472):
+    """Packs a list of OSCBundles (and/or OSCMessages) into as few datagrams as possible.
+    Bundles with the same timetag are merged into a single bundle, whose size is kept
+    under 'max_size' bytes where possible. Bundles are not nested, so any receiver that
+    understands a flat OSC-bundle understands the output. Returns a list of bytes.
+    """
+    datagrams = []
+    groups = {}
+    for bundle in bundles:
+        binary = bundle.getBinary()
+        if not isinstance(bundle, OSCBundle):
+            datagrams.append(binary)
+            continue
+        group = groups.get(bundle.timetag)
+        if group is None or group[-1][0] + len(binary) - 16 > max_size:
+            group = groups.setdefault(bundle.timetag, [])
+            group.append([len(binary), [binary]])
+        else:
+            group[-1][0] += len(binary) - 16
+            group[-1][1].append(binary[16:])
+    for group in groups.values():
+        for size, parts in group:
+            datagrams.append(b"".join(parts))
+    return datagrams
+
 ######
 #
 # OSCMessage encoding functions
@@ -86,6 +86,9 @@ class metaPattern(object):
     debugging = False
     meta = []
 
+    # Incremented when any pattern is changed in place, which invalidates cached lengths
+    epoch = 0
+
     def __init__(self, *args):
 
         if len(args):
@@ -157,6 +160,12 @@ class metaPattern(object):
             8
             ```
         """
+        try:
+            epoch, data, size, length = self.length_cache
+            if epoch == metaPattern.epoch and data is self.data and size == len(data):
+                return length
+        except (AttributeError, ValueError):
+            pass
         lengths = [1]
         n = 0
         for item in self.data:
@@ -165,7 +174,15 @@ class metaPattern(object):
             elif isinstance(item, Pattern):
                 lengths.append(len(item))
             n += 1
-        return LCM(*lengths) * n
+        length = LCM(*lengths) * n
+        self.length_cache = (metaPattern.epoch, self.data, len(self.data), length)
+        return length
+
+    @staticmethod
+    def modified():
+        """ Called when a pattern's data is changed in place so that the lengths of this
+            pattern, and any that contain it, are recalculated """
+        metaPattern.epoch += 1
 
     
     def __str__(self):
@@ -253,6 +270,7 @@ class metaPattern(object):
         return val
     
     def __setitem__(self, key, value):
+        self.modified()
         if isinstance(key, slice):
             self.data[key] = Format(value) # TODO - make sure this works
         else:
@@ -269,6 +287,7 @@ class metaPattern(object):
 
     def setitem(self, key, value):
         self.data[key] = Format(value)
+        self.modified()
             
     def __iter__(self):
         """ Returns a generator object for this Pattern """
@@ -295,6 +314,7 @@ class metaPattern(object):
     def __setslice__(self, i, j, item):
         """ Only works in Python 2 - maybe get rid? """
         self.data[i:j] = Format(item)
+        self.modified()
 
     # Integer returning
     
@@ -847,11 +867,13 @@ class metaPattern(object):
     def extend(self, seq):
         """ Should return None """
         self.data.extend(map(convert_nested_data, seq))
+        self.modified()
         return
 
     def append(self, item):
         """ Converts a new item to PGroup etc and appends """
         self.data.append(convert_nested_data(item))
+        self.modified()
         return
     
     def i_rotate(self, n=1):
@@ -872,6 +894,7 @@ class metaPattern(object):
 
     def set(self, index, value):
         self.data[index] = asStream(value)
+        self.modified()
         return self
 
     # Boolean tests
@@ -1299,6 +1322,9 @@ class GeneratorPattern:
     MAX_SIZE = 65536
     debugging = False
 
+    # Number of values each generator remembers, None to remember them all
+    cache_size = 4096
+
     def __init__(self, **kwargs):
 
         # Set the seed if a random pattern
@@ -1313,7 +1339,7 @@ class GeneratorPattern:
         self.last_value = None
         self.data  = []
         self.index   = 0
-        self.cache = {}
+        self.cache = LRUCache(self.cache_size)
 
     def __repr__(self):
         """ String version is the name of the class and its arguments """
@@ -1325,7 +1351,8 @@ class GeneratorPattern:
         
     def getitem(self, index=None, *args):
         """ Calls self.func(index) to get an item if index is not in
-            self.history, otherwise returns self.history[index] """
+            self.cache, otherwise returns self.cache[index]. Only the
+            most recently used `cache_size` values are kept """
         if index is None:
             index, self.index = self.index, self.index + 1
         # If we have already accessed by this index, return the value
@@ -14,7 +14,7 @@ from .Generators import PRand
 from .PGroups    import PGroupMod, PGroupOr, PGroupStar, PGroupPlus
 from .Main       import Pattern, metaPattern, PatternMethod, PGroup, GeneratorPattern
 
-from ..Utils import modi, LCM
+from ..Utils import modi, LCM, LRUCache
 
 re_nests  = r"\((.*?)\)"
 re_square = r"\[.*?\]"
@@ -75,187 +75,314 @@ def arrow_zip(pat1, pat2):
 def feed(string):
     """ Used to recursively parse nested strings, returns a list object (not Pattern),
         and a boolean denoting if the list contains a nested list """
-    
-    string = PlayString(string)
-    items  = [] # The actual pattern
+    nodes, contains_nest = parse_tree(string)
+    items = build_cache.get(string)
+    if items is None:
+        items, shared = build(nodes)
+        if not shared:
+            return items, contains_nest
+        build_cache[string] = items
+    return fresh_copy(items), contains_nest
+
+def fresh_copy(item, memo=None):
+    """ Returns a copy of a cached item that shares no lists or patterns with it, so
+        that changing the copy in place does not change the cache. Items that appear
+        more than once in `item` are copied once, as `copy.deepcopy` does """
+    if not isinstance(item, (metaPattern, list, tuple)):
+        return item
+    memo = {} if memo is None else memo
+    new = memo.get(id(item))
+    if new is not None:
+        return new
+    if isinstance(item, metaPattern):
+        new = item.true_copy([fresh_copy(value, memo) for value in item.data])
+        if "meta" in item.__dict__:
+            new.meta = [fresh_copy(value, memo) for value in item.meta]
+    else:
+        new = item.__class__(fresh_copy(value, memo) for value in item)
+    memo[id(item)] = new
+    return new
+
+# Parsed strings are stored as trees of tuples and single characters that are
+# shared between calls. The items built from a tree are cached unless they
+# contain '{}' brackets, whose generators (PRand) are created on every call, and
+# only copies of the cached items are returned.
+
+parse_cache = LRUCache(512)
+build_cache = LRUCache(512) # string -> items when they are all cached
+node_cache  = LRUCache(2048) # bracket node or run of '<>' nodes -> item without any generators
+
+open_brackets  = {"(": ")", "[": "]", "{": "}", "<": ">", "|": "|"}
+close_brackets = {")": "(", "]": "[", "}": "{", ">": "<"}
+
+empty_errors = {"<": "Empty '<>' brackets in string",
+                "|": "Empty '||' delimeters in string",
+                "(": "Empty '()' brackets in string",
+                "{": "Empty '{}' brackets in string",
+                "[": "Empty '[]' brackets in string"}
+
+def match_brackets(string):
+    """ Returns a dict of the index of each opening bracket to the index of its closing
+        bracket, found in a single pass over `string`. A '|' is paired with the next '|' """
+    closing = {}
+    opened  = {char: [] for char in "([{<"}
+    last_bar = None
+    for i, char in enumerate(string):
+        if char in opened:
+            opened[char].append(i)
+        elif char in close_brackets:
+            stack = opened[close_brackets[char]]
+            if stack:
+                closing[stack.pop()] = i
+        elif char == "|":
+            if last_bar is not None:
+                closing[last_bar] = i
+            last_bar = i
+    return closing
+
+def parse_tree(string):
+    """ Returns a tuple of parse tree nodes for `string` and a boolean denoting if it
+        contains a nested list. Results are cached by string """
+    try:
+        return parse_cache[string]
+    except KeyError:
+        pass
+    tree = parse_nodes(string, match_brackets(string), 0, len(string))
+    parse_cache[string] = tree
+    return tree
+
+def parse_nodes(string, closing, start, end):
+    """ Parses string[start:end] into a tuple of nodes. A node is either a single
+        character or a tuple of the opening bracket and the nodes it contains """
+    items = []
 
     layer_pattern = False
     contains_nest = False
-    
-    i = 0
-    
-    while i < len(string):
+
+    i = start
+
+    while i < end:
 
         char = string[i]
 
-        # look for a '<>'
-        if char == "<":
+        if char in open_brackets:
 
-            # Parse the contents of the brackets if found
-            j = string.index(">", start=i+1)
-            s = string[i+1:j]
-            i = j
+            j = closing.get(i)
 
-            chars, _ = feed(s)
+            if j is None or j >= end:
 
-            if len(chars) == 0:
+                if char == "|":
 
-                e = "Empty '<>' brackets in string"
+                    e = "No {!r} character found in string {!r}".format(char, string[start:end])
+
+                else:
+
+                    e = "Closing bracket {!r} missing in string {!r}".format(open_brackets[char], string[start:end])
 
                 raise ParseError(e)
 
-            # If we know we are layering, zip the last item
+            chars, nested = parse_nodes(string, closing, i + 1, j)
 
-            if layer_pattern:
+            if len(chars) == 0:
 
-                items[-1] = items[-1].zip( Pattern(chars) )
+                raise ParseError(empty_errors[char])
 
-            else:
+            # '<>' layers are zipped with the last item if it was also a '<>'
+
+            if char == "<":
 
-                items.append(Pattern(chars))
+                items.append((char, chars, layer_pattern))
 
                 layer_pattern = True
 
-            contains_nest = True
+                contains_nest = True
 
-        # Look for || for specifying sample numbers
+            elif char == "|":
 
-        elif char == "|":
+                items.append((char, chars))
+
+            elif char == "[":
+
+                contains_nest = nested
+
+                items.append((char, chars, nested))
+
+                layer_pattern = False
+
+            else:
+
+                items.append((char, chars))
+
+                layer_pattern = False
+
+                if char == "(":
+
+                    contains_nest = True
 
-            # Parse the contents of the brackets if found
-            j = string.next_char_index("|", start=i+1)
-            s = string[i+1:j]
             i = j
 
-            chars, _ = feed(s)
+        # Add single character to list
 
-            if len(chars) == 0:
+        elif char not in close_brackets:
 
-                e = "Empty '||' delimeters in string"
+            items.append(char)
 
-                raise ParseError(e)
+            layer_pattern = False
 
-            try:
+        i += 1
 
-                assert(len(chars) == 2)
+    return tuple(items), contains_nest
 
-            except AssertionError:
+def build(nodes):
+    """ Creates the list of items (not Pattern) described by a tuple of parse tree nodes.
+        Returns the list and a boolean denoting if it can be shared (has no generators) """
 
-                e = "'||' delimeters must contain exactly 2 elements"
+    items = []
 
-                raise ParseError(e)
+    shared = True
 
-            # First is our list of sample chars
-            
-            samp_chr = chars[0]
+    layers = () # the run of '<>' nodes that made the last item
 
-            # Next is a list of integers for sample kw
+    for node in nodes:
 
-            samp_num = convert_to_int(chars[1])
+        if not isinstance(node, tuple):
 
-            # print(samp_chr, samp_num)
+            items.append(node)
 
-            items.append(bar_type((samp_chr, samp_num)))
+            layers = ()
 
-        # Look for a '()'
-        elif char == "(":
+            continue
 
-            # Parse the contents of the brackets if found
-            j = string.index(")", start=i+1)
-            
-            s = string[i+1:j]
-            i = j
+        if node[0] == "<" and (layers or not node[2]):
 
-            chars, _ = feed(s)
+            # If we know we are layering, replace the last item with the zipped layers
 
-            if len(chars) == 0:
+            layers = layers + (node,) if node[2] else (node,)
 
-                e = "Empty '()' brackets in string"
+            item, item_shared = build_layers(layers)
 
-                raise ParseError(e)
+            if node[2]:
 
-            items.append( chars ) # add the nested list
+                items[-1] = item
 
-            layer_pattern = False
+            else:
 
-            contains_nest = True
+                items.append(item)
 
-        # Look for a '{}'
-        elif char == "{":
+        else:
 
-            # Parse the contents of the brackets if found
-            j = string.index("}", start=i+1)
-            s = string[i+1:j]
-            i = j
+            item, item_shared = build_node(node)
 
-            chars, _ = feed(s)
+            layers = ()
 
-            if len(chars) == 0:
+            # A '<>' after a '||' is zipped with it
 
-                e = "Empty '{}' brackets in string"
+            if node[0] == "<":
 
-                raise ParseError(e)
+                items[-1] = items[-1].zip(item)
 
-            items.append( braces_type(chars) )
+            else:
 
-            layer_pattern = False
-                
-        # Look for a '[]'
-        elif char == "[":
-            
-            j = string.index("]", start=i+1)
-            s = string[i+1:j]
-            i = j
+                items.append(item)
 
-            chars, contains_nest = feed(s)
+        shared = shared and item_shared
 
-            if len(chars) == 0:
+    return items, shared
 
-                e = "Empty '[]' brackets in string"
+def build_layers(layers):
+    """ Returns the item for a run of '<>' nodes zipped together and a boolean denoting
+        if it is shared. Items without generators are cached by the run of nodes """
 
-                raise ParseError(e)
+    if len(layers) == 1:
 
-            # Un-nest
-            if contains_nest:
+        return build_node(layers[0])
 
-                # May contain sub-nests, so re-parse with calculated duration
+    item = node_cache.get(layers)
 
-                new_chars = []
+    if item is not None:
 
-                largest_item = max([len(ch) for ch in chars])
+        return fresh_copy(item), True
 
-                for num in range(largest_item):
+    first, first_shared = build_layers(layers[:-1])
 
-                    new_chars.append(square_type([modi(ch, num) for ch in chars]))
+    last, last_shared = build_node(layers[-1])
 
-                items.append( new_chars )
+    item, shared = first.zip(last), first_shared and last_shared
 
-                layer_pattern = False
+    if shared:
 
-            else:
+        node_cache[layers] = item
 
-                new_chars = []
+        item = fresh_copy(item)
 
-                for char in chars:
+    return item, shared
 
-                    new_chars.append(char)
+def build_node(node):
+    """ Returns the item for a bracket node and a boolean denoting if it is shared.
+        Items without generators are cached by node """
 
-                items.append( square_type(new_chars) )
+    item = node_cache.get(node)
 
-                layer_pattern = False
+    if item is not None:
 
-        # Add single character to list
+        return fresh_copy(item), True
 
-        elif char not in ")]}>|":
+    char, (chars, shared) = node[0], build(node[1])
 
-            items.append( char )
+    if char == "<":
 
-            layer_pattern = False
+        item = Pattern(chars)
 
-        # Increase iterator
-        i += 1
+    # || for specifying sample numbers
+
+    elif char == "|":
+
+        if len(chars) != 2:
+
+            e = "'||' delimeters must contain exactly 2 elements"
+
+            raise ParseError(e)
+
+        # First is our list of sample chars, next is a list of integers for sample kw
+
+        item = bar_type((chars[0], convert_to_int(chars[1])))
+
+    elif char == "(":
+
+        item = chars # the nested list
+
+    elif char == "{":
+
+        item = braces_type(chars)
+
+        shared = False
+
+    elif char == "[":
+
+        # Un-nest
+        if node[2]:
+
+            # May contain sub-nests, so re-parse with calculated duration
+
+            item = []
+
+            largest_item = max([len(ch) for ch in chars])
+
+            for num in range(largest_item):
+
+                item.append(square_type([modi(ch, num) for ch in chars]))
+
+        else:
+
+            item = square_type(chars)
+
+    if shared:
+
+        node_cache[node] = item
+
+        item = fresh_copy(item)
 
-    return items, contains_nest
+    return item, shared
 
 
 @PatternMethod
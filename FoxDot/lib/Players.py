@@ -135,8 +135,8 @@ from .Settings import SamplePlayer, LoopPlayer, HybridPlayer
 from .Code import WarningMsg, debug_stdout
 from .SCLang.SynthDef import SynthDefProxy, SynthDef, SynthDefs
 from .Effects import FxList
-from .Utils import stdout
-from .Buffers import Samples
+from .Utils import stdout, DurationIndex
+from .Buffers import Samples, ToneSnapshot, get_hybriddb
 
 from .Key import *
 from .Repeat import *
@@ -148,13 +148,44 @@ from .Scale import Scale, ScaleType, ScalePattern
 from .Scale import midi, miditofreq, get_freq_and_midi
 
 from .Bang import Bang
+from .Logging import Telemetry
+from .TimeSource import perf_counter
 
 from .TimeVar import TimeVar, Pvar
 
-from .Extensions import hybriddb
-HybridDefs = hybriddb.get_list()
+class HybridDefList(object):
+    """ Lists the tones in the hybrid sample database, which is only loaded when
+        the list is first used """
+    def __str__(self):
+        return get_hybriddb().get_list()
+    def __repr__(self):
+        return str(self)
+    def __iter__(self):
+        return iter(str(self).splitlines())
+
+HybridDefs = HybridDefList()
 # To print a list of your hybrid synths use print(HybridDefs)
 
+class PlayerAttributes(dict):
+    """ Dictionary of a Player's attribute patterns. Keeps a count of the changes made to
+        it so that the Player knows when to re-compile its events. """
+    version = 0
+    def __setitem__(self, key, value):
+        self.version += 1
+        dict.__setitem__(self, key, value)
+    def __delitem__(self, key):
+        self.version += 1
+        dict.__delitem__(self, key)
+
+def is_static_value(value):
+    """ Returns True if getting a value from `value` has no side effects and does not
+        depend on time, i.e. it contains no TimeVar, PlayerKey, or GeneratorPattern """
+    if value is None or isinstance(value, (int, float, str)):
+        return True
+    if isinstance(value, metaPattern) and not (isinstance(value, PGroup) and value.has_behaviour()):
+        return all(is_static_value(item) for item in value.data)
+    return False
+
 class EmptyPlayer(object):
     """ Place holder for Player objects created at run-time to reduce load time.
     """
@@ -257,6 +288,9 @@ class Player(Repeatable):
 
     after_update_methods = ["stutter"]
 
+    # Only re-evaluate attributes that can change between events (see `compile_event`)
+    use_compiled_events = True
+
     # Tkinter Window
     widget = None
 
@@ -311,18 +345,39 @@ class Player(Repeatable):
         self.event = {}
         self.accessed_keys = []
 
+        # Compiled event information, see `compile_event`
+
+        self.event_template = {}
+        self.event_attrs = []
+        self.event_prime_keys = []
+        self.event_version = None
+
+        # Buffers loaded when the player was last updated
+
+        self.prefetched = []
+
+        # Recent timings of `get_event`, `send` and `get_bundle`, see `stats`
+
+        self.telemetry = Telemetry()
+
         # Used for checking clock updates
 
         self.current_dur = None
         self.old_pattern_dur = None
         self.old_dur = None
+
+        # Durations used by `count`, see `get_dur_index`
+
+        self.dur_index = None
+        self.dur_index_source = None
+        self.dur_index_epoch = None
         
         self.isplaying = False
         self.isAlive = True
 
         # These dicts contain the attribute and modifier values that are sent to SuperCollider     
 
-        self.attr  = {}
+        self.attr  = PlayerAttributes()
         self.modifier = Pattern()
         self.mod_data = 0
         self.filename = None
@@ -665,12 +720,18 @@ class Player(Repeatable):
 
         # Get the current state 
 
+        start = perf_counter()
+
         self.get_event() 
 
+        self.telemetry.add("get_event", perf_counter() - start)
+
         # Play the note
         
         if not isinstance(self.event["dur"], rest):
 
+            start = perf_counter()
+
             try:
         
                 self.send(verbose=(self.metro.solo == self and kwargs.get('verbose', True)))
@@ -678,6 +739,8 @@ class Player(Repeatable):
             except Exception as err:
 
                 print("Error in Player {}: {}".format(self.id, err))
+
+            self.telemetry.add("send", perf_counter() - start)
         
         # If using custom bpm
 
@@ -722,9 +785,7 @@ class Player(Repeatable):
 
             self.current_dur = self.rhythm()
 
-        durations = list(map(get_first_item, self.current_dur)) # careful here
-        
-        total_dur = float(sum(durations))
+        durations, total_dur, index = self.get_dur_index()
 
         if total_dur == 0:
 
@@ -733,12 +794,15 @@ class Player(Repeatable):
             durations = [1]
             total_dur =  1 
             self.dur  =  1
+            index = None
     
         acc = now - (now % total_dur)
 
         try:
 
-            n = int(len(durations) * (acc / total_dur))
+            # `acc` is a whole number of cycles, so round away any floating point error
+
+            n = len(durations) * int(round(acc / total_dur))
 
         except TypeError as e:
 
@@ -748,15 +812,29 @@ class Player(Repeatable):
 
             return 0, 0
 
+        # Snap to the start of the cycle if `now` only misses it by floating point error
+
+        if DurationIndex.same_time(acc, now):
+
+            acc = now
+
         if acc != now:
 
+            # Skip to just before `now` using the cumulative durations and walk the rest
+
+            if index is not None and n % len(durations) == 0:
+
+                i, acc = index.skip(acc, now)
+
+                n += i
+
             while True:
 
                 dur = float(modi(durations, n))
 
-                if acc + dur == now:
+                if DurationIndex.same_time(acc + dur, now):
 
-                    acc += dur
+                    acc = now
 
                     n += 1
 
@@ -786,8 +864,21 @@ class Player(Repeatable):
         if self.current_dur != self.old_dur:
             self.old_dur = self.current_dur
             return True
+        # Keep the same list so that `get_dur_index` does not need to be worked out again
+        self.current_dur = self.old_dur
         return False
 
+    def get_dur_index(self):
+        """ Returns a tuple of the durations in `current_dur`, their total, and a DurationIndex
+            for them (or None). Only worked out again when `current_dur` is replaced or a
+            pattern is changed in place """
+        if self.dur_index_source is not self.current_dur or self.dur_index_epoch != metaPattern.epoch:
+            durations = list(map(get_first_item, self.current_dur)) # careful here
+            self.dur_index = (durations, float(sum(durations)), DurationIndex.from_numbers(durations))
+            self.dur_index_source = self.current_dur
+            self.dur_index_epoch = metaPattern.epoch
+        return self.dur_index
+
     def rhythm(self):
         """ Returns the players array of durations at this point in time """
         return list(map(lambda x: x if isinstance(x, (int, float)) else self.unpack(x), self.attr["dur"]))
@@ -800,6 +891,10 @@ class Player(Repeatable):
         
         self.synthdef = synthdef
 
+        # Buffers used by the previous attributes can be freed if they are not used again
+
+        self.samples.release(self)
+
         # Make sure all values are reset to start
 
         if "filename" in kwargs:
@@ -873,6 +968,16 @@ class Player(Repeatable):
 
                 setattr(self, name, value)
 
+        # Load the samples the player can reach before it starts playing
+
+        if synthdef == SamplePlayer:
+
+            self.prefetch_samples()
+
+        elif synthdef in (LoopPlayer, HybridPlayer):
+
+            self.pin_buffers()
+
         # Calculate new position if not already playing
 
         if self.isplaying is False:
@@ -1460,8 +1565,9 @@ class Player(Repeatable):
 
         return attr_value
 
-    def get_prime_funcs(self, event):
-        """ Finds and PGroupPrimes in event and returns the modulated event dictionary """
+    def get_prime_funcs(self, event, keys=None):
+        """ Finds and PGroupPrimes in event and returns the modulated event dictionary.
+            If `keys` is given, only those keys are checked after "degree" and "sample" """
 
         prime_keys = ("degree", "sample")
 
@@ -1473,7 +1579,7 @@ class Player(Repeatable):
 
         # Then do the rest (skipping prime)
 
-        for key in event:
+        for key in (event if keys is None else keys):
 
             if key not in prime_keys:
 
@@ -1542,14 +1648,164 @@ class Player(Repeatable):
 
         return event
 
+    def compile_event(self):
+        """ Sorts the attributes into constants, whose values are stored in `event_template`,
+            and patterns that need to be indexed each event. Patterns that contain no
+            TimeVar, PlayerKey, or GeneratorPattern are indexed directly and any others
+            are evaluated using `now`. Called by `get_event` when the attributes, or any
+            pattern's data, change. """
+
+        self.event_template = {}
+        self.event_attrs = []
+
+        constants = set()
+
+        for attr, pattern in self.attr.items():
+
+            length = len(pattern)
+
+            if length == 0:
+
+                self.event_template[attr] = 0
+
+                constants.add(attr)
+
+            elif length == 1 and isinstance(pattern[0], (int, float, str, type(None))):
+
+                self.event_template[attr] = pattern[0]
+
+                constants.add(attr)
+
+            else:
+
+                # Keep the key order of the event the same
+
+                self.event_template[attr] = None
+
+                self.event_attrs.append((attr, pattern if is_static_value(pattern) else None))
+
+        # Constants never have behaviour, but these keys can be changed by others that do
+
+        self.event_prime_keys = [attr for attr in self.attr if attr not in constants or attr in ("dur", "sus", "delay", "blur", "sample")]
+
+        self.event_version = (self.attr.version, metaPattern.epoch)
+
+        return
+
+    @staticmethod
+    def get_static_values(value):
+        """ Returns a list of all the values a pattern can contain that are known without
+            playing it, i.e. the values in nested patterns and TimeVars """
+        if isinstance(value, TimeVar):
+            return Player.get_static_values(value.values)
+        if isinstance(value, metaPattern):
+            values = []
+            for item in value.data:
+                values.extend(Player.get_static_values(item))
+            return values
+        if isinstance(value, (list, tuple)):
+            return Player.get_static_values(Pattern(value))
+        if isinstance(value, GeneratorPattern):
+            return []
+        return [value]
+
+    @staticmethod
+    def get_static_indices(value):
+        """ Returns the sorted sample numbers a pattern can contain without playing it """
+        return sorted(set(int(item) for item in Player.get_static_values(value)
+                          if isinstance(item, (int, float)) and int(item) == item))
+
+    @staticmethod
+    def get_static_samples(value, indices):
+        """ Returns a list of the (symbol, index) tuples a play string pattern can play
+            without playing it. Characters use the sample numbers in `indices` unless
+            they are given their own between "bar" signs e.g. "|x2|" """
+        if isinstance(value, PGroupOr):
+            indices = Player.get_static_indices(value.meta[0]) or indices
+            return Player.get_static_samples(value.data, indices)
+        if isinstance(value, TimeVar):
+            return Player.get_static_samples(value.values, indices)
+        if isinstance(value, metaPattern):
+            samples = []
+            for item in value.data:
+                samples.extend(Player.get_static_samples(item, indices))
+            return samples
+        if isinstance(value, (list, tuple)):
+            return Player.get_static_samples(Pattern(value), indices)
+        if isinstance(value, str):
+            return [(value, index) for index in indices]
+        return []
+
+    def prefetch_samples(self):
+        """ Loads every sample that the playstring and `sample` attribute can reach in
+            one go and stops them being freed while the player uses them """
+        indices = self.get_static_indices(self.attr.get("sample", 0)) or [0]
+        samples = sorted(set(self.get_static_samples(self.attr["degree"], indices)))
+        self.prefetched = self.samples.prefetch(samples, user=self)
+        return self
+
+    def pin_buffers(self):
+        """ Stops the loop buffers, or the buffers of every note in a hybrid tone, from
+            being freed while the player uses them, as `prefetch_samples` does for samples """
+        if self.synthdef == HybridPlayer:
+            buffers = [bufnum for tone in self.get_static_values(self.attr.get("tone"))
+                       if isinstance(tone, ToneSnapshot) for bufnum in tone.bufnums()]
+        else:
+            buffers = self.get_static_values(self.attr.get("buf", 0))
+        for buf in buffers:
+            if isinstance(buf, (int, float)):
+                self.samples.useBuffer(buf, user=self)
+        return self
+
+    def ready(self):
+        """ Returns True when all the samples loaded by `prefetch_samples` can be played """
+        return all(self.samples.isLoaded(buf) for buf in self.prefetched)
+
     def get_event(self):
         """ Returns a dictionary of attr -> now values """
 
-        self.event = dict(map(lambda attr: (attr, self.now(attr)), self.attr.keys()))
+        if self.use_compiled_events:
+
+            # Patterns changed in place, e.g. `p1.amp[0] = 2`, do not change the attributes'
+            # version, so the pattern epoch is checked too
+
+            if self.event_version != (self.attr.version, metaPattern.epoch):
+
+                self.compile_event()
+
+            # Copy the constants and only index the other attributes
 
-        self.event = self.unduplicate_durs(self.event)
+            event = self.event_template.copy()
 
-        self.event = self.get_prime_funcs(self.event)
+            index = self.event_n
+
+            for attr, pattern in self.event_attrs:
+
+                if pattern is None:
+
+                    event[attr] = self.now(attr)
+
+                else:
+
+                    value = pattern[index]
+
+                    if value is not None and not isinstance(value, (int, float)):
+
+                        value = self.unpack(value)
+
+                    event[attr] = value
+
+            self.event = self.unduplicate_durs(event)
+
+            self.event = self.get_prime_funcs(self.event, self.event_prime_keys)
+
+        else:
+
+            self.event = dict(map(lambda attr: (attr, self.now(attr)), self.attr.keys()))
+
+            self.event = self.unduplicate_durs(self.event)
+
+            self.event = self.get_prime_funcs(self.event)
 
         # Update internal player keys / schedule future updates
 
@@ -1558,6 +1814,12 @@ class Player(Repeatable):
         return self
 
 
+    def stats(self):
+        """ Returns summaries (count, mean, max and percentiles) of the time in seconds
+            taken by recent calls to `get_event`, `send` and the server's `get_bundle`,
+            which includes encoding the OSC bundle when bundle templates are used """
+        return self.telemetry.summary()
+
     def send(self, timestamp=None, verbose=True, **kwargs):
         """ Goes through the  current event and compiles osc messages and sends to server via the tempo clock """
 
@@ -1649,8 +1911,12 @@ class Player(Repeatable):
 
             synthdef = self.get_synth_name(message.get("buf", 0)) # to send to play1 or play2
 
+            start = perf_counter()
+
             compiled_msg = self.metro.server.get_bundle(synthdef, message, timestamp = timestamp + delay)
 
+            self.telemetry.add("get_bundle", perf_counter() - start)
+
             # We can set a condition to only send messages
 
             self.queue_block.append_osc_message(compiled_msg)
@@ -1684,7 +1950,7 @@ class Player(Repeatable):
 
                 pos = 0 
  
-            buf  = self.samples.getBufferFromSymbol(str(degree), sample).bufnum
+            buf  = self.samples.getBufferFromSymbol(str(degree), sample, user=self).bufnum
             
             message.update( {'buf': buf,'pos': pos} )
 
@@ -1699,6 +1965,10 @@ class Player(Repeatable):
             pos = kwargs.get("degree", event["degree"])
             buf = kwargs.get("buf", event["buf"])
 
+            # Stop the loop being freed while it is playing
+
+            self.samples.useBuffer(buf, user=self)
+
             # Get a user-specified tempo
 
             given_tempo = kwargs.get("tempo", self.event.get("tempo", self.metro.bpm))
@@ -1755,25 +2025,15 @@ class Player(Repeatable):
             rate= 0
             # Get a user-specified tempo
             if (tone != None):
-                #get the sample number (in the db and matched in the folder)
-                #and the playback rate that will map it to the desired note
-                note = str(int(midinote))
-                if note in tone.notes_map:
-                    sample, rate = tone.notes_map[note]
-                    #get the right buffer number for that sample number
-                    if sample in tone.buffers:
-                        # TODO : Check the note won't loop because rate too high
-                        self.metro.beat_dur(sus)
-                        buf = tone.buffers[sample]
-                        if(rate<1):
-                            amp = amp / (rate**1.7)
-                        else:
-                            amp = amp * (rate)
-                    else:
-                        print("Buffers for player {} missing {}".format(self.id, sample))
-                        print(tone.buffers)
+                # The tone is a ToneSnapshot holding the buffer number, the playback
+                # rate that will map it to the desired note, and amp compensation
+                note = tone.get(int(midinote))
+                if note is not None:
+                    buf, rate, amp_scale = note
+                    amp = amp * amp_scale
+                    self.samples.useBuffer(buf, user=self)
                 else:
-                    print("Player {} missing {}".format(self.id, note))
+                    print("Player {} missing {}".format(self.id, int(midinote)))
             message.update( {'pos': pos, 'buf': buf, 'rate': rate, 'amp':amp} )
 
         else:
@@ -1849,6 +2109,8 @@ class Player(Repeatable):
         
         self.reset()
 
+        self.samples.release(self)
+
         if self in self.metro.playing:
         
             self.metro.playing.remove(self)
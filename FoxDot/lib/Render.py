@@ -0,0 +1,110 @@
+"""
+    Render.py
+    =========
+
+    Non-realtime rendering. `TempoClock.render` plays everything scheduled in the
+    clock as fast as possible, using virtual time instead of the machine clock, and
+    adds the OSC bundles to a `Score` instead of sending them to SuperCollider. The
+    score can then be rendered to audio by SuperCollider in non-realtime mode:
+
+        Clock.render(64, "score.osc", seed=1)
+
+        scsynth -N score.osc _ out.wav 44100 WAV int16
+
+    Scores saved with a ".scd" extension are written as SuperCollider code for a
+    `Score` object instead of binary OSC.
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import struct
+
+from .OSC3 import OSCMessage, decodeOSC, NTP_units_per_second
+
+class Score(object):
+    """ Collects OSC bundles and messages, with their times in seconds from the start
+        of the score, and writes them to a file for non-realtime rendering. `origin`
+        is the timetag for the start of the score and messages added without a
+        timetag, such as buffer loads, are given the timetag `now` """
+
+    def __init__(self, origin=0):
+        self.origin  = origin
+        self.now     = origin
+        self.entries = []
+
+    def __repr__(self):
+        return "<Score: {} bundles>".format(len(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add_binary(self, time, contents):
+        """ Adds the binary contents of a bundle, i.e. size-prefixed messages, at `time`
+            seconds from the start of the score """
+        self.entries.append((max(time, 0), len(self.entries), contents))
+        return
+
+    def add_bundle(self, bundle):
+        """ Adds an OSCBundle (or OSCMessage) at its timetag """
+        binary = bundle.getBinary()
+        if binary.startswith(b"#bundle"):
+            return self.add_binary(bundle.timetag - self.origin, binary[16:])
+        return self.add_binary(self.now - self.origin, struct.pack(">i", len(binary)) + binary)
+
+    def add_message(self, address, args=()):
+        """ Adds a message at the current time """
+        message = OSCMessage(address)
+        message.append(list(args))
+        return self.add_bundle(message)
+
+    def end(self):
+        """ Adds a message at the current time to mark the end of the score. SuperCollider
+            stops rendering after the last message """
+        return self.add_message("/c_set", [0, 0])
+
+    def bundles(self):
+        """ Returns a list of (time, binary bundle) tuples in time order """
+        output = []
+        for time, _, contents in sorted(self.entries, key=lambda entry: entry[:2]):
+            secs, fract = divmod(time, 1)
+            timetag = struct.pack(">LL", int(secs), int(fract * NTP_units_per_second))
+            output.append((time, b"#bundle\x00" + timetag + contents))
+        return output
+
+    def messages(self):
+        """ Returns a list of (time, [[address, args...], ...]) tuples in time order """
+        output = []
+        for time, binary in self.bundles():
+            decoded = decodeOSC(binary)[2:]
+            output.append((time, [[message[0]] + message[2:] for message in decoded]))
+        return output
+
+    def write(self, filename):
+        """ Writes the score to `filename` as code if it ends with ".scd", otherwise
+            as a binary file of size-prefixed OSC bundles """
+        if filename.endswith(".scd"):
+            with open(filename, "w") as f:
+                f.write(self.to_code())
+        else:
+            with open(filename, "wb") as f:
+                for time, binary in self.bundles():
+                    f.write(struct.pack(">i", len(binary)))
+                    f.write(binary)
+        return
+
+    def to_code(self):
+        """ Returns the score as SuperCollider code for a `Score` """
+        lines = []
+        for time, messages in self.messages():
+            items = [repr(float(time))] + ["[{}]".format(", ".join(map(format_value, message))) for message in messages]
+            lines.append("\t[{}]".format(", ".join(items)))
+        return "Score([\n{}\n])\n".format(",\n".join(lines))
+
+def format_value(value):
+    """ Returns an OSC argument as SuperCollider code """
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    if isinstance(value, str):
+        return '"{}"'.format(value.replace("\\", "\\\\").replace('"', '\\"'))
+    return repr(value)
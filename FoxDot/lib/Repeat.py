@@ -1,8 +1,8 @@
 from __future__ import absolute_import, division, print_function
 
 from .Code import WarningMsg
-from .Patterns import Pattern, Cycle, asStream
-from .Utils import modi
+from .Patterns import Pattern, Cycle, asStream, metaPattern
+from .Utils import modi, DurationIndex
 from .TimeVar import var, Pvar
 
 import inspect
@@ -401,6 +401,12 @@ class MethodCall:
         self.parent = parent  
         self.method = method
 
+        # Durations used by `count`, see `get_dur_index`
+
+        self.dur_index = None
+        self.dur_index_source = None
+        self.dur_index_epoch = None
+
         self.update(n, cycle, args, kwargs)
 
         self.after_update = False
@@ -443,7 +449,7 @@ class MethodCall:
         # Get durations
 
         durations = self.when # if self.cycle is None else asStream(self.cycle)
-        total_dur = float(sum(durations))
+        total_dur, index = self.get_dur_index()
 
         # How much time left to fit remainder in
 
@@ -458,10 +464,26 @@ class MethodCall:
         # n is the index to return for calculating self.when[n]
         # acc is when to start
 
-        n = int(len(durations) * (acc / total_dur))
+        # `acc` is a whole number of cycles, so round away any floating point error
+
+        n = len(durations) * int(round(acc / total_dur))
+
+        # Snap to the start of the cycle if `now` only misses it by floating point error
+
+        if DurationIndex.same_time(acc, now):
+
+            acc = now
 
         if acc != now:
 
+            # Skip to just before `now` using the cumulative durations and walk the rest
+
+            if index is not None and n % len(durations) == 0:
+
+                i, acc = index.skip(acc, now)
+
+                n += i
+
             while True:
 
                 dur = float(durations[n])
@@ -469,12 +491,24 @@ class MethodCall:
                 acc += dur
                 n   += 1
 
-                if acc >= now:
+                if acc >= now or DurationIndex.same_time(acc, now):
+
+                    acc = max(acc, now)
 
                     break
 
         return n, acc
 
+    def get_dur_index(self):
+        """ Returns a tuple of the total of `when` and a DurationIndex for one cycle of it
+            (or None). Only worked out again when `when` is replaced or changed in place """
+        if self.dur_index_source is not self.when or self.dur_index_epoch != metaPattern.epoch:
+            durations = list(self.when)
+            self.dur_index = (float(sum(durations)), DurationIndex.from_numbers(durations))
+            self.dur_index_source = self.when
+            self.dur_index_epoch = metaPattern.epoch
+        return self.dur_index
+
     def __repr__(self):
         return "<Future {}() call of '{}'>".format(self.method.__name__, self.parent)
 
@@ -9,7 +9,9 @@ else:
     import Queue as queue
 
 import json
+import math
 import socket
+import struct
 import sys
 import threading
 import time
@@ -47,6 +49,29 @@ class OSCClientWrapper(OSCClient):
                 print("Error sending message to SuperCollider server instance: make sure FoxDot quark is running and try again.")
                 OSCClientWrapper.error_printed = True
 
+    def sendDatagrams(self, datagrams):
+        """ Sends each of the already encoded datagrams with a single system call and
+            without waiting on `select`. A datagram that fails to send does not stop
+            the others being sent, and the error is printed instead of raised. Returns
+            the number of datagrams that could not be sent """
+        failed = 0
+        if self.socket is None:
+            failed = len(datagrams)
+        else:
+            send = self.socket.sendmsg if hasattr(self.socket, "sendmsg") else None
+            for data in datagrams:
+                try:
+                    if send is None:
+                        self.socket.send(data)
+                    else:
+                        send([data])
+                except socket.error:
+                    failed += 1
+        if failed and not OSCClientWrapper.error_printed:
+            print("Error sending message to SuperCollider server instance: make sure FoxDot quark is running and try again.")
+            OSCClientWrapper.error_printed = True
+        return failed
+
 
 class OSCConnect(OSCClientWrapper):
     """ An OSCClientWrapper that connects on initialisation """
@@ -128,6 +153,104 @@ class BidirectionalOSCServer(OSCServer):
                 return data
             now = time.time()
 
+class Slot(object):
+    """ Placeholder for a `BundleTemplate` argument that changes with each note """
+    def __init__(self, tag):
+        self.tag = tag
+
+
+class BundleTemplate(object):
+    """
+    Pre-encoded layout of an OSC bundle. The template is created from a list of
+    (address, arguments) pairs in which any argument that changes between bundles
+    is a `Slot`. Addresses, type tags, message sizes and constant arguments are
+    encoded once and only the time tag and slot values are packed for each bundle.
+    """
+    def __init__(self, messages):
+
+        chunks = [OSCString("#bundle"), "L", "L"]
+
+        for address, args in messages:
+
+            typetags = ","
+            body = []
+
+            for arg in args:
+
+                if isinstance(arg, Slot):
+
+                    typetags += arg.tag
+                    body.append(arg.tag)
+
+                else:
+
+                    tag, binary = OSCArgument(arg)
+                    typetags += tag
+                    body.append(binary)
+
+            header = OSCString(address) + OSCString(typetags)
+            size   = len(header) + sum(4 if isinstance(item, str) else len(item) for item in body)
+
+            chunks.append(struct.pack(">i", size) + header)
+            chunks.extend(body)
+
+        # Join consecutive constant chunks
+
+        fmt  = ">"
+        args = []
+
+        for chunk in chunks:
+
+            if isinstance(chunk, bytes):
+
+                if len(args) and isinstance(args[-1], bytes):
+
+                    args[-1] += chunk
+
+                    continue
+
+            args.append(chunk)
+
+        self.slots = []
+
+        for i, chunk in enumerate(args):
+
+            if isinstance(chunk, bytes):
+
+                fmt += "{}s".format(len(chunk))
+
+            else:
+
+                fmt += chunk
+
+                self.slots.append(i)
+
+                args[i] = None
+
+        self.args   = args
+        self.struct = struct.Struct(fmt)
+
+    def pack(self, timestamp, values):
+        """ Returns the binary bundle with the timestamp and slot values packed in """
+
+        if timestamp > 0:
+
+            fract, secs = math.modf(timestamp)
+
+            values = [int(secs - NTP_epoch), int(fract * NTP_units_per_second)] + values
+
+        else:
+
+            values = [0, 1] + values
+
+        args = self.args[:]
+
+        for i, value in zip(self.slots, values):
+
+            args[i] = value
+
+        return self.struct.pack(*args)
+
 #  Create an abstract base class that could be sub-classed for users who want to send their OSC messages elsewhere
 
 class ServerManager(object):
@@ -144,6 +267,10 @@ class ServerManager(object):
         self.bus = self.num_input_busses + self.num_output_busses
         self.max_busses = 100
         self.max_buffers = 1024
+        self.max_datagram_size = 1472
+
+        # Messages that are sent straight away, such as buffer loads, are also added here when rendering
+        self.score = None
 
     @staticmethod
     def create_osc_msg(dictionary):
@@ -157,6 +284,32 @@ class ServerManager(object):
         self.client.send( osc_message )
         return
 
+    def sendOSCBatch(self, osc_messages):
+        """ Sends a list of bundles using as few datagrams as possible and returns the
+            number of bytes sent """
+        datagrams = packBundles(osc_messages, self.max_datagram_size)
+        self.client.sendDatagrams(datagrams)
+        return sum(len(data) for data in datagrams)
+
+    def bufferReadBatch(self, buffers):
+        """ Loads a list of (path, bufnum) tuples """
+        for path, bufnum in buffers:
+            self.add_to_score("/b_allocRead", [bufnum, path])
+            self.bufferRead(path, bufnum)
+        return
+
+    def add_to_score(self, address, args):
+        """ Adds a message to the score being rendered (see `TempoClock.render`), if there is one """
+        if self.score is not None:
+            self.score.add_message(address, args)
+        return
+
+    def bufferRead(self, *args, **kwargs):
+        return
+
+    def isBufferLoaded(self, bufnum):
+        return True
+
     def get_bundle(self, *args, **kwargs):
         bundle  = OSCBundle(time=kwargs.get("timestamp", 0))
         message = OSCMessage(self.osc_address)
@@ -200,9 +353,24 @@ class SCLangServerManager(ServerManager):
         self.max_busses = 100
         self.max_buffers = 1024
 
+        # Bundles sent together are packed into datagrams no larger than this (in bytes)
+        self.max_datagram_size = 1472
+
         self.fx_setup_done = False
         self.fx_names = {}
 
+        # Pre-encoded bundles for each synth, effect chain, and set of attributes
+        self.use_bundle_templates = True
+        self.bundle_templates = {}
+
+        # Buffers are loaded using a client that receives the /done replies
+        self.buffer_client = None
+        self.buffers_pending = {}
+        self.buffers_failed = {}
+        self.buffer_lock = threading.Lock()
+
+        self.score = None
+
         self.reset()
 
     def reset(self):
@@ -286,6 +454,43 @@ class SCLangServerManager(ServerManager):
         
         return
 
+    def sendOSCBatch(self, osc_messages):
+        """ Sends a list of OSC bundles to the server, merging them into as few
+            datagrams as possible. Checks for midi messages. Returns the number of
+            bytes sent to the server """
+
+        midi, bundles = [], []
+
+        for osc_message in osc_messages:
+
+            if osc_message.address == OSC_MIDI_ADDRESS:
+
+                midi.append(osc_message)
+
+            else:
+
+                bundles.append(osc_message)
+
+        for osc_message in midi:
+
+            self.sclang.send( osc_message )
+
+        datagrams = packBundles(bundles, self.max_datagram_size)
+
+        self.client.sendDatagrams(datagrams)
+
+        # If we are sending other messages as well
+
+        if self.forward is not None:
+
+            for osc_message in midi:
+
+                self.forward.send(osc_message)
+
+            self.forward.sendDatagrams(datagrams)
+
+        return sum(len(data) for data in datagrams)
+
     def freeAllNodes(self):
         """ Triggers a free all message to kill all active nodes (sounds) in SuperCollider """
         msg = OSCMessage("/g_freeAll")
@@ -296,6 +501,7 @@ class SCLangServerManager(ServerManager):
     def setFx(self, fx_list):
         self.fxlist   = fx_list
         self.fx_names = {name: fx.synthdef for name, fx in fx_list.items() }
+        self.bundle_templates = {}
         return
 
     def set_midi_nudge(self, value):
@@ -512,14 +718,24 @@ class SCLangServerManager(ServerManager):
 
             return self.get_midi_message(synthdef, packet, timestamp)
 
-        # Create a bundle
-        
-        bundle = OSCBundle(time=timestamp)
-
         # Get the actual synthdef object
 
         synthdef = self.synthdefs[synthdef]
 
+        # Use a pre-encoded bundle if possible
+
+        if self.use_bundle_templates:
+
+            bundle = self.get_template_bundle(synthdef, packet, timestamp)
+
+            if bundle is not None:
+
+                return bundle
+
+        # Create a bundle
+        
+        bundle = OSCBundle(time=timestamp)
+
         # Create a group for the note
         group_id = self.nextnodeID()
         msg = OSCMessage("/g_new")
@@ -583,6 +799,122 @@ class SCLangServerManager(ServerManager):
 
         return bundle        
 
+    def get_template_bundle(self, synthdef, packet, timestamp=0):
+        """ Returns the same bundle as `get_bundle` but packs the values for this note
+            into a cached `BundleTemplate`. Returns None if the packet can't be used
+            with a template """
+
+        # The rate (or freq) value is sent with its own type
+
+        key = "rate" if synthdef.name in (SamplePlayer, LoopPlayer, HybridPlayer) else "freq"
+
+        if key in packet:
+
+            rate = packet[key]
+
+            if type(rate) in FloatTypes:
+
+                rate_tag = "f"
+
+            elif type(rate) in IntTypes:
+
+                rate_tag = "i"
+
+            else:
+
+                return None
+
+        else:
+
+            rate, rate_tag = None, None
+
+        effects = tuple(tuple(fx for fx in self.fxlist.order[i] if fx in packet and packet[fx] != 0) for i in range(3))
+        keys    = tuple(key for key in packet if key not in ("env", "degree", "tone"))
+
+        template_key = (synthdef.name, synthdef.bus_name, effects, keys, rate_tag)
+
+        try:
+
+            template = self.bundle_templates[template_key]
+
+        except KeyError:
+
+            template = self.bundle_templates[template_key] = self.new_bundle_template(synthdef, effects, keys, rate_tag)
+
+        # Pack the values for this note in the same order as `get_bundle`
+
+        group_id  = self.nextnodeID()
+        this_bus  = self.nextbusID()
+        this_node = self.nextnodeID()
+
+        values = [group_id, this_node, group_id, this_bus, float(packet["sus"] * 8)]
+
+        if rate_tag is not None:
+
+            values.append(rate)
+
+        for fx in effects[0]:
+
+            values.extend((self.nextnodeID(), group_id, this_bus))
+            values.extend(self.prepare_effect(fx, packet)[1::2])
+
+        values.extend((self.nextnodeID(), group_id, this_bus))
+
+        for key in keys:
+
+            try:
+
+                values.append(float(packet[key]))
+
+            except (TypeError, ValueError) as e:
+
+                WarningMsg( "Could not convert '{}' argument '{}' to float. Set to 0".format( key, packet[key] ))
+                values.append(0.0)
+
+        for fx in effects[1] + effects[2]:
+
+            values.extend((self.nextnodeID(), group_id, this_bus))
+            values.extend(self.prepare_effect(fx, packet)[1::2])
+
+        values.extend((self.nextnodeID(), group_id, this_bus, float(packet["sus"])))
+
+        return OSCEncodedBundle(template.pack(timestamp, values), time=timestamp)
+
+    def new_bundle_template(self, synthdef, effects, keys, rate_tag):
+        """ Creates a `BundleTemplate` with the same layout as a bundle from `get_bundle` """
+
+        def effect_message(fx):
+            args = [self.fx_names[fx], Slot("i"), 1, Slot("i"), 'bus', Slot("i")]
+            for key in self.fxlist[fx].args:
+                args.extend([key, Slot("f")])
+            return ("/s_new", args)
+
+        messages = [("/g_new", [Slot("i"), 1, 1])]
+
+        args = ["startSound", Slot("i"), 0, Slot("i"), 'bus', Slot("i"), "sus", Slot("f")]
+
+        if rate_tag is not None:
+
+            args.extend(["rate", Slot(rate_tag)])
+
+        messages.append(("/s_new", args))
+
+        messages.extend(effect_message(fx) for fx in effects[0])
+
+        args = [synthdef.name, Slot("i"), 1, Slot("i"), synthdef.bus_name, Slot("i")]
+
+        for key in keys:
+
+            args.extend([key, Slot("f")])
+
+        messages.append(("/s_new", args))
+
+        messages.extend(effect_message(fx) for fx in effects[1] + effects[2])
+
+        messages.append(("/s_new", ['makeSound', Slot("i"), 1, Slot("i"), 'bus', Slot("i"), 'sus', Slot("f")]))
+
+        return BundleTemplate(messages)
+
     def send(self, address, message):
         """ Sends message (a list) to SuperCollider """
         msg = OSCMessage(address)
@@ -608,13 +940,78 @@ class SCLangServerManager(ServerManager):
 
     def bufferRead(self, path, bufnum):
         """ Sends a message to SuperCollider to read an audio file into a buffer """
-        message = OSCMessage("/b_allocRead")
-        message.append([bufnum, path])
-        self.client.send( message )
+        return self.bufferReadBatch([(path, bufnum)])
+
+    def bufferReadBatch(self, buffers):
+        """ Sends one bundle of /b_allocRead messages (more if they do not fit in one
+            datagram) to load a list of (path, bufnum) tuples. Use `isBufferLoaded`
+            to check whether SuperCollider has finished loading them """
+        if self.buffer_client is None:
+            self.connectBufferClient()
+        client = self.buffer_client if self.buffer_client is not None else self.client
+        with self.buffer_lock:
+            for path, bufnum in buffers:
+                self.buffers_pending[bufnum] = path
+                self.buffers_failed.pop(bufnum, None)
+        bundle, size = OSCBundle(), 16
+        for path, bufnum in buffers:
+            self.add_to_score("/b_allocRead", [bufnum, path])
+            message = OSCMessage("/b_allocRead")
+            message.append([bufnum, path])
+            length = len(message.getBinary()) + 4
+            if size + length > self.max_datagram_size and len(bundle.values()):
+                client.send(bundle)
+                bundle, size = OSCBundle(), 16
+            bundle.append(message)
+            size += length
+        if len(bundle.values()):
+            client.send(bundle)
         return
 
+    def connectBufferClient(self, address=None):
+        """ Creates the client used to load buffers, which listens for the /done and
+            /fail replies from SuperCollider. Uses the server address by default """
+        try:
+            client = BidirectionalOSCServer()
+            client.addMsgHandler('/done', self._buffer_done)
+            client.addMsgHandler('/fail', self._buffer_failed)
+            client.connect(address if address is not None else (self.addr, self.port))
+        except socket.error as e:
+            WarningMsg("Could not create a client for loading buffers: {}".format(e))
+            return None
+        if self.buffer_client is not None:
+            self.buffer_client.stop()
+        self.buffer_client = client
+        return client
+
+    def _buffer_done(self, addr, tags, data, client_address):
+        if len(data) > 1 and data[0] in ("/b_allocRead", b"/b_allocRead"):
+            with self.buffer_lock:
+                self.buffers_pending.pop(int(data[1]), None)
+        return
+
+    def _buffer_failed(self, addr, tags, data, client_address):
+        if len(data) > 0 and data[0] in ("/b_allocRead", b"/b_allocRead"):
+            with self.buffer_lock:
+                # Newer versions of SuperCollider add the buffer number, older ones only
+                # have the file name in the error message
+                if isinstance(data[-1], int) and data[-1] in self.buffers_pending:
+                    bufnum = data[-1]
+                else:
+                    error = " ".join(str(item) for item in data[1:])
+                    bufnum = next((num for num, path in self.buffers_pending.items() if path in error), None)
+                if bufnum is not None:
+                    self.buffers_failed[bufnum] = self.buffers_pending.pop(bufnum)
+            WarningMsg("Could not load buffer: {}".format(" ".join(str(item) for item in data[1:])))
+        return
+
+    def isBufferLoaded(self, bufnum):
+        """ Returns True if SuperCollider has finished loading the buffer """
+        return bufnum not in self.buffers_pending
+
     def bufferFree(self, bufnum):
         """ Sends a message to SuperCollider to free a buffer """
+        self.add_to_score("/b_free", [bufnum])
         message = OSCMessage("/b_free")
         message.append([bufnum])
         self.client.send(message)
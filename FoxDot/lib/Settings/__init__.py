@@ -71,6 +71,11 @@ FOXDOT_INFO_FILE    = os.path.realpath(FOXDOT_ROOT + "/osc/Info.scd")
 FOXDOT_RECORD_FILE  = os.path.realpath(FOXDOT_ROOT + "/osc/Record.scd")
 FOXDOT_TEMP_FILE    = os.path.realpath(FOXDOT_ROOT + "/lib/Workspace/tmp/tempfile.txt")
 
+# Cache of sample file information, the second is used if the first cannot be written to
+
+FOXDOT_SAMPLE_INFO_FILES = [os.path.realpath(FOXDOT_ROOT + "/lib/Workspace/tmp/sample_info.json"),
+                            os.path.join(os.path.expanduser("~"), ".foxdot_sample_info.json")]
+
 # If the tempfile doesn't exist, create it
 
 if not os.path.isfile(FOXDOT_TEMP_FILE):
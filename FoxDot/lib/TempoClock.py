@@ -11,9 +11,10 @@
     be activated. A queue block has a "beat" value for which its contents should be activated. To make
     sure that events happen on time, the `TempoClock` will begin processing the contents 0.25
     seconds before it is *actually* meant to happen in case there is a large amount to process.  When 
-    a queue block is activated, a new thread is created to process all of the callable objects it
-    contains. If it calls a `Player` object, the queue block keeps track of the OSC messages generated 
-    until all `Player` objects in the block have been called. At this point the thread is told to
+    a queue block is activated, it is handed to a fixed pool of worker threads (see `BlockExecutor`)
+    that process all of the callable objects it contains. If it calls a `Player` object, the queue
+    block keeps track of the OSC messages generated until all `Player` objects in the block have
+    been called. At this point the thread is told to
     sleep until the remainder of the 0.25 seconds has passed. This value is stored in `Clock.latency`
     and is adjustable. If you find that there is a noticeable jitter between events, i.e. irregular
     beat lengths, you can increase the latency by simply evaluating the following in FoxDot:
@@ -56,14 +57,21 @@ from .Patterns import asStream
 from .TimeVar import TimeVar
 from .Midi import MidiIn, MIDIDeviceNotFound
 from .Utils import modi
+from .Code import WarningMsg
 from .ServerManager import TempoClient, ServerManager, RequestTimeout
-from .Settings import CPU_USAGE, CLOCK_LATENCY
+from .Settings import CPU_USAGE, CLOCK_LATENCY, OSC_MIDI_ADDRESS
+from .Buffers import Samples
+from .Render import Score
+from .TimeSource import WallClock, VirtualClock, perf_counter
+from .Logging import Telemetry, writeStats
 
-import time
+from collections import deque
 from fractions import Fraction
 from traceback import format_exc as error_stack
 
 import sys
+import heapq
+import random
 import threading
 import inspect
 
@@ -124,7 +132,10 @@ class TempoClock(object):
         self.nudge      = 0.0  # If you want to synchronise with something external, adjust the nudge
         self.hard_nudge = 0.0
 
-        self.bpm_start_time = time.time()
+        # Where the time is read from, see TimeSource.py
+        self.time_source = WallClock()
+
+        self.bpm_start_time = self.get_machine_time()
         self.bpm_start_beat = 0
 
         # The duration to sleep while continually looping
@@ -132,6 +143,25 @@ class TempoClock(object):
         self.sleep_time = self.sleep_values[CPU_USAGE]
         self.midi_nudge = 0
 
+        # "poll" checks the queue every `sleep_time` seconds, "event" sleeps until the next block is due
+        self.scheduling_mode = "poll"
+        self.wake_lead = 0.002 # seconds before a block is due that the event loop wakes up
+        self.max_wait  = 0.5   # longest the event loop waits without checking the queue
+
+        # How late (in seconds) recent blocks were popped from the queue, how long they took
+        # to run and send, and how many messages and bytes they sent. See `stats`
+        self.telemetry = Telemetry()
+
+        # Number of OSC messages dropped because their time had passed when they were created
+        self.late_messages = 0
+        self.late_lock = threading.Lock()
+
+        # Adjusts the latency to the load when turned on, see `set_adaptive_latency`
+        self.latency_controller = None
+
+        # Fixed pool of threads that run the queue blocks
+        self.executor = BlockExecutor(self.__run_block)
+
         # Debug
         self.debugging = False
         self.__setup   = True
@@ -181,7 +211,7 @@ class TempoClock(object):
         """ Deprecated """
         self.time = self.dtype(0)
         self.beat = self.dtype(0)
-        self.start_time = time.time()
+        self.start_time = self.get_machine_time()
         return
 
     @classmethod
@@ -243,7 +273,7 @@ class TempoClock(object):
 
     def update_tempo_now(self, bpm):
         """ emergency override for updating tempo"""
-        self.last_now_call = self.bpm_start_time = time.time()
+        self.last_now_call = self.bpm_start_time = self.get_machine_time()
         self.bpm_start_beat = self.now()
         object.__setattr__(self, "bpm", self._convert_json_bpm(bpm))
         # self.update_network_tempo(bpm, start_beat, start_time) -- updates at the bar...
@@ -336,12 +366,92 @@ class TempoClock(object):
         self.sleep_time = self.sleep_values[value]
         return
 
+    def set_scheduling_mode(self, mode, lead=None):
+        """ Sets how the clock waits for the next event. "poll" checks the queue every
+            `sleep_time` seconds and "event" sleeps until the next block is due, waking
+            `lead` seconds early """
+        assert mode in ("poll", "event")
+        self.scheduling_mode = mode
+        if lead is not None:
+            self.wake_lead = float(lead)
+        with self.queue.wake:
+            self.queue.wake.notify_all()
+        return
+
+    def set_executor(self, workers=None, policy=None):
+        """ Sets the number of worker threads used to run queue blocks and what to do
+            with a block that is due while all the workers are busy: "queue" it, "merge"
+            it with the next waiting block, or "drop" its messages """
+        if workers is not None:
+            self.executor.set_workers(workers)
+        if policy is not None:
+            self.executor.set_policy(policy)
+        return
+
+    def stats(self):
+        """ Returns summaries (count, mean, max and percentiles) of how late recent queue
+            blocks were run ("late") in seconds, how long they waited for a worker ("wait"),
+            how long their players took to run ("run"), the time taken to send their
+            messages ("send"), the number of "messages" and "bytes" they sent, and the
+            number of messages "dropped" for being late. Also includes the executor's
+            counts, the current latency, the total number of late messages, and the
+            `stats` for each player that is playing """
+        return {"blocks": self.telemetry.summary(),
+                "executor": dict(self.executor.stats),
+                "latency": self.latency,
+                "late_messages": self.late_messages,
+                "players": dict((player.id, player.stats()) for player in list(self.playing))}
+
+    def export_stats(self, filename):
+        """ Writes the summaries and recent values for the clock and each player that is
+            playing to `filename` as JSON """
+        writeStats(filename, {"blocks": self.telemetry.dump(),
+                              "executor": dict(self.executor.stats),
+                              "latency": self.latency,
+                              "late_messages": self.late_messages,
+                              "latency_changes": list(self.latency_controller.history) if self.latency_controller else [],
+                              "players": dict((player.id, player.telemetry.dump()) for player in list(self.playing))})
+        return
+
+    def clear_stats(self):
+        """ Clears the values used by `stats` for the clock and its players """
+        self.telemetry.clear()
+        self.executor.reset_stats()
+        with self.late_lock:
+            self.late_messages = 0
+        for player in list(self.playing):
+            player.telemetry.clear()
+        return
+
+    def get_block_lateness(self):
+        """ Returns a dictionary summarising how late (in seconds) recent blocks were popped
+            from the queue """
+        late = list(self.telemetry["late"])
+        if len(late) == 0:
+            return {"blocks": 0, "mean": 0.0, "max": 0.0}
+        return {"blocks": len(late), "mean": sum(late) / len(late), "max": max(late)}
+
     def set_latency(self, value):
         """ Sets the `latency` attribute to values based on desired high/low/medium latency """
         assert 0 <= value <= 2
         self.latency = self.latency_values[value]
         return
 
+    def set_adaptive_latency(self, on=True, **kwargs):
+        """ Turns on a `LatencyController` that raises the latency when blocks are taking
+            too long to send their messages, or messages are dropped for being late, and
+            lowers it again when the load falls. Keyword arguments are passed to the
+            controller. Turning it off returns the latency to the value it had before """
+        if on:
+            if self.latency_controller is None:
+                self.latency_controller = LatencyController(self, **kwargs)
+            else:
+                self.latency_controller.configure(**kwargs)
+        elif self.latency_controller is not None:
+            self.latency = self.latency_controller.initial
+            self.latency_controller = None
+        return self.latency_controller
+
     def __setattr__(self, attr, value):
         if attr == "bpm" and self.__setup:
 
@@ -425,9 +535,23 @@ class TempoClock(object):
         """ Returns the time since the last change in bpm """
         return self.get_time() - self.bpm_start_time
 
+    def get_machine_time(self):
+        """ Returns the time from the clock's time source, which is the machine clock
+            time by default """
+        return self.time_source.time()
+
+    def set_time_source(self, source):
+        """ Sets the `TimeSource` used to read the time and to sleep. The current beat
+            is kept so the clock carries on from where it is """
+        beat = self.now()
+        self.time_source = source
+        self.last_now_call = self.bpm_start_time = self.get_machine_time()
+        self.bpm_start_beat = self.beat = beat
+        return
+
     def get_time(self):
         """ Returns current machine clock time with nudges values added """
-        return time.time() + float(self.nudge) + float(self.hard_nudge)
+        return self.get_machine_time() + float(self.nudge) + float(self.hard_nudge)
 
     def get_time_at_beat(self, beat):
         """ Returns the time that the local computer's clock will be at 'beat' value """
@@ -457,7 +581,7 @@ class TempoClock(object):
 
     def set_time(self, beat):
         """ Set the clock time to 'beat' and update players in the clock """
-        self.start_time = time.time()
+        self.start_time = self.get_machine_time()
         self.queue.clear()
         self.beat = beat
         self.bpm_start_beat = beat
@@ -522,7 +646,7 @@ class TempoClock(object):
 
     def osc_message_time(self):
         """ Returns the true time that an osc message should be run i.e. now + latency """
-        return time.time() + self.latency
+        return self.get_machine_time() + self.latency
         
     def start(self):
         """ Starts the clock thread """ 
@@ -555,17 +679,28 @@ class TempoClock(object):
         """ Start recursive call to adjust hard-nudge values """
         return self.schedule(self._adjust_hard_nudge)
 
-    def __run_block(self, block, beat):
+    def __run_block(self, block, beat, send=True):
         """ Private method for calling all the items in the queue block.
             This means the clock can still 'tick' while a large number of
-            events are activated  """
+            events are activated. If `send` is False, the OSC messages are
+            left in the block for the caller to send """
+
+        # Set the time to "activate" messages on - the time the block was due plus the latency,
+        # even if the block has been waiting for a worker since it was activated
+
+        if block.due is None:
+
+            self.activate_block(block, beat)
+
+        block.time = block.due + self.latency
+
+        start = perf_counter()
 
-        # Set the time to "activate" messages on - adjust in case the block is activated late
+        # Time spent waiting for a worker thread after the block was activated
 
-        # `beat` is the actual beat this is happening, `block.beat` is the desired time. Adjust
-        # the osc_message_time accordingly if this is being called late
+        block.wait = start - block.activated
 
-        block.time = self.osc_message_time() - self.beat_dur(float(beat) - block.beat)
+        self.telemetry.add("wait", block.wait)
 
         for item in block:
 
@@ -591,7 +726,21 @@ class TempoClock(object):
 
         # Send all the message to supercollider together
 
-        block.send_osc_messages()
+        block.run_time = perf_counter() - start
+
+        self.telemetry.add("run", block.run_time)
+
+        self.telemetry.add("dropped", block.dropped)
+
+        if block.dropped > 0:
+
+            with self.late_lock:
+
+                self.late_messages += block.dropped
+
+        if send:
+
+            block.send_osc_messages()
 
         # Store the osc messages -- future idea
 
@@ -599,6 +748,24 @@ class TempoClock(object):
 
         return
 
+    def block_sent(self, block, seconds, size):
+        """ Called by a `QueueBlock` after sending its messages, which took `seconds`
+            seconds and `size` bytes """
+
+        self.telemetry.add("send", seconds)
+
+        self.telemetry.add("messages", len(block.osc_messages))
+
+        self.telemetry.add("bytes", size)
+
+        if self.latency_controller is not None:
+
+            used = block.late + block.wait + block.run_time + seconds
+
+            self.latency_controller.update(used, block.dropped, len(block.osc_messages))
+
+        return
+
     def run(self):
         """ Main loop """
         
@@ -608,17 +775,11 @@ class TempoClock(object):
 
         while self.ticking:
 
-            beat = self._now() # get current time
-
-            if self.queue.after_next_event(beat):
+            if self.scheduling_mode == "event":
 
-                self.current_block = self.queue.pop()
-
-                # Do the work in a thread
+                self._wait_for_next_block()
 
-                if len(self.current_block):
-
-                    threading.Thread(target=self.__run_block, args=(self.current_block, beat)).start()
+            self.tick()
 
             # If using a midi-clock, update the values
 
@@ -628,9 +789,209 @@ class TempoClock(object):
 
             # if using espgrid
 
-            if self.sleep_time > 0:
+            if self.sleep_time > 0 and self.scheduling_mode == "poll":
+
+                self.time_source.sleep(self.sleep_time)
+
+        return
+
+    def tick(self, threaded=True):
+        """ Activates the next queue block if it is due and returns it, otherwise returns
+            None. The block is run by the executor's threads unless `threaded` is False """
+
+        beat = self._now() # get current time
+
+        if not self.queue.after_next_event(beat):
+
+            return None
+
+        self.current_block = self.queue.pop()
+
+        # Keep track of how late the block is being activated
+
+        self.activate_block(self.current_block, beat)
+
+        self.telemetry.add("late", self.current_block.late)
+
+        # Do the work in one of the executor's threads
+
+        if len(self.current_block):
+
+            if threaded:
+
+                self.executor.submit(self.current_block, beat)
+
+            else:
+
+                self.__run_block(self.current_block, beat)
+
+        return self.current_block
+
+    def activate_block(self, block, beat):
+        """ Records that `block` is being activated at `beat`: how late it is, in seconds,
+            and the machine time it was due, which its messages are timed from """
+
+        block.activated = perf_counter()
+
+        block.late = self.beat_dur(float(beat) - block.beat)
+
+        block.due = self.get_machine_time() - block.late
+
+        return block
+
+    def step(self, seconds=0):
+        """ Moves the time on by `seconds` and runs every queue block that is due in this
+            thread, without sleeping. Used with a `VirtualClock` time source to step
+            through the clock in tests and benchmarks. Returns the number of blocks run """
+
+        self.time_source.advance(seconds)
+
+        count = 0
+
+        while self.tick(threaded=False) is not None:
+
+            count += 1
+
+        return count
+
+    def render(self, beats, filename=None, seed=None):
+        """ Plays everything scheduled in the clock for the next `beats` beats as fast as
+            possible and writes the OSC bundles to `filename` (see `Render.Score`) instead
+            of sending them to SuperCollider. Times in the score are in seconds from the
+            current beat. If `seed` is given then the random module is seeded first. The
+            clock carries on in real time from the end of the render. Returns the `Score` """
+
+        running = self.thread.is_alive()
+
+        if running:
+
+            self.ticking = False
+
+            self.thread.join()
+
+        ticking = self.ticking
+
+        saved = (self.nudge, self.hard_nudge, self.server.node, self.server.bus)
+
+        if seed is not None:
+
+            random.seed(seed)
+
+        # Start the virtual time at 1 second because a timetag of 0 means "immediately"
+
+        start_beat, end_beat = self.now(), self.now() + beats
+
+        time_source, self.time_source = self.time_source, VirtualClock(1.0)
+
+        self.last_now_call = self.bpm_start_time = self.get_machine_time()
+
+        self.bpm_start_beat = start_beat
+
+        self.nudge = self.hard_nudge = 0
+
+        self.ticking = True
+
+        # Node IDs start from the beginning so the same piece gives the same score
+
+        self.server.node = 1000
+
+        self.server.bus = self.server.num_input_busses + self.server.num_output_busses
+
+        score = Score(origin=self.osc_message_time())
+
+        for path, bufnum in sorted(Samples.getLoadedBuffers(), key=lambda item: item[1]):
+
+            score.add_message("/b_allocRead", [bufnum, path])
+
+        self.server.score = score
+
+        try:
+
+            while self.queue.next() < end_beat:
+
+                beat = self.queue.next()
+
+                self.time_source.set(self.get_time_at_beat(beat))
+
+                self.beat = self.dtype(beat)
+
+                score.now = self.osc_message_time()
+
+                self.current_block = self.queue.pop()
+
+                if len(self.current_block):
+
+                    self.activate_block(self.current_block, beat)
+
+                    self.__run_block(self.current_block, beat, send=False)
+
+                    for message in self.current_block.osc_messages:
+
+                        if message.address != OSC_MIDI_ADDRESS:
+
+                            score.add_bundle(message)
+
+            self.time_source.set(self.get_time_at_beat(end_beat))
+
+            score.now = self.osc_message_time()
+
+            score.end()
+
+        finally:
+
+            self.server.score = None
+
+            self.time_source = time_source
+
+            self.nudge, self.hard_nudge, self.server.node, self.server.bus = saved
+
+            self.beat = self.dtype(end_beat)
+
+            self.last_now_call = self.bpm_start_time = self.get_machine_time()
+
+            self.bpm_start_beat = end_beat
+
+            self.ticking = ticking
+
+            if running:
+
+                self.thread = threading.Thread(target=self.run)
+
+                self.start()
+
+        if filename is not None:
+
+            score.write(filename)
+
+        return score
+
+    def _wait_for_next_block(self):
+        """ Sleeps until the next block in the queue is due. Waits on the queue's
+            condition variable so that scheduling an earlier block wakes the clock """
+
+        with self.queue.wake:
+
+            next_beat = self.queue.next()
+
+            if next_beat == sys.maxsize:
 
-                time.sleep(self.sleep_time)
+                self.time_source.wait(self.queue.wake, self.max_wait)
+
+                return
+
+            remaining = self.beat_dur(next_beat - self._now())
+
+            if remaining > self.wake_lead:
+
+                self.time_source.wait(self.queue.wake, min(remaining - self.wake_lead, self.max_wait))
+
+                return
+
+        # Close to the block, so sleep for the remaining time
+
+        if remaining > 0:
+
+            self.time_source.sleep(remaining)
 
         return
 
@@ -690,7 +1051,7 @@ class TempoClock(object):
 
     def next_event(self):
         """ Returns the beat index for the next event to be called """
-        return self.queue[-1][1]
+        return self.queue.next()
 
     def call(self, obj, dur, args=()):
         """ Returns a 'schedulable' wrapper for any callable object """
@@ -746,15 +1107,294 @@ class TempoClock(object):
         
         return
 
+class BlockExecutor(object):
+    """ Runs queue blocks on a fixed pool of worker threads in the order they are
+        submitted, which is beat order when used by the `TempoClock`. If all the
+        workers are busy when a block is submitted, the `policy` decides what
+        happens to it:
+
+        - "queue": the block waits for a free worker
+        - "merge": the block is merged with the last waiting block (if there is one)
+          and their messages are sent together
+        - "drop": the items in the block are still called, so that players keep
+          their place, but its messages are discarded and a warning is shown. This
+          only reduces the network traffic, not the work done by the players
+
+        Messages are timed from when a block was due (see `TempoClock.activate_block`)
+        so waiting for a worker does not make them late.
+
+    """
+    policies = ("queue", "merge", "drop")
+
+    def __init__(self, func, workers=2, policy="queue"):
+
+        self.func    = func # called with (block, beat, send)
+
+        self.jobs    = deque() # each job is a list of (block, beat, send) items
+        self.cond    = threading.Condition()
+        self.threads = []
+        self.busy    = 0
+
+        self.workers = 0
+        self.policy  = None
+
+        self.set_workers(workers)
+        self.set_policy(policy)
+
+        self.reset_stats()
+
+    def __repr__(self):
+        return "<BlockExecutor workers={} policy={!r} backlog={}>".format(self.workers, self.policy, self.backlog())
+
+    def set_workers(self, workers):
+        """ Sets the number of worker threads. Extra threads are started when first needed """
+        assert int(workers) > 0
+        with self.cond:
+            self.workers = int(workers)
+            self.cond.notify_all()
+        return
+
+    def set_policy(self, policy):
+        """ Sets the overload policy to "queue", "merge", or "drop" """
+        assert policy in self.policies
+        self.policy = policy
+        return
+
+    def reset_stats(self):
+        """ Resets the counters for submitted, queued, merged and dropped blocks """
+        with self.cond:
+            self.stats = {"submitted": 0, "queued": 0, "merged": 0, "dropped": 0, "max_backlog": 0}
+        return
+
+    def backlog(self):
+        """ Returns the number of blocks waiting for a worker """
+        return sum(len(job) for job in self.jobs)
+
+    def submit(self, block, beat):
+        """ Adds a block, activated at `beat`, to be run by the next free worker """
+
+        with self.cond:
+
+            self.stats["submitted"] += 1
+
+            if self.busy + len(self.jobs) < self.workers:
+
+                self.jobs.append([(block, beat, True)])
+
+            elif self.policy == "merge" and len(self.jobs) > 0:
+
+                self.jobs[-1].append((block, beat, True))
+
+                self.stats["merged"] += 1
+
+            elif self.policy == "drop":
+
+                self.jobs.append([(block, beat, False)])
+
+                self.stats["dropped"] += 1
+
+                WarningMsg("Clock overloaded: dropping messages for beat {}".format(block.beat))
+
+            else:
+
+                self.jobs.append([(block, beat, True)])
+
+                self.stats["queued"] += 1
+
+            self.stats["max_backlog"] = max(self.stats["max_backlog"], self.backlog())
+
+            while len(self.threads) < self.workers:
+
+                thread = threading.Thread(target=self.work, args=(len(self.threads),))
+
+                thread.daemon = True
+
+                self.threads.append(thread)
+
+                thread.start()
+
+            self.cond.notify_all()
+
+        return
+
+    def work(self, n):
+        """ Worker thread loop """
+
+        while True:
+
+            with self.cond:
+
+                while len(self.jobs) == 0 or n >= self.workers:
+
+                    self.cond.wait()
+
+                job = self.jobs.popleft()
+
+                self.busy += 1
+
+            try:
+
+                self.run(job)
+
+            finally:
+
+                with self.cond:
+
+                    self.busy -= 1
+
+        return
+
+    def run(self, job):
+        """ Calls each block in the job and then sends their messages """
+
+        for block, beat, send in job:
+
+            self.func(block, beat, False)
+
+        for block, beat, send in job:
+
+            if send:
+
+                block.send_osc_messages()
+
+        return
+
+class LatencyController(object):
+    """
+    Adjusts a clock's latency to the time its queue blocks take. Each block uses
+    some of the latency between when it is due and when SuperCollider plays its
+    messages: how late it was activated, how long it waited for a worker thread,
+    and the time taken to run its players and send its messages. The controller
+    keeps a decaying peak of that time (`load`) and aims for a latency of
+    `headroom` times the load, between `minimum` and `maximum` seconds. When
+    messages are dropped for being late the target is raised in proportion to the
+    fraction of the block's messages that were dropped, up to double the current
+    latency when they all were.
+
+    The latency moves a fraction of the way towards the target after every block,
+    quickly (`rise`) when raising it and slowly (`fall`) when lowering it, but by
+    no more than `slew` seconds per second of clock time, so that players do not
+    jump when it changes. The clock's latency is only changed when it is
+    `resolution` seconds away. Every change is added to `history` and printed if
+    `verbose` is True.
+    """
+    def __init__(self, clock, minimum=0.1, maximum=1.0, headroom=2.0, rise=0.5, fall=0.02, slew=0.05,
+                 decay=0.995, resolution=0.01, verbose=True):
+
+        self.clock   = clock
+        self.initial = clock.latency
+        self.target  = clock.latency
+        self.value   = clock.latency # smoothed latency
+        self.load    = 0.0
+        self.dropped = 0 # messages dropped since the last change
+        self.time    = clock.get_machine_time() # time of the last update
+        self.history = deque(maxlen=256)
+        self.lock    = threading.Lock()
+
+        self.configure(minimum, maximum, headroom, rise, fall, slew, decay, resolution, verbose)
+
+    def __repr__(self):
+        return "<LatencyController latency={:.3f} load={:.3f}>".format(self.clock.latency, self.load)
+
+    def configure(self, minimum=None, maximum=None, headroom=None, rise=None, fall=None, slew=None,
+                  decay=None, resolution=None, verbose=None):
+        """ Changes any of the settings that are given """
+        for name, value in (("minimum", minimum), ("maximum", maximum), ("headroom", headroom), ("rise", rise),
+                            ("fall", fall), ("slew", slew), ("decay", decay), ("resolution", resolution),
+                            ("verbose", verbose)):
+            if value is not None:
+                setattr(self, name, value)
+        assert 0 < self.minimum <= self.maximum
+        assert 0 < self.rise <= 1 and 0 < self.fall <= 1 and self.slew > 0
+        return
+
+    def update(self, used, dropped=0, messages=0):
+        """ Updates the latency after a block that used `used` seconds of it, sent
+            `messages` messages and dropped `dropped` messages. Returns the change
+            made, if there was one """
+
+        with self.lock:
+
+            latency = self.clock.latency
+
+            # The most the latency can change by since the last update
+
+            now = self.clock.get_machine_time()
+
+            step = self.slew * max(now - self.time, 0)
+
+            self.time = now
+
+            # Start from the clock's value if it has been set by the user
+
+            if abs(latency - self.value) >= self.resolution:
+
+                self.value = latency
+
+            self.load = max(used, self.load * self.decay)
+
+            self.dropped += dropped
+
+            target = self.load * self.headroom
+
+            if dropped > 0:
+
+                target = max(target, latency * (1 + dropped / (dropped + messages)))
+
+            self.target = min(max(target, self.minimum), self.maximum)
+
+            rate = self.rise if self.target > self.value else self.fall
+
+            self.value += min(max(rate * (self.target - self.value), -step), step)
+
+            if abs(self.value - latency) < self.resolution:
+
+                return None
+
+            change = {"time": self.clock.get_machine_time(), "old": latency, "new": self.value,
+                      "load": self.load, "dropped": self.dropped}
+
+            self.clock.latency = self.value
+
+            self.dropped = 0
+
+            self.history.append(change)
+
+        if self.verbose:
+
+            print("Latency {} from {:.3f}s to {:.3f}s (blocks taking up to {:.3f}s, {} late messages dropped)".format(
+                "raised" if change["new"] > change["old"] else "lowered", change["old"], change["new"],
+                change["load"], change["dropped"]))
+
+        return change
+
 #####
 
 class Queue(object):
+    """ Stores `QueueBlock` instances in beat order. The beat values are kept in a
+        binary heap and each beat is mapped to its block in a dictionary so that
+        adding an item and popping the next block are both O(log n) """
     def __init__(self, parent):
-        self.data = []
+        self.beats  = [] # heap of beat values
+        self.blocks = {} # beat -> QueueBlock
         self.parent = parent
+        self.lock   = threading.RLock()
+        self.wake   = threading.Condition(self.lock) # notified when the next beat changes
 
     def __repr__(self):
-        return "\n".join([str(item) for item in self.data]) if len(self.data) > 0 else "[]"
+        return "\n".join([str(item) for item in self.data]) if len(self.blocks) > 0 else "[]"
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    @property
+    def data(self):
+        """ Returns a list of the blocks in the queue, with the next block at the end """
+        with self.lock:
+            return [self.blocks[beat] for beat in sorted(self.beats, reverse=True)]
 
     def add(self, item, beat, args=(), kwargs={}, is_priority=False):
         """ Adds a callable object to the queue at a specified beat, args and kwargs for the
@@ -781,83 +1421,73 @@ class Queue(object):
 
                     del kwargs[key]
 
-        # If the new event is before the next scheduled event,
-        # move it to the 'front' of the queue
-
-        if self.before_next_event(beat):
-
-            self.data.append(QueueBlock(self, item, beat, args, kwargs, is_priority))
-
-            block = self.data[-1]
-
-        else:
-
-            # If the event is after the next scheduled event, work
-            # out its position in the queue
+        block = self._insert(item, beat, args, kwargs, is_priority)
 
-            # need to be careful in case self.data changes size
-            
-            for block in self.data:
+        # Tell any players about what queue item they are in
 
-                # If another event is happening at the same time, schedule together
+        if isinstance(item, Player):
 
-                if beat == block.beat:
+            item.set_queue_block(block)
 
-                    block.add(item, args, kwargs, is_priority)
+        return
 
-                    break
+    def _insert(self, item, beat, args=(), kwargs={}, is_priority=False):
+        """ Adds the item to the block at `beat`, creating a new block if there
+            isn't one, and returns the block """
 
-                # If the event is later than the next event, schedule it here
+        with self.lock:
 
-                if beat > block.beat:
+            # If another event is happening at the same time, schedule together
 
-                    try:
+            block = self.blocks.get(beat)
 
-                        i = self.data.index(block)
+            if block is not None:
 
-                    except ValueError:
+                block.add(item, args, kwargs, is_priority)
 
-                        i = 0
+            else:
 
-                    self.data.insert(i, QueueBlock(self, item, beat, args, kwargs, is_priority))
+                block = QueueBlock(self, item, beat, args, kwargs, is_priority)
 
-                    block = self.data[i]
+                self.blocks[beat] = block
 
-                    break
+                heapq.heappush(self.beats, beat)
 
-        # Tell any players about what queue item they are in
+                # Wake the clock if this is now the next block
 
-        if isinstance(item, Player):
+                if self.beats[0] == beat:
 
-            item.set_queue_block(block)
+                    self.wake.notify_all()
 
-        return
+        return block
 
     def clear(self):
-        while len(self.data):
-            del self.data[-1]
+        with self.lock:
+            self.beats  = []
+            self.blocks = {}
         return
 
     def pop(self):
-        return self.data.pop() if len(self.data) > 0 else list()
+        with self.lock:
+            if len(self.beats) > 0:
+                return self.blocks.pop(heapq.heappop(self.beats))
+        return list()
 
     def next(self):
-        if len(self.data) > 0:
-            try:
-                return self.data[-1].beat
-            except IndexError:
-                pass
-        return sys.maxsize
+        try:
+            return self.beats[0]
+        except IndexError:
+            return sys.maxsize
 
     def before_next_event(self, beat):
         try:
-            return beat < self.data[-1].beat
+            return beat < self.beats[0]
         except IndexError:
             return True
 
     def after_next_event(self, beat):
         try:
-            return beat >= self.data[-1].beat
+            return beat >= self.beats[0]
         except IndexError:
             return False
 
@@ -892,6 +1522,19 @@ class QueueBlock(object):
 
         self.beat = t
         self.time = 0
+
+        # How late the block was activated, how long it waited for a worker and how long
+        # its items took, in seconds, and the machine time it was due and the
+        # performance counter when it was activated (see `TempoClock.activate_block`)
+        self.late = 0
+        self.wait = 0
+        self.run_time = 0
+        self.due = None
+        self.activated = None
+
+        # Messages that were not added because their time had already passed
+        self.dropped = 0
+
         self.add(obj, args, kwargs, is_priority)
 
     @classmethod
@@ -934,14 +1577,21 @@ class QueueBlock(object):
         self.send_osc_messages()
 
     def append_osc_message(self, message):
-        """ Adds an OSC bundle if the timetag is not in the past """
+        """ Adds an OSC bundle if the timetag is not in the past, otherwise counts it
+            as dropped """
         if message.timetag > self.metro.get_time():
             self.osc_messages.append(message)
+        else:
+            self.dropped += 1
         return
 
     def send_osc_messages(self):
-        """ Sends all compiled osc messages to the SuperCollider server """
-        return list(map(self.server.sendOSC, self.osc_messages))
+        """ Sends all compiled osc messages to the SuperCollider server together and
+            returns the number of bytes sent """
+        start = perf_counter()
+        size = self.server.sendOSCBatch(self.osc_messages) if len(self.osc_messages) > 0 else 0
+        self.metro.block_sent(self, perf_counter() - start, size)
+        return size
 
     def players(self):
         return [item for level in self.events[1:3] for item in level]
@@ -0,0 +1,87 @@
+"""
+    TimeSource.py
+    =============
+
+    Sources of time for the `TempoClock`. Every time the clock reads the time, or
+    sleeps, it uses its time source, which can be changed using:
+
+        Clock.set_time_source(MonotonicClock())
+
+    - `WallClock` uses `time.time()` and is the default
+    - `MonotonicClock` uses a high resolution clock that is never adjusted, starting
+      from the machine time so that OSC timetags are still correct
+    - `VirtualClock` only moves when it is told to, so the clock can be stepped
+      through with `TempoClock.step` for tests and benchmarks without sleeping
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import time
+
+try:
+    from time import perf_counter
+except ImportError:
+    from time import clock as perf_counter
+
+class WallClock(object):
+    """ Time from the machine clock """
+
+    def __repr__(self):
+        return "<{}>".format(self.__class__.__name__)
+
+    def time(self):
+        """ Returns the time in seconds """
+        return time.time()
+
+    def sleep(self, seconds):
+        """ Waits for `seconds` seconds """
+        time.sleep(seconds)
+        return
+
+    def wait(self, condition, timeout):
+        """ Waits on a (held) `threading.Condition` for up to `timeout` seconds """
+        condition.wait(timeout)
+        return
+
+class MonotonicClock(WallClock):
+    """ Time from a high resolution clock that is not affected by changes to the
+        machine clock, offset to match the machine time when it is created """
+
+    def __init__(self):
+        self.offset = time.time() - perf_counter()
+
+    def time(self):
+        return perf_counter() + self.offset
+
+class VirtualClock(WallClock):
+    """ Time that only changes when `advance` or `set` is called. Sleeping and waiting
+        move the time on straight away instead of blocking """
+
+    def __init__(self, start=1.0):
+        self.now = float(start)
+
+    def __repr__(self):
+        return "<VirtualClock {}>".format(self.now)
+
+    def time(self):
+        return self.now
+
+    def set(self, seconds):
+        """ Sets the time to `seconds` """
+        self.now = float(seconds)
+        return
+
+    def advance(self, seconds):
+        """ Moves the time on by `seconds` """
+        if seconds > 0:
+            self.now += seconds
+        return
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+        return
+
+    def wait(self, condition, timeout):
+        self.advance(timeout)
+        return
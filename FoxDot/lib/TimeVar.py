@@ -65,6 +65,8 @@ class TimeVar(object):
 
         self.__accessed = False
         self.__inf_index = None
+        self.__dur_index = None
+        self.__dur_index_source = None
 
         self.proportion    = 0
 
@@ -143,13 +145,53 @@ class TimeVar(object):
 
         return self
 
+    def get_dur_index(self):
+        """ Returns a DurationIndex for the durations, or None if they cannot be indexed """
+
+        if self.__dur_index_source is not self.dur:
+
+            self.__dur_index = DurationIndex.from_pattern(self.dur, inf=inf)
+
+            self.__dur_index_source = self.dur
+
+        return self.__dur_index
+
     def get_current_index(self, time=None):
-        """ Returns the index of the value currently represented """
+        """ Returns the index of the value currently represented. This only depends on
+            the time so any time, including one in the past, can be used """
 
         # Get the time value if not from the Clock
 
         time = self.get_current_time(time) - self.start_time
 
+        dur_index = self.get_dur_index()
+
+        if dur_index is None:
+
+            return self.walk_current_index(time)
+
+        self.current_index, self.prev_time, self.next_time = dur_index.find(time)
+
+        self.next_index = self.current_index + 1
+
+        # Store the % way through this value's time
+
+        try:
+
+            self.proportion = float((time - self.prev_time) / (self.next_time - self.prev_time))
+
+        except ZeroDivisionError:
+
+            self.proportion = 1.0
+
+        self.flag_accessed()
+
+        return self.current_index
+
+    def walk_current_index(self, time):
+        """ Finds the current index by adding durations to the last time found. Used
+            when the durations cannot be indexed, e.g. if they are not numbers """
+
         if self.get_inf_index() is not None:
 
             return self.get_inf_index()
@@ -223,7 +265,7 @@ class TimeVar(object):
         """ Returns the current beat value """
         # Return elapsed time in seconds if get_seconds flag is True
         if self.get_seconds is True:
-            return float(self.metro.time)
+            return float(self.metro.get_time())
         # Else return the beat
         if beat is None:
             beat = self.metro.now()
@@ -10,8 +10,15 @@ from __future__ import absolute_import, division, print_function
 import sys
 import json
 import itertools
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from socket import timeout as socket_timeout
 
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+
 try:
     from urllib.request import urlopen
     from urllib.error import URLError
@@ -57,6 +64,16 @@ def LCM(*args):
     elif len(args) == 1:
         return args[0]
 
+    if all(isinstance(n, int) and n > 0 for n in args):
+
+        lcm = args[0]
+
+        for n in args[1:]:
+
+            lcm = lcm * n // gcd(lcm, n)
+
+        return lcm
+
     X = list(args)
 
     while any([X[0]!=K for K in X]):
@@ -181,3 +198,128 @@ class dots:
     def __repr__(self):
         return '...'
 
+class DurationIndex(object):
+    """ Finds the position of a time value in a repeating sequence of durations
+        using the cumulative sums of one cycle of durations. An infinite duration
+        stops the sequence from repeating """
+
+    MAX_LENGTH = 65536
+
+    def __init__(self, durations):
+        self.durations = list(durations)
+        self.sums      = list(itertools.accumulate(self.durations))
+        self.length    = len(self.durations)
+        self.total     = self.sums[-1] if self.sums else 0
+
+    def __repr__(self):
+        return "<DurationIndex {}>".format(self.durations)
+
+    @classmethod
+    def from_pattern(cls, pattern, inf=None):
+        """ Returns a DurationIndex for one cycle of a Pattern of durations, or None if
+            the durations are not all non-negative numbers or the cycle is too long.
+            Values equal to `inf` are treated as an infinite duration """
+        try:
+            length = get_expanded_len(pattern.data)
+        except AttributeError:
+            pattern, length = [pattern], 1
+        if length == 0 or length > cls.MAX_LENGTH:
+            return None
+        durations = []
+        for i in range(length):
+            dur = pattern[i]
+            if isinstance(dur, bool) or not isinstance(dur, (int, float)):
+                if inf is not None and inf == dur:
+                    dur = float("inf")
+                else:
+                    return None
+            if dur < 0:
+                return None
+            durations.append(dur)
+        return cls(durations)
+
+    @classmethod
+    def from_numbers(cls, durations):
+        """ Returns a DurationIndex of `durations` converted to floats, or None if
+            they cannot be converted """
+        try:
+            return cls([float(dur) for dur in durations])
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def same_time(a, b):
+        """ Returns True if two times in beats only differ by floating point error """
+        return abs(a - b) <= 1e-9 * max(1.0, abs(b))
+
+    def skip(self, start, time, steps=2):
+        """ Returns a tuple of the index of a duration shortly before the one that ends at
+            or after `time`, when the cycle begins at `start`, and the time it starts. The
+            index is found from the cumulative sums, leaving the last `steps` durations to
+            be added one at a time. The start time can differ from adding every duration
+            to `start` by floating point error, so use `same_time` to compare with `time` """
+        i = max(bisect_left(self.sums, time - start) - steps, 0)
+        return i, (start + self.sums[i - 1] if i > 0 else start)
+
+    def find(self, time):
+        """ Returns a tuple of (index, start, end) for the duration that `time` falls in.
+            The index counts the durations from time 0, so it increases with each cycle """
+        if not self.total > 0:
+            return 0, 0, 0
+        if self.total == float("inf"):
+            cycles, offset = 0, time
+        else:
+            cycles, offset = divmod(time, self.total)
+        i = bisect_right(self.sums, offset)
+        if i >= self.length:
+            # Floating point error put us at the end of the cycle
+            cycles, i = cycles + 1, 0
+        cycle_start = cycles * self.total if cycles else 0
+        start = cycle_start + (self.sums[i - 1] if i > 0 else 0)
+        end   = cycle_start + self.sums[i]
+        return int(cycles) * self.length + i, start, end
+
+class LRUCache(object):
+    """ Dictionary-like cache that holds at most `size` items, removing the least
+        recently used item when it is full. A size of None means no limit """
+    def __init__(self, size=None):
+        self.size = size
+        self.data = OrderedDict()
+
+    def __repr__(self):
+        return "LRUCache({!r})".format(dict(self.data))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        value = self.data[key]
+        self.data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if self.size is not None and len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def get(self, key, default=None):
+        if key in self.data:
+            return self[key]
+        return default
+
+    def clear(self):
+        self.data.clear()
+
+    def resize(self, size):
+        """ Changes the maximum size, removing the least recently used items if needed """
+        self.size = size
+        while size is not None and len(self.data) > size:
+            self.data.popitem(last=False)
+
@@ -10,6 +10,7 @@ from .Code import *
 FoxDotCode.namespace = globals()
 
 from .TempoClock import *
+from .TimeSource import WallClock, MonotonicClock, VirtualClock
 from .Buffers import *
 from .Players import *
 from .Patterns import *
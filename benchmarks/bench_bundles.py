@@ -0,0 +1,36 @@
+"""
+    Measures how many note bundles per second `SCLangServerManager.get_bundle`
+    can build for a player using 5 effects, with and without the pre-encoded
+    bundle templates. Run from the repository root with:
+
+        python -m benchmarks.bench_bundles
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+
+from FoxDot.lib.ServerManager import Server
+
+PACKET = {"amp": 1, "sus": 0.5, "pan": -1, "freq": 440.0, "buf": 3, "rate": 1.0,
+          "lpf": 500, "hpf": 200, "room": 0.3, "echo": 0.5, "chop": 4}
+
+def bundles_per_second(n):
+    t0 = time.perf_counter()
+    for i in range(n):
+        Server.get_bundle("pluck", PACKET, timestamp=1500000000.0 + i).getBinary()
+    return n / (time.perf_counter() - t0)
+
+def main(n=20000):
+    print("Building {} bundles for a player with 5 effects".format(n))
+    for use_templates in (False, True):
+        Server.use_bundle_templates = use_templates
+        label = "templates" if use_templates else "original"
+        print("{:>10}: {:10.0f} bundles/sec".format(label, bundles_per_second(n)))
+    return
+
+if __name__ == "__main__":
+
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,41 @@
+"""
+    Compares CPU usage and block lateness of the polling and event-driven
+    `TempoClock` loops. Run from the repository root with:
+
+        python -m benchmarks.bench_clock_loop [seconds]
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+
+from FoxDot.lib.TempoClock import TempoClock
+
+def run(mode, seconds, bpm=120, step=0.25):
+    clock = TempoClock(bpm=bpm)
+    clock.set_scheduling_mode(mode)
+    clock.start()
+
+    def tick():
+        clock.schedule(tick, clock.now() + step)
+
+    clock.schedule(tick, clock.now() + step)
+    cpu = time.process_time()
+    time.sleep(seconds)
+    cpu = time.process_time() - cpu
+    clock.ticking = False
+    return cpu, clock.get_block_lateness()
+
+def main(seconds=5):
+    print("Running each loop for {} seconds with a block every 1/4 beat at 120 bpm".format(seconds))
+    for mode in ("poll", "event"):
+        cpu, stats = run(mode, seconds)
+        print("{:>6}: cpu {:6.1f}%  blocks {:4d}  mean late {:6.3f} ms  max late {:6.3f} ms".format(
+            mode, 100 * cpu / seconds, stats["blocks"], stats["mean"] * 1000, stats["max"] * 1000))
+    return
+
+if __name__ == "__main__":
+
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,77 @@
+"""
+    Profiles building and sending the events for 32 sample players playing
+    with a duration of 1/8, with and without compiled events. The messages
+    are collected by a stand-in queue block so nothing is sent to the server.
+    Run from the repository root with:
+
+        python -m benchmarks.bench_events [ticks] [profile]
+
+    Setting `profile` to 1 prints the most expensive calls using cProfile.
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+import cProfile
+import pstats
+
+from FoxDot.lib.Players import Player
+from FoxDot.lib.TempoClock import TempoClock
+from FoxDot.lib.Patterns import P
+from FoxDot.lib.TimeVar import var
+from FoxDot.lib.SCLang.SynthDef import SynthDefs
+
+class StubBlock(object):
+    """ Collects the OSC messages that would be sent by a `QueueBlock` """
+    time = 1500000000.0
+    def __init__(self):
+        self.osc_messages = []
+    def append_osc_message(self, message):
+        self.osc_messages.append(message)
+
+def make_players(n=32):
+    Player.set_clock(TempoClock()) # Not running, so the players are never called
+    players = []
+    for i in range(n):
+        player = Player("b{}".format(i))
+        player >> SynthDefs["play1"]("x-o-[--]o(-=)", dur=1/8, sample=[0, 1, 2], amp=[1, 0.5],
+                                     pan=var([-1, 1]), rate=P(1, 2), lpf=2000, room=0.2)
+        players.append(player)
+    return players
+
+def tick(players, block, n):
+    for i in range(n):
+        for player in players:
+            player.event_n = i
+            player.get_event()
+            player.send(timestamp=block.time)
+
+def run(players, n):
+    block = StubBlock()
+    for player in players:
+        player.set_queue_block(block)
+    t0 = time.perf_counter()
+    tick(players, block, n)
+    return (time.perf_counter() - t0), len(block.osc_messages)
+
+def main(n=500, profile=0):
+    players = make_players()
+    print("{} ticks of {} players at dur=1/8".format(n, len(players)))
+    for compiled in (False, True):
+        Player.use_compiled_events = compiled
+        label = "compiled" if compiled else "original"
+        duration, messages = run(players, n)
+        print("{:>10}: {:8.2f} us/event ({} messages)".format(label, duration * 1e6 / (n * len(players)), messages))
+        if profile:
+            profiler = cProfile.Profile()
+            profiler.runcall(run, players, n)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+    for player in players:
+        player.stop()
+    return
+
+if __name__ == "__main__":
+
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,51 @@
+"""
+    Measures the memory used by GeneratorPattern caches while playing a large
+    number of events, with unbounded caches and with the default cache size.
+    Run from the repository root with:
+
+        python -m benchmarks.bench_generator_memory [events]
+
+    PFibMod is left out because its values themselves keep getting larger.
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import sys
+import tracemalloc
+
+from FoxDot.lib.Patterns import GeneratorPattern, PRand, PWhite, PWalk
+
+def make_generators():
+    rand = PRand(0, 7)
+    return [rand, rand + 2, PWhite(0, 1), PWalk()]
+
+def measure(n, cache_size, checkpoints=10):
+    """ Returns the traced memory in KB after every n / checkpoints events """
+    GeneratorPattern.cache_size = cache_size
+    tracemalloc.start()
+    generators = make_generators()
+    base = tracemalloc.get_traced_memory()[0]
+    usage = []
+    step = max(n // checkpoints, 1)
+    for i in range(n):
+        for generator in generators:
+            generator.getitem(i)
+        if (i + 1) % step == 0:
+            usage.append((tracemalloc.get_traced_memory()[0] - base) / 1024)
+    tracemalloc.stop()
+    return usage
+
+def main(n=1000000):
+    default = GeneratorPattern.cache_size
+    print("Memory used by {} generators after each {} events (KB)".format(len(make_generators()), n // 10))
+    for cache_size in (None, default):
+        usage = measure(n, cache_size)
+        label = "unbounded" if cache_size is None else "size {}".format(cache_size)
+        print("{:>10}: {}".format(label, " ".join("{:.0f}".format(kb) for kb in usage)))
+    GeneratorPattern.cache_size = default
+    return
+
+if __name__ == "__main__":
+
+    main(*map(int, sys.argv[1:]))
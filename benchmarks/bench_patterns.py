@@ -0,0 +1,38 @@
+"""
+    Times the length, iteration and arithmetic of laced patterns whose nested
+    patterns have coprime lengths. Run from the repository root with:
+
+        python -m benchmarks.bench_patterns [repeats]
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import sys
+import timeit
+
+from FoxDot.lib.Patterns import P
+from FoxDot.lib.Utils import LCM
+
+def make_pattern(lengths):
+    """ Returns a pattern with one nested pattern of each length in `lengths` """
+    return P[[list(range(n)) for n in lengths]]
+
+def main(repeats=100):
+    cases = [(3, 4), (7, 11, 13), (7, 11, 13, 17)]
+    print("{:>16} {:>8} {:>10} {:>10} {:>10}".format("nested lengths", "len", "len (us)", "iter (ms)", "add (ms)"))
+    for lengths in cases:
+        pattern = make_pattern(lengths)
+        length = len(pattern)
+        t_len = timeit.timeit(lambda: len(pattern), number=repeats * 100) / (repeats * 100)
+        number = max(repeats // 10, 1)
+        t_iter = timeit.timeit(lambda: list(pattern), number=number) / number
+        t_add = timeit.timeit(lambda: pattern + 1, number=number) / number
+        print("{:>16} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}".format(str(lengths), length, t_len * 1e6, t_iter * 1e3, t_add * 1e3))
+    t_lcm = timeit.timeit(lambda: LCM(7, 11, 13, 17, 19), number=repeats) / repeats
+    print("LCM(7, 11, 13, 17, 19): {:.2f} us".format(t_lcm * 1e6))
+    return
+
+if __name__ == "__main__":
+
+    main(*map(int, sys.argv[1:]))
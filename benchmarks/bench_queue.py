@@ -0,0 +1,77 @@
+"""
+    Compares the heap-indexed `TempoClock.Queue` against the previous queue,
+    which kept its blocks in a list and found insert positions with a linear
+    scan. Run from the repository root with:
+
+        python -m benchmarks.bench_queue
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+import random
+
+from FoxDot.lib.TempoClock import Queue, QueueBlock
+
+class StubClock(object):
+    server = None
+
+class LinearQueue(Queue):
+    """ The old `Queue` implementation: blocks in a list sorted by descending beat """
+    def __init__(self, parent):
+        Queue.__init__(self, parent)
+        self.list = []
+
+    def __len__(self):
+        return len(self.list)
+
+    def _insert(self, item, beat, args=(), kwargs={}, is_priority=False):
+        if self.before_next_event(beat):
+            self.list.append(QueueBlock(self, item, beat, args, kwargs, is_priority))
+            return self.list[-1]
+        for block in self.list:
+            if beat == block.beat:
+                block.add(item, args, kwargs, is_priority)
+                return block
+            if beat > block.beat:
+                i = self.list.index(block)
+                self.list.insert(i, QueueBlock(self, item, beat, args, kwargs, is_priority))
+                return self.list[i]
+
+    def pop(self):
+        return self.list.pop() if len(self.list) > 0 else list()
+
+    def before_next_event(self, beat):
+        try:
+            return beat < self.list[-1].beat
+        except IndexError:
+            return True
+
+def callback():
+    return
+
+def run(queue_class, beats):
+    queue = queue_class(StubClock())
+    t0 = time.perf_counter()
+    for beat in beats:
+        queue._insert(callback, beat)
+    t1 = time.perf_counter()
+    while len(queue):
+        queue.pop()
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1
+
+def main(n=10000, seed=0):
+    random.seed(seed)
+    beats = [random.random() * n for i in range(n)]
+    print("Scheduling {} items at distinct beats".format(n))
+    for queue_class in (LinearQueue, Queue):
+        add, pop = run(queue_class, beats)
+        print("{:>12}: add {:8.2f} ms  pop {:8.2f} ms".format(queue_class.__name__, add * 1000, pop * 1000))
+    return
+
+if __name__ == "__main__":
+
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,36 @@
+"""
+    Times rendering a number of minutes of music with `TempoClock.render`, which
+    plays the players as fast as possible instead of in real time. Run from the
+    repository root with:
+
+        python -m benchmarks.bench_render [minutes] [players]
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+
+from FoxDot.lib import Clock
+from FoxDot.lib.Players import Player
+from FoxDot.lib.TempoClock import TempoClock
+from FoxDot.lib.Patterns import P, PRand, PWhite
+from FoxDot.lib.SCLang.SynthDef import SynthDefs
+
+def main(minutes=10, players=4):
+    clock = TempoClock(bpm=120)
+    Player.set_clock(clock)
+    for i in range(players):
+        player = Player("p{}".format(i))
+        player >> SynthDefs["pluck"](PRand(0, 7), dur=P[1/4, 1/4, 1/2], amp=PWhite(0.5, 1), pan=[-1, 1])
+    beats = clock.seconds_to_beats(minutes * 60)
+    start = time.time()
+    score = clock.render(beats, seed=1)
+    elapsed = time.time() - start
+    print("Rendered {} minutes ({} beats, {} bundles) in {:.2f} seconds".format(minutes, beats, len(score), elapsed))
+    return
+
+if __name__ == "__main__":
+
+    main(*map(int, sys.argv[1:]))
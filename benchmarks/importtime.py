@@ -0,0 +1,55 @@
+"""
+    Reports how long each module takes to import when importing FoxDot, using
+    the output of `python -X importtime`. Run from the repository root with:
+
+        python -m benchmarks.importtime [limit] [max_ms]
+
+    Prints the `limit` slowest modules (cumulative time). If `max_ms` is given
+    the script exits with status 1 when the whole import takes longer, so it
+    can be used to catch regressions. Loading FoxDot boots the server manager,
+    so the total includes a short wait for the SuperCollider info.
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+import sys
+import subprocess
+
+line_re = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def import_times(module="FoxDot.lib"):
+    """ Returns a list of (module, self ms, cumulative ms) for importing `module`
+        in a new interpreter, in the order they finished importing """
+    cmd  = [sys.executable, "-X", "importtime", "-c", "import {}".format(module)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            stdin=subprocess.DEVNULL, cwd=os.getcwd())
+    out, err = proc.communicate()
+    times = []
+    for line in err.decode("utf-8", "replace").splitlines():
+        match = line_re.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            times.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return times
+
+def main(limit=25, max_ms=0):
+    times = import_times()
+    if not times:
+        print("Could not read the import times")
+        sys.exit(1)
+    total = times[-1][2]
+    print("{:<50} {:>10} {:>12}".format("module", "self ms", "cumulative"))
+    for name, self_ms, cumulative_ms in sorted(times, key=lambda t: -t[2])[:limit]:
+        print("{:<50} {:>10.1f} {:>12.1f}".format(name, self_ms, cumulative_ms))
+    print("Total: {:.1f}ms".format(total))
+    if max_ms and total > max_ms:
+        print("Importing took longer than {}ms".format(max_ms))
+        sys.exit(1)
+    return
+
+if __name__ == "__main__":
+
+    main(*map(int, sys.argv[1:]))
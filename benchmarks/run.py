@@ -0,0 +1,272 @@
+"""
+    Runs the benchmark suite: the scheduler queue, player events for sample, synth
+    and hybrid players, counting player events, OSC bundles, play string parsing,
+    pattern arithmetic, generator patterns and TimeVars. Players are stepped
+    through with a virtual clock and their messages go to a stand-in server, so
+    nothing is sent and nothing waits on real time. Run from the repository root
+    with:
+
+        python -m benchmarks.run [names] [--save] [--threshold 0.25]
+
+    The time and memory allocated by each benchmark are compared with the saved
+    baselines and any that are more than `threshold` (25%) worse are reported as
+    regressions, in which case the exit status is 1. Use `--save` to store the
+    results as the new baselines. Baselines depend on the machine, so they are
+    kept in benchmarks/baselines.json, which is not committed.
+
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import json
+import random
+import argparse
+import timeit
+import tracemalloc
+
+from FoxDot.lib.Players import Player
+from FoxDot.lib.TempoClock import TempoClock, Queue
+from FoxDot.lib.TimeSource import VirtualClock
+from FoxDot.lib.TimeVar import TimeVar
+from FoxDot.lib.ServerManager import Server, SCLangServerManager
+from FoxDot.lib.Buffers import Samples, ToneSnapshot
+from FoxDot.lib.Patterns import P, PRand, PWhite, PWalk, ParsePlayString
+from FoxDot.lib.Patterns.Parse import parse_cache, build_cache, node_cache
+from FoxDot.lib.SCLang.SynthDef import SynthDefs, SynthDefProxy
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+BENCHMARKS = []
+
+def benchmark(name, number=1000):
+    """ Adds a benchmark to the suite. The decorated function sets up the benchmark
+        and returns a function that is timed `number` times per repeat """
+    def decorator(setup):
+        BENCHMARKS.append((name, number, setup))
+        return setup
+    return decorator
+
+class StubClient(object):
+    """ Counts the OSC messages and datagrams that would have been sent """
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+    def connect(self, address):
+        return
+    def send(self, message):
+        self.messages += 1
+        self.bytes += len(message.getBinary())
+    def sendDatagrams(self, datagrams):
+        for data in datagrams:
+            self.messages += 1
+            self.bytes += len(data)
+
+class StubServer(SCLangServerManager):
+    """ Builds bundles like the SuperCollider server manager but sends them to a
+        `StubClient` instead of SuperCollider """
+    def __init__(self):
+        SCLangServerManager.__init__(self, Server.addr, Server.port, Server.SCLang_port)
+        self.setFx(Server.fxlist)
+        self.synthdefs = Server.synthdefs
+    def reset(self):
+        self.client = StubClient()
+        self.sclang = StubClient()
+
+def make_clock():
+    """ Returns a clock that is stepped through using a virtual clock and sends
+        its messages to a stand-in server """
+    clock = TempoClock(bpm=120)
+    clock.set_time_source(VirtualClock())
+    clock.server = StubServer()
+    Player.set_clock(clock)
+    TimeVar.set_clock(clock)
+    return clock
+
+def make_tone(name="bench"):
+    """ Returns a hybrid tone that plays every note using a few samples """
+    buffers = dict((i, Samples.getBufferFromSymbol(char).bufnum) for i, char in enumerate("abcd"))
+    notes_map = dict((str(midi), (midi % 4, 2 ** ((midi % 12) / 12))) for midi in range(128))
+    return ToneSnapshot.fromNotesMap(1, name, notes_map, buffers)
+
+def callback():
+    return
+
+def play(players, attrs):
+    """ Returns a function that steps a clock playing `players` players through one
+        beat. `attrs` returns the SynthDefProxy for each player """
+    clock = make_clock()
+    for i in range(players):
+        Player("bench{}".format(i)) >> attrs(i)
+    # Players start at the next bar
+    clock.step(clock.beat_dur(clock.next_bar() - clock.now()))
+    return lambda: clock.step(clock.beat_dur(1))
+
+@benchmark("queue.add_pop", number=20)
+def bench_queue():
+    clock = TempoClock()
+    beats = [random.random() * 1000 for i in range(1000)]
+    def run():
+        queue = Queue(clock)
+        for beat in beats:
+            queue.add(callback, beat)
+        while len(queue):
+            queue.pop()
+    return run
+
+@benchmark("players.sample", number=20)
+def bench_sample_players():
+    return play(8, lambda i: SynthDefs["play1"]("x-o-[--]o(-=)", dur=1/4, sample=[0, 1, 2], amp=[1, 0.5], pan=[-1, 1], room=0.2))
+
+@benchmark("players.synth", number=20)
+def bench_synth_players():
+    return play(8, lambda i: SynthDefs["pluck"]([0, 2, (4, 6), 7], dur=1/4, oct=P[4, 5, 6], amp=PWhite(0.5, 1), lpf=2000, chop=2))
+
+@benchmark("players.hybrid", number=20)
+def bench_hybrid_players():
+    tone = make_tone()
+    return play(8, lambda i: SynthDefProxy("hybrid", [0, 2, 4, 7], {"tone": tone, "dur": 1/4, "oct": P[4, 5], "amp": 0.8}))
+
+def count_player(indexed):
+    """ Returns a function that counts the events of a player with 2000 irregular
+        durations at random times, with or without the DurationIndex """
+    clock = make_clock()
+    player = Player("bench")
+    player.current_dur = [random.randint(1, 12) / 6 for i in range(2000)]
+    player.count(0)
+    if not indexed:
+        player.dur_index = player.dur_index[:2] + (None,)
+    times = [random.random() * 100000 for i in range(100)]
+    def run():
+        for time in times:
+            player.count(time)
+    return run
+
+@benchmark("players.count", number=20)
+def bench_count():
+    return count_player(True)
+
+@benchmark("players.count_walk", number=5)
+def bench_count_walk():
+    return count_player(False)
+
+@benchmark("server.get_bundle", number=2000)
+def bench_bundles():
+    server = StubServer()
+    packet = {"amp": 1, "sus": 0.5, "pan": -1, "freq": 440.0, "buf": 3, "rate": 1.0,
+              "lpf": 500, "hpf": 200, "room": 0.3, "echo": 0.5, "chop": 4}
+    return lambda: server.get_bundle("pluck", dict(packet), timestamp=1500000000.0).getBinary()
+
+@benchmark("parse.play_string", number=200)
+def bench_parse():
+    string = "x-o-[--]o(-=)<  * ><..[ss]|a2|>{xo[+=]}(x[oo])" * 2
+    def run():
+        for cache in (parse_cache, build_cache, node_cache):
+            cache.clear()
+        ParsePlayString(string)
+    return run
+
+@benchmark("parse.play_string_cached", number=2000)
+def bench_parse_cached():
+    string = "x-o-[--]o(-=)<  * ><..[ss]|a2|>{xo[+=]}(x[oo])" * 2
+    return lambda: ParsePlayString(string)
+
+@benchmark("patterns.operations", number=200)
+def bench_operations():
+    a = P[0, 2, [4, 5], (7, 9), 3, 1]
+    b = P[1, 2, 3, 4, 5, 6, 7]
+    return lambda: ((a + b) * 2 - a) / (b + 1) % 7
+
+@benchmark("patterns.generators", number=200)
+def bench_generators():
+    rand = PRand(0, 7)
+    generators = [rand, rand + 2, PWhite(0, 1) * 4, PWalk()]
+    counter = [0]
+    def run():
+        start = counter[0]
+        counter[0] += 16
+        for generator in generators:
+            for i in range(start, start + 16):
+                generator.getitem(i)
+    return run
+
+@benchmark("timevar.now", number=5000)
+def bench_timevar():
+    clock = make_clock()
+    timevar = TimeVar([0, 2, 4, 5, 7, 9], [4, 2, 2, 1, 1, 6])
+    def run():
+        clock.time_source.advance(0.01)
+        timevar.now()
+    return run
+
+def measure(number, setup, repeat=5):
+    """ Returns the best time for one call and the peak memory allocated by one call """
+    random.seed(0)
+    func = setup()
+    func() # Warm up any caches
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {"time": best, "memory": max(peak, 0)}
+
+def load_baselines(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def compare(result, baseline, threshold):
+    """ Returns a list of the measurements that are more than `threshold` worse than
+        the baseline """
+    worse = []
+    for key in ("time", "memory"):
+        if key in baseline and result[key] > baseline[key] * (1 + threshold) + (key == "memory") * 1024:
+            worse.append("{} +{:.0%}".format(key, result[key] / baseline[key] - 1 if baseline[key] else 1))
+    return worse
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Runs the FoxDot benchmark suite")
+    parser.add_argument("names", nargs="*", help="only run benchmarks whose names start with these")
+    parser.add_argument("--save", action="store_true", help="save the results as the baselines")
+    parser.add_argument("--threshold", type=float, default=0.25, help="fraction worse than the baseline that is a regression")
+    parser.add_argument("--baselines", default=BASELINES, help="baselines file")
+    parser.add_argument("--repeat", type=int, default=7, help="number of times each benchmark is timed, the best is used")
+    args = parser.parse_args(args)
+
+    baselines = load_baselines(args.baselines)
+    metro = Player.metro
+    regressions = []
+    print("{:<28} {:>12} {:>12} {:>12}  {}".format("benchmark", "time (us)", "baseline", "memory (KB)", "result"))
+    try:
+        for name, number, setup in BENCHMARKS:
+            if args.names and not any(name.startswith(prefix) for prefix in args.names):
+                continue
+            result = measure(number, setup, args.repeat)
+            baseline = baselines.get(name, {})
+            worse = compare(result, baseline, args.threshold)
+            if worse:
+                regressions.append(name)
+            status = "REGRESSION ({})".format(", ".join(worse)) if worse else ("ok" if baseline else "no baseline")
+            print("{:<28} {:>12.2f} {:>12} {:>12.1f}  {}".format(name, result["time"] * 1e6,
+                  "{:.2f}".format(baseline["time"] * 1e6) if "time" in baseline else "-", result["memory"] / 1024, status))
+            baselines[name] = result
+    finally:
+        Player.set_clock(metro)
+        TimeVar.set_clock(metro)
+    if args.save:
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=4, sort_keys=True)
+        print("Saved baselines to {}".format(args.baselines))
+    elif regressions:
+        print("{} regression(s) more than {:.0%} worse than the baseline".format(len(regressions), args.threshold))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -3,9 +3,15 @@ import os
 import shutil
 import tempfile
 import unittest
+import wave
+from contextlib import closing
 from os.path import join
 
-from FoxDot.lib.Buffers import BufferManager
+from FoxDot.lib import Buffers
+from FoxDot.lib.Buffers import BufferManager, ToneSnapshot, ToneCache, SampleInfoCache
+from FoxDot.lib.Players import Player
+from FoxDot.lib.TempoClock import TempoClock
+from FoxDot.lib.SCLang.SynthDef import SynthDefProxy
 
 
 class TestSampleSearch(unittest.TestCase):
@@ -107,3 +113,356 @@ class TestSampleSearch(unittest.TestCase):
         sample = '**/house/*'
         found = self.bm._findSample(sample)
         self.assertEqual(found, self._housekick)
+
+
+class TestToneSnapshot(unittest.TestCase):
+
+    """ Test the cached copy of a hybrid tone's note map """
+    def setUp(self):
+        super(TestToneSnapshot, self).setUp()
+        notes_map = {"60": [7, 1.0], "62": [8, 1.5], "48": [7, 0.5], "50": [99, 0.6]}
+        self.tone = ToneSnapshot.fromNotesMap(1, "bass", notes_map, {7: 3, 8: 4})
+
+    def test_notes(self):
+        """ Notes are looked up by MIDI number """
+        self.assertEqual(len(self.tone.notes), 128)
+        self.assertEqual(self.tone.get(60), (3, 1.0, 1.0))
+        self.assertEqual(self.tone.get(62), (4, 1.5, 1.5))
+        self.assertEqual(self.tone.get(48), (3, 0.5, 1 / (0.5 ** 1.7)))
+
+    def test_missing_notes(self):
+        """ Notes without a loaded sample or out of range are None """
+        self.assertIsNone(self.tone.get(50))
+        self.assertIsNone(self.tone.get(61))
+        self.assertIsNone(self.tone.get(128))
+        self.assertIsNone(self.tone.get(-1))
+
+    def test_read_only(self):
+        """ Snapshots cannot be changed """
+        with self.assertRaises(AttributeError):
+            self.tone.notes = ()
+
+
+class TestSampleIndex(unittest.TestCase):
+
+    """ Test that sample searches are cached until the directories change """
+    def setUp(self):
+        super(TestSampleIndex, self).setUp()
+        self.wd = tempfile.mkdtemp()
+        self.bm = BufferManager()
+        self.bm._paths = [self.wd]
+        self.bm._index.ttl = 0
+        os.mkdir(join(self.wd, 'hats'))
+        self._hat2 = self.touch('hats/hat2.wav')
+
+    def tearDown(self):
+        super(TestSampleIndex, self).tearDown()
+        shutil.rmtree(self.wd)
+
+    def touch(self, filename):
+        fullpath = join(self.wd, filename)
+        open(fullpath, 'w').close()
+        # Make sure the directory looks modified
+        dirname = os.path.dirname(fullpath)
+        mtime = os.stat(dirname).st_mtime + 10
+        os.utime(dirname, (mtime, mtime))
+        return fullpath
+
+    def test_cached(self):
+        """ Searches are remembered """
+        self.assertEqual(self.bm._findSample('hats', 0), self._hat2)
+        self.assertEqual(self.bm._index.get('hats', 0), self._hat2)
+
+    def test_directory_changed(self):
+        """ New samples are found once the directory has changed """
+        self.assertEqual(self.bm._findSample('hats', 0), self._hat2)
+        hat1 = self.touch('hats/hat1.wav')
+        self.assertEqual(self.bm._findSample('hats', 0), hat1)
+        self.assertEqual(self.bm._findSample('hat*', 1), self._hat2)
+
+    def test_not_found(self):
+        """ Searches that find nothing are remembered until a directory changes """
+        self.assertIsNone(self.bm._findSample('snare', 0))
+        self.assertIn(('snare', 0), self.bm._index)
+        searches = []
+        search = self.bm._searchSample
+        self.bm._searchSample = lambda *args: searches.append(args) or search(*args)
+        self.assertIsNone(self.bm._findSample('snare', 0))
+        self.assertEqual(searches, [])
+        os.mkdir(join(self.wd, 'snares'))
+        snare = self.touch('snares/snare.wav')
+        self.assertEqual(self.bm._findSample('snare', 0), snare)
+        self.assertEqual(searches, [('snare', 0)])
+
+    def test_absolute_not_found(self):
+        """ A missing absolute path is searched again once its directory changes """
+        kick = join(self.wd, 'hats', 'kick.wav')
+        self.assertIsNone(self.bm._findSample(kick, 0))
+        self.touch('hats/kick.wav')
+        self.assertEqual(self.bm._findSample(kick, 0), kick)
+
+    def test_ttl(self):
+        """ Directories are not checked again until the ttl has passed """
+        self.bm._index.ttl = 60
+        self.assertEqual(self.bm._findSample('hats', 0), self._hat2)
+        self.touch('hats/hat1.wav')
+        self.assertEqual(self.bm._findSample('hats', 0), self._hat2)
+
+    def test_add_path(self):
+        """ Adding a search path clears the index """
+        other = tempfile.mkdtemp()
+        try:
+            os.mkdir(join(other, 'hats'))
+            hat0 = join(other, 'hats', 'hat0.wav')
+            open(hat0, 'w').close()
+            self.bm._index.ttl = 60
+            self.assertEqual(self.bm._findSample('hat*', 1), self._hat2)
+            self.bm.addPath(other)
+            self.assertEqual(self.bm._findSample('hat*', 1), hat0)
+        finally:
+            shutil.rmtree(other)
+
+
+class StubServer(object):
+
+    """ Stand-in for the SuperCollider server that records buffer messages """
+    max_buffers = 1024
+
+    def __init__(self):
+        self.loaded = {}
+        self.freed = 0
+
+    def bufferRead(self, path, bufnum):
+        assert bufnum not in self.loaded, "Buffer %d is already loaded" % bufnum
+        self.loaded[bufnum] = path
+
+    def bufferFree(self, bufnum):
+        del self.loaded[bufnum]
+        self.freed += 1
+
+
+class StubHybridDB(object):
+
+    """ Stand-in for the hybrid tone database with one tone using two samples """
+    tone_version = 1
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def get_tone_version(self):
+        return self.tone_version
+
+    def get_tone_info(self, name):
+        return {"id": 1, "name": name, "folder": self.folder, "samples": [0, 1],
+                "notes_map": {"60": [0, 1.0], "62": [1, 1.0]}}
+
+
+class TestBufferEviction(unittest.TestCase):
+
+    """ Test that buffers are reused when all the buffer numbers are used """
+    @classmethod
+    def setUpClass(cls):
+        cls.wd = tempfile.mkdtemp()
+        cls.files = []
+        for i in range(10000):
+            path = join(cls.wd, "s%05d.wav" % i)
+            with closing(wave.open(path, "wb")) as snd:
+                snd.setnchannels(1)
+                snd.setsampwidth(2)
+                snd.setframerate(44100)
+                snd.writeframes(b"\x00\x00")
+            cls.files.append(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.wd)
+
+    def setUp(self):
+        self.server = StubServer()
+        self.bm = BufferManager(server=self.server, info=SampleInfoCache())
+
+    def test_cycle_samples(self):
+        """ 10k samples can be loaded using 1024 buffers """
+        for path in self.files:
+            bufnum = self.bm.loadBuffer(path)
+            self.assertEqual(self.server.loaded[bufnum], path)
+        self.assertEqual(self.bm.evictions, 10000 - 1023)
+        self.assertEqual(self.server.freed, self.bm.evictions)
+        self.assertEqual(self.bm.stats()["loaded"], 1023)
+
+    def test_least_recently_used(self):
+        """ The least recently used buffer is freed first """
+        first = [self.bm.loadBuffer(path) for path in self.files[:1023]]
+        self.bm.loadBuffer(self.files[0])
+        bufnum = self.bm.loadBuffer(self.files[1023])
+        self.assertEqual(bufnum, first[1])
+        self.assertIn(self.files[0], self.server.loaded.values())
+
+    def test_users_not_freed(self):
+        """ Buffers used by a player are not freed until it releases them """
+        user = object()
+        kept = self.bm.loadBuffer(self.files[0])
+        self.bm.useBuffer(kept, user)
+        for path in self.files[1:3000]:
+            self.bm.loadBuffer(path)
+        self.assertEqual(self.server.loaded[kept], self.files[0])
+        self.bm.release(user)
+        for path in self.files[3000:4100]:
+            self.bm.loadBuffer(path)
+        self.assertNotIn(self.files[0], self.server.loaded.values())
+
+    def test_snapshot_not_freed(self):
+        """ Buffers in a hybrid tone are not freed while a player uses the tone """
+        samples, metro = Player.samples, Player.metro
+        Player.set_sample_bank(self.bm)
+        Player.set_clock(TempoClock())
+        try:
+            buffers = dict((i, self.bm.loadBuffer(path)) for i, path in enumerate(self.files[:2]))
+            notes_map = {"60": [0, 1.0], "62": [1, 1.0]}
+            tone = ToneSnapshot.fromNotesMap(1, "test", notes_map, buffers)
+            player = Player("test")
+            player >> SynthDefProxy("hybrid", [0, 1], {"tone": tone})
+            for path in self.files[2:3000]:
+                self.bm.loadBuffer(path)
+            for sample, bufnum in buffers.items():
+                self.assertEqual(self.server.loaded[bufnum], self.files[sample])
+            player.stop()
+            for path in self.files[3000:4100]:
+                self.bm.loadBuffer(path)
+            self.assertNotIn(self.files[0], self.server.loaded.values())
+        finally:
+            Player.set_sample_bank(samples)
+            Player.set_clock(metro)
+
+    def test_cached_tone_not_freed(self):
+        """ Buffers in a cached tone are not freed until the tone is reloaded """
+        hybriddb = StubHybridDB(self.wd)
+        tones = ToneCache(bank=self.bm)
+        tone = tones.load("bass", hybriddb)
+        for path in self.files[2:3000]:
+            self.bm.loadBuffer(path)
+        self.assertEqual(sorted(self.server.loaded[bufnum] for bufnum in tone.bufnums()), self.files[:2])
+        self.assertTrue(tones.loaded("bass"))
+        hybriddb.tone_version += 1
+        tones.load("bass", hybriddb)
+        self.assertEqual(self.bm._users.get(tone), None)
+        tones.clear()
+        for path in self.files[3000:4100]:
+            self.bm.loadBuffer(path)
+        self.assertNotIn(self.files[0], self.server.loaded.values())
+
+    def test_cached_tone_checks(self):
+        """ A cached tone is rebuilt when the database version changes, and its
+            buffers are only checked again after one has been freed """
+        hybriddb = StubHybridDB(self.wd)
+        tones = ToneCache(bank=self.bm)
+        get_hybriddb, Buffers.get_hybriddb = Buffers.get_hybriddb, lambda: hybriddb
+        try:
+            tone = tones["bass"]
+            self.assertIs(tones["bass"], tone)
+            checked = []
+            getBuffer = self.bm.getBuffer
+            self.bm.getBuffer = lambda bufnum: checked.append(bufnum) or getBuffer(bufnum)
+            for i in range(10):
+                self.assertIs(tones["bass"], tone)
+            self.assertEqual(checked, [])
+            self.bm.free(self.bm.loadBuffer(self.files[5000]))
+            self.assertIs(tones["bass"], tone)
+            self.assertEqual(sorted(checked), sorted(tone.bufnums()))
+            hybriddb.tone_version += 1
+            self.assertIsNot(tones["bass"], tone)
+        finally:
+            Buffers.get_hybriddb = get_hybriddb
+            tones.clear()
+
+    def test_full(self):
+        """ An error is raised when every buffer is in use """
+        user = object()
+        for path in self.files[:1023]:
+            self.bm.useBuffer(self.bm.loadBuffer(path), user)
+        with self.assertRaises(RuntimeError):
+            self.bm.loadBuffer(self.files[1023])
+
+
+class TestSampleInfoCache(unittest.TestCase):
+
+    """ Test the cache of sample file headers """
+    def setUp(self):
+        super(TestSampleInfoCache, self).setUp()
+        self.wd = tempfile.mkdtemp()
+        self.sample = join(self.wd, 'stereo.wav')
+        self.write(self.sample, 2, 100)
+        self.cachefile = join(self.wd, 'info.json')
+
+    def tearDown(self):
+        super(TestSampleInfoCache, self).tearDown()
+        shutil.rmtree(self.wd)
+
+    def write(self, path, channels, frames):
+        with closing(wave.open(path, "wb")) as snd:
+            snd.setnchannels(channels)
+            snd.setsampwidth(2)
+            snd.setframerate(22050)
+            snd.writeframes(b"\x00\x00" * channels * frames)
+
+    def test_read(self):
+        """ Headers are read once """
+        cache = SampleInfoCache()
+        info = cache.get(self.sample)
+        self.assertEqual((info["channels"], info["frames"], info["samplerate"]), (2, 100, 22050))
+        cache.get(self.sample)
+        self.assertEqual(cache.reads, 1)
+
+    def test_saved(self):
+        """ Entries are shared with new caches using the same file """
+        cache = SampleInfoCache([self.cachefile])
+        cache.get(self.sample)
+        self.assertEqual(cache.save(), self.cachefile)
+        cache = SampleInfoCache([self.cachefile])
+        self.assertEqual(cache.get(self.sample)["channels"], 2)
+        self.assertEqual(cache.reads, 0)
+
+    def test_modified(self):
+        """ Entries are read again when the file changes """
+        cache = SampleInfoCache()
+        cache.get(self.sample)
+        self.write(self.sample, 1, 300)
+        mtime = os.stat(self.sample).st_mtime + 10
+        os.utime(self.sample, (mtime, mtime))
+        info = cache.get(self.sample)
+        self.assertEqual((info["channels"], info["frames"]), (1, 300))
+        self.assertEqual(cache.reads, 2)
+
+    def test_not_writable(self):
+        """ The next file is used if the first can't be written """
+        cache = SampleInfoCache([join(self.wd, 'missing', 'info.json'), self.cachefile])
+        cache.get(self.sample)
+        self.assertEqual(cache.save(), self.cachefile)
+
+    def test_same_file(self):
+        """ The cache is saved to the file it was read from """
+        other = join(self.wd, 'other.json')
+        cache = SampleInfoCache([other])
+        cache.get(self.sample)
+        cache.save()
+        # The first file can be written to, but the cache was read from the second
+        cache = SampleInfoCache([self.cachefile, other])
+        self.assertEqual(cache.get(self.sample)["channels"], 2)
+        self.assertEqual(cache.reads, 0)
+        cache.clear()
+        self.assertEqual(cache.save(), other)
+        self.assertFalse(os.path.exists(self.cachefile))
+
+    def test_newest_file(self):
+        """ The most recently written file is read """
+        self.write(join(self.wd, 'mono.wav'), 1, 100)
+        for filename, sample in ((self.cachefile, 'stereo.wav'), (join(self.wd, 'other.json'), 'mono.wav')):
+            cache = SampleInfoCache([filename])
+            cache.get(join(self.wd, sample))
+            cache.save()
+        mtime = os.stat(self.cachefile).st_mtime - 10
+        os.utime(self.cachefile, (mtime, mtime))
+        cache = SampleInfoCache([self.cachefile, join(self.wd, 'other.json')])
+        cache.load()
+        self.assertEqual(list(cache.entries), [join(self.wd, 'mono.wav')])
+        self.assertEqual(cache.filename, join(self.wd, 'other.json'))
@@ -1,7 +1,8 @@
 import unittest
 
 from FoxDot.lib.Patterns import GeneratorPattern
-from FoxDot.lib.Patterns import P
+from FoxDot.lib.Patterns import P, PRand, PFibMod
+from FoxDot.lib.Utils import LRUCache
 
 class TestPatternMethods(unittest.TestCase):
     def test_from_func(self):
@@ -15,6 +16,35 @@ class TestPatternMethods(unittest.TestCase):
         self.assertEqual(pattern[:4], P[1, 1, 1, 2])
 
 
+class TestGeneratorCache(unittest.TestCase):
+    def tearDown(self):
+        GeneratorPattern.cache_size = 4096
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache[1] = "a"
+        cache[2] = "b"
+        self.assertEqual(cache[1], "a")
+        cache[3] = "c"
+        self.assertNotIn(2, cache)
+        self.assertEqual(cache.get(2, "x"), "x")
+        self.assertEqual(len(cache), 2)
+        cache.resize(1)
+        self.assertEqual(list(cache.data), [3])
+
+    def test_bounded(self):
+        GeneratorPattern.cache_size = 16
+        pattern = PRand(0, 1000)
+        values = [pattern.getitem(i) for i in range(100)]
+        self.assertEqual(len(pattern.cache), 16)
+        self.assertEqual([pattern.getitem(i) for i in range(84, 100)], values[84:])
+
+    def test_fibonacci(self):
+        GeneratorPattern.cache_size = 4
+        pattern = PFibMod()
+        self.assertEqual([pattern.getitem(i) for i in range(12)], [0, 1, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89])
+
+
 if __name__ == "__main__":
 
     unittest.main()
@@ -0,0 +1,101 @@
+""" Tests for the hybrid sample database note mapping """
+import os
+import csv
+import random
+import shutil
+import tempfile
+import unittest
+
+from music21 import pitch
+
+from FoxDot.lib.Extensions import hybriddb
+from FoxDot.lib.Extensions.hybriddb import make_notes_map, detectNotes, writeReviewReport
+
+
+def reference_map(samples):
+    """ The mapping made by looping over every note and sample with music21 """
+    notes_map = {}
+    for midi in range(0, 127):
+        lowscore, lowsample = 1000000000, None
+        for s_id, s_midi in samples:
+            score = (abs(s_midi - midi) ** 2) + (0.6 if s_midi > midi else 0)
+            if score < lowscore:
+                lowscore, lowsample = score, (s_id, s_midi)
+        if lowsample:
+            rate = pitch.Pitch(midi=midi).frequency / pitch.Pitch(midi=lowsample[1]).frequency
+            notes_map[midi] = (lowsample[0], rate)
+        else:
+            notes_map[midi] = (None, None)
+    return notes_map
+
+
+class TestNotesMap(unittest.TestCase):
+
+    def test_empty(self):
+        """ Tones without samples map every note to nothing """
+        self.assertEqual(make_notes_map([]), reference_map([]))
+
+    def test_matches_reference(self):
+        """ Maps are the same as the music21 version """
+        rand = random.Random(1)
+        for n in (1, 2, 5, 60):
+            samples = [(i + 1, rand.randint(20, 100)) for i in range(n)]
+            self.assertEqual(make_notes_map(samples), reference_map(samples))
+
+    def test_prefers_lower_sample(self):
+        """ A lower sample is used when two are the same distance away """
+        notes_map = make_notes_map([(1, 62), (2, 58)])
+        self.assertEqual(notes_map[60][0], 2)
+
+
+class TestToneVersion(unittest.TestCase):
+
+    def test_tone_changed(self):
+        """ Changes to tones in this process change the version """
+        version = hybriddb.get_tone_version()
+        hybriddb.tone_changed()
+        self.assertNotEqual(hybriddb.get_tone_version(), version)
+
+    def test_database_written(self):
+        """ The version changes when the database file is written by another process """
+        version = hybriddb.get_tone_version()
+        stat = os.stat(hybriddb.dbfilename)
+        try:
+            os.utime(hybriddb.dbfilename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertNotEqual(hybriddb.get_tone_version(), version)
+        finally:
+            os.utime(hybriddb.dbfilename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(hybriddb.get_tone_version(), version)
+
+
+class TestBatchDetection(unittest.TestCase):
+
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.files = []
+        for name in ("bass_C4.wav", "bass_e3.wav", "bass_A#2.wav"):
+            path = os.path.join(self.wd, name)
+            open(path, 'w').close()
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def test_detect_notes(self):
+        """ Notes in filenames are detected in worker processes """
+        results = sorted(detectNotes(self.files, workers=2))
+        self.assertEqual(results, sorted([(self.files[0], 60, 1.0), (self.files[1], 52, 1.0), (self.files[2], 46, 1.0)]))
+
+    def test_review_report(self):
+        """ Samples needing review are written as CSV """
+        report = writeReviewReport(os.path.join(self.wd, "review.csv"),
+                                   [(self.files[0], 60, 0.5, "low confidence"), (self.files[1], None, 0.0, "no note found")])
+        with open(report) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ["path", "midi", "confidence", "reason"])
+        self.assertEqual(rows[1], [self.files[0], "60", "0.50", "low confidence"])
+        self.assertEqual(rows[2], [self.files[1], "", "0.00", "no note found"])
+
+
+if __name__ == "__main__":
+    unittest.main()
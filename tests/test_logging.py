@@ -0,0 +1,48 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from FoxDot.lib.Logging import RingBuffer, Telemetry
+
+class TestRingBuffer(unittest.TestCase):
+    def test_keeps_recent_values(self):
+        buffer = RingBuffer(10)
+        for i in range(25):
+            buffer.append(i)
+        self.assertEqual(list(buffer), list(range(15, 25)))
+        self.assertEqual(buffer.count, 25)
+
+    def test_summary(self):
+        buffer = RingBuffer(1000)
+        for i in range(101):
+            buffer.append(100 - i)
+        summary = buffer.summary()
+        self.assertEqual(summary["count"], 101)
+        self.assertEqual(summary["mean"], 50)
+        self.assertEqual(summary["max"], 100)
+        self.assertEqual((summary["p50"], summary["p90"], summary["p99"]), (50, 90, 99))
+
+    def test_empty(self):
+        self.assertEqual(RingBuffer().summary(), {"count": 0, "mean": 0.0, "max": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0})
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+    def test_export(self):
+        stats = Telemetry(size=4)
+        for i in range(6):
+            stats.add("send", i)
+        stats.add("bytes", 100)
+        filename = os.path.join(self.wd, "stats.json")
+        stats.export(filename)
+        with open(filename) as f:
+            data = json.load(f)
+        self.assertEqual(data["values"], {"send": [2, 3, 4, 5], "bytes": [100]})
+        self.assertEqual(data["summary"]["send"]["count"], 6)
+        self.assertEqual(data["summary"]["bytes"]["max"], 100)
@@ -5,6 +5,81 @@ from FoxDot.lib import Patterns
 class TestPatternMethods(unittest.TestCase):
     pass
 
+class TestPatternLength(unittest.TestCase):
+    def test_lcm(self):
+        self.assertEqual(Patterns.Main.LCM(7, 11, 13), 1001)
+        self.assertEqual(Patterns.Main.LCM(4, 0, 6), 12)
+        self.assertEqual(Patterns.Main.LCM(), 1)
+
+    def test_cached_length(self):
+        nested = Patterns.Pattern([1, 2])
+        pattern = Patterns.Pattern([0, nested])
+        self.assertEqual(len(pattern), 4)
+        nested.append(3)
+        self.assertEqual(len(pattern), 6)
+        pattern.append(4)
+        self.assertEqual(len(pattern), 9)
+        pattern[2] = [5, 6]
+        self.assertEqual(len(pattern), 18)
+        pattern.data = [1]
+        self.assertEqual(len(pattern), 1)
+
+class TestPlayStringParsing(unittest.TestCase):
+    def test_match_brackets(self):
+        self.assertEqual(Patterns.Parse.match_brackets("x[(o)]|a1|"), {1: 5, 2: 4, 6: 9})
+
+    def test_parse(self):
+        pattern = Patterns.Pattern("x-[xo](o-)|*2|")
+        self.assertEqual(pattern[0], "x")
+        self.assertEqual(pattern[2], Patterns.PGroupPlus("x", "o"))
+        self.assertEqual(pattern[3], "o")
+        self.assertEqual(pattern[8], "-")
+        self.assertIsInstance(pattern[4], Patterns.PGroupOr)
+
+    def test_cached_tree(self):
+        string = "x{o*}<-x>"
+        first = Patterns.Parse.parse_tree(string)
+        self.assertIs(Patterns.Parse.parse_tree(string), first)
+        # Generators are created on each parse
+        self.assertIsNot(Patterns.Pattern(string).data[1], Patterns.Pattern(string).data[1])
+
+    def test_cached_items(self):
+        string = "x[--](o[xo])<-x>"
+        first, second = Patterns.Parse.ParsePlayString(string), Patterns.Parse.ParsePlayString(string)
+        self.assertIn(string, Patterns.Parse.build_cache)
+        # Cached items are copied so that nothing is shared between parses
+        self.assertEqual(first, second)
+        for i in range(1, 4):
+            self.assertIsNot(first[i], second[i])
+        # Items with generators are built on every parse but the '<>' layers are cached
+        string = "x{xo}[-{*=}]-[--]<o-><x>"
+        first, second = Patterns.Parse.ParsePlayString(string), Patterns.Parse.ParsePlayString(string)
+        self.assertNotIn(string, Patterns.Parse.build_cache)
+        self.assertIsNot(first[1], second[1])
+        self.assertIsNot(first[2], second[2])
+        self.assertEqual(first[4], second[4])
+        self.assertEqual(str(first[5]), str(second[5]))
+        self.assertIsNot(first[5], second[5])
+        self.assertIn(Patterns.Parse.parse_tree(string)[0][-2:], Patterns.Parse.node_cache)
+
+    def test_cached_items_are_not_changed(self):
+        pattern = Patterns.Pattern("<xo->")
+        pattern[0] = "="
+        self.assertEqual(Patterns.Pattern("<xo->")[0], "x")
+        # Changes to nested items
+        pattern = Patterns.Pattern("<x(o-)>")
+        pattern[1] = "*"
+        self.assertEqual(Patterns.Pattern("<x(o-)>").data, ["x", Patterns.Pattern(["o", "-"])])
+        Patterns.Pattern("x[--]").data[1].data.append("o")
+        self.assertEqual(Patterns.Pattern("x[--]").data[1], Patterns.PGroupPlus("-", "-"))
+        Patterns.Pattern("x{o[--]}").data[1].data[1].data.append("o")
+        self.assertEqual(Patterns.Pattern("x{o[--]}").data[1].data[1], Patterns.PGroupPlus("-", "-"))
+
+    def test_errors(self):
+        for string in ("x(o", "x|o", "x[]", "|x1o|"):
+            with self.assertRaises(Patterns.ParseError):
+                Patterns.Parse.feed(string)
+
 if __name__ == "__main__":
 
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,284 @@
+import os
+import json
+import random
+import shutil
+import socket
+import tempfile
+import unittest
+from fractions import Fraction
+
+from FoxDot.lib import Clock
+from FoxDot.lib.Players import Player
+from FoxDot.lib.Repeat import MethodCall
+from FoxDot.lib.TempoClock import TempoClock
+from FoxDot.lib.TimeSource import VirtualClock
+from FoxDot.lib.ServerManager import Server, SCLangServerManager, OSCClientWrapper
+from FoxDot.lib.Patterns import P, PRand, PWhite, asStream
+from FoxDot.lib.TimeVar import var
+from FoxDot.lib.SCLang.SynthDef import SynthDefs
+
+class TestCompiledEvents(unittest.TestCase):
+    """ Checks that compiled events are the same as evaluating every attribute """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.metro = Player.metro
+        clock = TempoClock()
+        # Stop the beat (and so var values) changing between the runs being compared
+        clock.set_time_source(VirtualClock())
+        Player.set_clock(clock)
+
+    @classmethod
+    def tearDownClass(cls):
+        Player.set_clock(cls.metro)
+        Player.use_compiled_events = True
+
+    def get_events(self, compiled, n=24, **kwargs):
+        Player.use_compiled_events = compiled
+        player = Player("test")
+        player >> SynthDefs["pluck"]([0, 2, [4, 5], P(0, 2)], **kwargs)
+        events = []
+        for i in range(n):
+            player.event_n = i
+            events.append(dict(player.get_event().event))
+        player.stop()
+        return events
+
+    def test_static_attributes(self):
+        kwargs = dict(dur=[1, 1/2, P(1/4, 1/2)], amp=1, pan=[-1, 1], oct=var([4, 5]), sus=2)
+        self.assertEqual(self.get_events(True, **kwargs), self.get_events(False, **kwargs))
+
+    def test_recompile_on_change(self):
+        Player.use_compiled_events = True
+        player = Player("test")
+        player >> SynthDefs["pluck"]([0, 1], amp=1)
+        self.assertEqual(player.get_event().event["amp"], 1)
+        player.amp = [2, 3]
+        self.assertEqual(player.get_event().event["amp"], 2)
+        player.event_n = 1
+        self.assertEqual(player.get_event().event["amp"], 3)
+        player.stop()
+
+    def test_recompile_on_edit(self):
+        Player.use_compiled_events = True
+        player = Player("test")
+        amp, pan = P[1], P[-1, 1]
+        player >> SynthDefs["pluck"]([0, 1], amp=amp, pan=pan)
+        self.assertEqual(player.get_event().event["amp"], 1)
+        amp[0] = 2
+        self.assertEqual(player.get_event().event["amp"], 2)
+        player.attr["amp"][0] = 3
+        self.assertEqual(player.get_event().event["amp"], 3)
+        pan[0] = P(-1, 1)
+        self.assertEqual(player.get_event().event["pan"], P(-1, 1))
+        player.stop()
+
+def walk_player_count(durations, now, event_after=False):
+    """ The original Player.count walk. Called with Fractions it gives the exact answer """
+    total_dur = sum(durations)
+    acc = now - (now % total_dur)
+    n = int(len(durations) * (acc / total_dur))
+    if acc != now:
+        while True:
+            dur = durations[n % len(durations)]
+            if acc + dur == now:
+                acc += dur
+                n += 1
+                break
+            elif acc + dur > now:
+                if event_after:
+                    acc += dur
+                    n += 1
+                break
+            else:
+                acc += dur
+                n += 1
+    return n, acc
+
+def walk_method_count(durations, now):
+    """ The original MethodCall.count walk. Called with Fractions it gives the exact answer """
+    total_dur = sum(durations)
+    acc = now - (now % total_dur)
+    n = int(len(durations) * (acc / total_dur))
+    if acc != now:
+        while True:
+            acc += durations[n % len(durations)]
+            n += 1
+            if acc >= now:
+                break
+    return n, acc
+
+class TestCount(unittest.TestCase):
+    """ Checks Player.count and MethodCall.count against walking through the durations
+        exactly, including durations such as 1/3 and 0.1 whose float sums are not exact """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.metro = Player.metro
+        Player.set_clock(TempoClock())
+
+    @classmethod
+    def tearDownClass(cls):
+        Player.set_clock(cls.metro)
+
+    grids = (8, 3, 6, 10) # durations are multiples of 1 / grid
+
+    def random_durations(self, rand, grid):
+        return [Fraction(rand.randint(1, 2 * grid), grid) for i in range(rand.randint(1, 40))]
+
+    def random_time(self, rand, durations, grid):
+        # Land on the start of an event, as the clock does, or between events
+        if rand.random() < 0.5:
+            return sum(rand.choice(durations) for i in range(rand.randint(0, 400)))
+        return Fraction(rand.randint(0, int(sum(durations) * grid) * 50), grid) + rand.choice([0, Fraction(1, 2 * grid)])
+
+    def assertCount(self, count, exact):
+        self.assertEqual(count[0], exact[0])
+        self.assertAlmostEqual(count[1], float(exact[1]), places=9)
+
+    def test_player_count(self):
+        rand = random.Random(0)
+        player = Player("test")
+        for grid in self.grids:
+            for trial in range(500):
+                durations = self.random_durations(rand, grid)
+                now = self.random_time(rand, durations, grid)
+                player.current_dur = P[[float(dur) for dur in durations]]
+                for event_after in (False, True):
+                    self.assertCount(player.count(float(now), event_after), walk_player_count(durations, now, event_after))
+
+    def test_triplets(self):
+        player = Player("test")
+        durations = [Fraction(n, 6) for n in (4, 1, 1, 2, 1, 2, 4, 4, 1, 2)]
+        player.current_dur = P[[float(dur) for dur in durations]]
+        now = Fraction(785, 3)
+        self.assertCount(player.count(float(now), True), walk_player_count(durations, now, True))
+        self.assertEqual(player.count(float(now), True)[0], 714)
+
+    def test_long_durations(self):
+        rand = random.Random(2)
+        player = Player("test")
+        durations = [Fraction(rand.randint(1, 12), 6) for i in range(2000)]
+        player.current_dur = P[[float(dur) for dur in durations]]
+        for trial in range(50):
+            now = self.random_time(rand, durations, 6)
+            self.assertCount(player.count(float(now)), walk_player_count(durations, now))
+
+    def test_method_count(self):
+        rand = random.Random(1)
+        class Parent:
+            metro = TempoClock()
+        for grid in self.grids:
+            for trial in range(500):
+                durations = self.random_durations(rand, grid)
+                now = self.random_time(rand, durations, grid)
+                Parent.metro.now = lambda: float(now)
+                call = MethodCall(Parent(), lambda: None, [float(dur) for dur in durations])
+                self.assertCount((call.i, call.next), walk_method_count(durations, now))
+
+class StubSamples(object):
+    """ Records the samples that a player prefetches """
+    def __init__(self):
+        self.samples = []
+    def prefetch(self, samples, user=None):
+        self.samples = samples
+        return []
+    def release(self, user):
+        return
+
+class TestPrefetch(unittest.TestCase):
+    """ Samples that are loaded when a sample player is updated """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.metro, cls.bank = Player.metro, Player.samples
+        Player.set_clock(TempoClock())
+
+    @classmethod
+    def tearDownClass(cls):
+        Player.set_clock(cls.metro)
+        Player.set_sample_bank(cls.bank)
+
+    def setUp(self):
+        self.samples = StubSamples()
+        Player.set_sample_bank(self.samples)
+        self.player = Player("test")
+
+    def tearDown(self):
+        self.player.stop()
+
+    def test_sample_attribute(self):
+        self.player >> SynthDefs["play1"]("x-", sample=[0, 2])
+        self.assertEqual(self.samples.samples, [("-", 0), ("-", 2), ("x", 0), ("x", 2)])
+
+    def test_bar_sample_numbers(self):
+        self.player >> SynthDefs["play1"]("x|o3|-(|-2||*(12)|)", sample=1)
+        self.assertEqual(self.samples.samples, [("*", 1), ("*", 2), ("-", 1), ("-", 2), ("o", 3), ("x", 1)])
+
+class LoopbackServer(SCLangServerManager):
+    """ Builds bundles like `Server` but sends them to a local socket """
+    def __init__(self, address):
+        SCLangServerManager.__init__(self, address[0], address[1], address[1])
+        self.setFx(Server.fxlist)
+        self.synthdefs = Server.synthdefs
+    def reset(self):
+        self.client = OSCClientWrapper()
+        self.client.connect((self.addr, self.port))
+
+class TestStats(unittest.TestCase):
+    """ Timings and message counts kept by the clock and its players """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.metro = Player.metro
+        cls.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        cls.receiver.bind(("127.0.0.1", 0))
+
+    @classmethod
+    def tearDownClass(cls):
+        Player.set_clock(cls.metro)
+        cls.receiver.close()
+
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.clock = TempoClock()
+        self.clock.set_time_source(VirtualClock())
+        self.clock.server = LoopbackServer(self.receiver.getsockname())
+        Player.set_clock(self.clock)
+        self.player = Player("test")
+        self.player >> SynthDefs["pluck"]([0, 1, 2], dur=1/2)
+        for i in range(int(self.clock.next_bar() + 4) * 2):
+            self.clock.step(self.clock.beat_dur(1/2))
+
+    def tearDown(self):
+        self.player.stop()
+        shutil.rmtree(self.wd)
+
+    def test_player_stats(self):
+        stats = self.player.stats()
+        self.assertEqual(stats["get_event"]["count"], 9)
+        self.assertEqual(stats["send"]["count"], 9)
+        self.assertEqual(stats["get_bundle"]["count"], 9)
+        self.assertGreater(stats["send"]["p50"], 0)
+
+    def test_clock_stats(self):
+        stats = self.clock.stats()
+        self.assertEqual(stats["blocks"]["messages"]["count"], 9)
+        self.assertEqual(stats["blocks"]["messages"]["max"], 1)
+        self.assertGreater(stats["blocks"]["bytes"]["mean"], 0)
+        self.assertLess(stats["blocks"]["late"]["max"], 0.01)
+        self.assertIn("test", stats["players"])
+
+    def test_export(self):
+        filename = os.path.join(self.wd, "stats.json")
+        self.clock.export_stats(filename)
+        with open(filename) as f:
+            data = json.load(f)
+        self.assertEqual(len(data["players"]["test"]["values"]["send"]), 9)
+        self.assertEqual(len(data["blocks"]["values"]["bytes"]), 9)
+        self.clock.clear_stats()
+        self.assertEqual(self.clock.stats()["blocks"], {})
+        self.assertEqual(self.player.stats(), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from FoxDot.lib import Clock
+from FoxDot.lib.Players import Player
+from FoxDot.lib.TempoClock import TempoClock
+from FoxDot.lib.Patterns import PRand
+from FoxDot.lib.Render import Score
+from FoxDot.lib.SCLang.SynthDef import SynthDefs
+
+class TestRender(unittest.TestCase):
+    """ Renders players with a clock that is not running in real time """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.metro = Player.metro
+        cls.wd = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        Player.set_clock(cls.metro)
+        shutil.rmtree(cls.wd)
+
+    def render(self, beats=16, filename=None):
+        clock = TempoClock()
+        Player.set_clock(clock)
+        random.seed(1)
+        player = Player("test")
+        player >> SynthDefs["pluck"](PRand(0, 7), dur=1/2)
+        score = clock.render(beats, filename, seed=1)
+        return clock, score
+
+    def notes(self, score):
+        return [(time, message) for time, messages in score.messages() for message in messages if message[:2] == ["/s_new", "pluck"]]
+
+    def test_times(self):
+        clock, score = self.render()
+        notes = self.notes(score)
+        # Players start at the next bar
+        self.assertEqual(len(notes), 24)
+        self.assertAlmostEqual(notes[0][0], clock.beat_dur(4))
+        self.assertAlmostEqual(notes[1][0] - notes[0][0], clock.beat_dur(0.5))
+        self.assertAlmostEqual(score.messages()[-1][0], clock.beat_dur(16))
+        self.assertEqual(score.messages()[-1][1], [["/c_set", 0, 0]])
+        self.assertEqual(clock.now(), 16)
+
+    def test_reproducible(self):
+        first = self.render()[1].bundles()
+        second = self.render()[1].bundles()
+        self.assertEqual(first, second)
+
+    def test_write(self):
+        filename = os.path.join(self.wd, "score.osc")
+        clock, score = self.render(filename=filename)
+        bundles = score.bundles()
+        self.assertEqual(os.path.getsize(filename), sum(len(binary) + 4 for time, binary in bundles))
+        filename = os.path.join(self.wd, "score.scd")
+        score.write(filename)
+        with open(filename) as f:
+            code = f.read()
+        self.assertTrue(code.startswith("Score(["))
+        self.assertIn('"/s_new"', code)
+
+    def test_score_order(self):
+        score = Score(origin=10)
+        score.now = 12
+        score.add_message("/b_allocRead", [1, "a.wav"])
+        score.now = 11
+        score.add_message("/b_free", [1])
+        self.assertEqual(score.messages(), [(1, [["/b_free", 1]]), (2, [["/b_allocRead", 1, "a.wav"]])])
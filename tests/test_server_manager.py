@@ -0,0 +1,254 @@
+import os
+import socket
+import threading
+import time
+import unittest
+
+from FoxDot.lib.ServerManager import Server, ServerManager, OSCClientWrapper, OSCEncodedBundle
+from FoxDot.lib.OSC3 import OSCBundle, OSCMessage, decodeOSC
+from FoxDot.lib.Buffers import BufferManager, SampleInfoCache
+
+def example_packet(**kwargs):
+    packet = {"amp": 1, "sus": 0.5, "pan": -1, "freq": 440.0, "lpf": 500, "hpf": 200,
+              "room": 0.3, "echo": 0.5, "chop": 4, "vib": 2, "buf": 3, "degree": "x"}
+    packet.update(kwargs)
+    return packet
+
+class TestBundleTemplates(unittest.TestCase):
+    def setUp(self):
+        self.node, self.bus = Server.node, Server.bus
+
+    def tearDown(self):
+        Server.use_bundle_templates = True
+
+    def get_bundle(self, synthdef, packet, timestamp, use_templates):
+        Server.node, Server.bus = self.node, self.bus
+        Server.use_bundle_templates = use_templates
+        return Server.get_bundle(synthdef, dict(packet), timestamp=timestamp)
+
+    def assertSameBundle(self, synthdef, packet, timestamp=1500000000.125):
+        original = self.get_bundle(synthdef, packet, timestamp, False)
+        template = self.get_bundle(synthdef, packet, timestamp, True)
+        self.assertIsInstance(template, OSCEncodedBundle)
+        self.assertEqual(template.getBinary(), original.getBinary())
+        self.assertEqual(template.timetag, original.timetag)
+
+    def test_sample_player(self):
+        self.assertSameBundle("play1", example_packet(rate=1))
+        self.assertSameBundle("play1", example_packet(rate=0.5))
+        self.assertSameBundle("play1", example_packet(rate=2), timestamp=0)
+
+    def test_synth(self):
+        self.assertSameBundle("pluck", example_packet())
+        self.assertSameBundle("pluck", example_packet(lpf=0, chop=0, vib=0))
+
+    def test_template_is_reused(self):
+        self.get_bundle("pluck", example_packet(), 1, True)
+        n = len(Server.bundle_templates)
+        bundle = self.get_bundle("pluck", example_packet(amp=0.25, lpf=1000), 2, True)
+        self.assertEqual(len(Server.bundle_templates), n)
+        self.assertEqual(decodeOSC(bundle.getBinary())[0], "#bundle")
+
+class LoopbackReceiver(object):
+    """ Counts the datagrams and bytes sent to a local UDP socket """
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.settimeout(0.2)
+        self.address = self.socket.getsockname()
+
+    def receive(self):
+        datagrams = []
+        try:
+            while True:
+                datagrams.append(self.socket.recv(65536))
+        except socket.timeout:
+            pass
+        return datagrams
+
+    def close(self):
+        self.socket.close()
+
+def note_bundle(timetag, node):
+    bundle = OSCBundle(time=timetag)
+    for address in ("/g_new", "/s_new", "/s_new"):
+        msg = OSCMessage(address)
+        msg.append(["pluck", node, 1, 1, "amp", 0.5, "freq", 440.0, "sus", 1.0])
+        bundle.append(msg)
+    return bundle
+
+class TestBatchedSend(unittest.TestCase):
+    def setUp(self):
+        self.receiver = LoopbackReceiver()
+
+    def tearDown(self):
+        self.receiver.close()
+
+    def messages(self, datagrams):
+        return [msg for data in datagrams for msg in decodeOSC(data)[2:]]
+
+    def test_one_datagram_per_block(self):
+        server = ServerManager(*self.receiver.address)
+        bundles = [note_bundle(1500000000.5, node) for node in range(4)]
+        server.sendOSCBatch(bundles)
+        datagrams = self.receiver.receive()
+        self.assertEqual(len(datagrams), 1)
+        self.assertLessEqual(sum(map(len, datagrams)), server.max_datagram_size)
+        self.assertEqual(decodeOSC(datagrams[0])[1], 1500000000.5)
+        self.assertEqual(self.messages(datagrams), [msg for bundle in bundles for msg in decodeOSC(bundle.getBinary())[2:]])
+
+    def test_split_by_size_and_timetag(self):
+        server = ServerManager(*self.receiver.address)
+        bundles = [note_bundle(1500000000.5 + (node % 2), node) for node in range(40)]
+        server.sendOSCBatch(bundles)
+        datagrams = self.receiver.receive()
+        self.assertGreater(len(datagrams), 2)
+        self.assertLess(len(datagrams), len(bundles))
+        for data in datagrams:
+            self.assertLessEqual(len(data), server.max_datagram_size)
+        self.assertEqual(len(self.messages(datagrams)), 3 * len(bundles))
+        self.assertEqual(sorted(set(decodeOSC(data)[1] for data in datagrams)), [1500000000.5, 1500000001.5])
+
+    def test_forward(self):
+        forward = LoopbackReceiver()
+        client, Server.client = Server.client, OSCClientWrapper()
+        Server.client.connect(self.receiver.address)
+        Server.add_forward(*forward.address)
+        try:
+            Server.sendOSCBatch([note_bundle(0, node) for node in range(3)])
+            sent, forwarded = self.receiver.receive(), forward.receive()
+        finally:
+            Server.client, Server.forward = client, None
+            forward.close()
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent, forwarded)
+
+    def test_send_error(self):
+        """ A datagram that fails to send does not stop the rest being sent """
+        sent = []
+        def sendmsg(buffers):
+            if len(sent) == 1:
+                sent.append(None)
+                raise socket.error("No buffer space available")
+            sent.append(buffers[0])
+        client = OSCClientWrapper()
+        client.socket = type("StubSocket", (object,), {"sendmsg": staticmethod(sendmsg)})()
+        printed, OSCClientWrapper.error_printed = OSCClientWrapper.error_printed, False
+        try:
+            self.assertEqual(client.sendDatagrams([b"a", b"b", b"c", b"d"]), 1)
+            self.assertTrue(OSCClientWrapper.error_printed)
+        finally:
+            OSCClientWrapper.error_printed = printed
+            client.socket = None
+        self.assertEqual(sent, [b"a", None, b"c", b"d"])
+
+
+class StubScsynth(LoopbackReceiver):
+    """ Replies to /b_allocRead messages like scsynth. Buffers whose path ends with
+        "fail.wav" reply with /fail, and loading waits for `event` if it is given """
+    def __init__(self, event=None):
+        LoopbackReceiver.__init__(self)
+        self.event = event
+        self.datagrams = []
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            try:
+                data, address = self.socket.recvfrom(65536)
+            except (socket.timeout, OSError):
+                continue
+            self.datagrams.append(data)
+            if self.event is not None:
+                self.event.wait()
+            decoded = decodeOSC(data)
+            messages = decoded[2:] if decoded[0] == "#bundle" else [decoded]
+            for message in messages:
+                if message[0] == "/b_allocRead":
+                    bufnum, path = message[2:4]
+                    if path.endswith("oldfail.wav"):
+                        # Older versions of SuperCollider do not add the buffer number
+                        reply = OSCMessage("/fail")
+                        reply.append(["/b_allocRead", "File '%s' could not be opened" % path])
+                    elif path.endswith("fail.wav"):
+                        reply = OSCMessage("/fail")
+                        reply.append(["/b_allocRead", "File could not be opened", bufnum])
+                    else:
+                        reply = OSCMessage("/done")
+                        reply.append(["/b_allocRead", bufnum])
+                    self.socket.sendto(reply.getBinary(), address)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        LoopbackReceiver.close(self)
+
+class TestBufferPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.event = threading.Event()
+        self.scsynth = StubScsynth(self.event)
+        self.buffer_client = Server.buffer_client
+        Server.buffer_client = None
+        Server.connectBufferClient(self.scsynth.address)
+        self.bm = BufferManager(info=SampleInfoCache())
+        self.bm._paths = [os.path.join(os.path.dirname(__file__), "..", "FoxDot", "snd")]
+
+    def tearDown(self):
+        self.event.set()
+        Server.buffer_client.stop()
+        Server.buffer_client = self.buffer_client
+        self.scsynth.close()
+
+    def wait_for(self, condition, timeout=2):
+        start = time.time()
+        while not condition() and time.time() - start < timeout:
+            time.sleep(0.01)
+        return condition()
+
+    def test_one_bundle(self):
+        user = object()
+        buffers = self.bm.prefetch([(symbol, index) for symbol in "xo-*" for index in range(3)], user=user)
+        self.assertEqual(len(buffers), 12)
+        self.assertTrue(self.wait_for(lambda: len(self.scsynth.datagrams) > 0))
+        self.assertFalse(any(self.bm.isLoaded(buf) for buf in buffers))
+        self.event.set()
+        self.assertTrue(self.wait_for(lambda: all(self.bm.isLoaded(buf) for buf in buffers)))
+        self.assertEqual(len(self.scsynth.datagrams), 1)
+        self.assertEqual(len(decodeOSC(self.scsynth.datagrams[0])[2:]), 12)
+        # Buffers that have been loaded are not sent again
+        self.assertEqual(self.bm.prefetch([("x", 0)], user=user), buffers[:1])
+        time.sleep(0.1)
+        self.assertEqual(len(self.scsynth.datagrams), 1)
+
+    def test_large_batches_are_split(self):
+        Server.bufferReadBatch([("/tmp/%s.wav" % ("x" * 100), n) for n in range(1000, 1100)])
+        self.event.set()
+        self.assertTrue(self.wait_for(lambda: all(Server.isBufferLoaded(n) for n in range(1000, 1100))))
+        self.assertGreater(len(self.scsynth.datagrams), 1)
+        for data in self.scsynth.datagrams:
+            self.assertLessEqual(len(data), Server.max_datagram_size)
+
+    def test_fail(self):
+        self.event.set()
+        Server.bufferReadBatch([("/tmp/fail.wav", 1200)])
+        self.assertTrue(self.wait_for(lambda: Server.isBufferLoaded(1200)))
+        self.assertIn(1200, Server.buffers_failed)
+
+    def test_fail_without_bufnum(self):
+        self.event.set()
+        Server.buffers_pending[1300] = "/tmp/other.wav"
+        try:
+            Server.bufferReadBatch([("/tmp/oldfail.wav", 1301)])
+            self.assertTrue(self.wait_for(lambda: Server.isBufferLoaded(1301)))
+            self.assertEqual(Server.buffers_failed.get(1301), "/tmp/oldfail.wav")
+            self.assertFalse(Server.isBufferLoaded(1300))
+        finally:
+            Server.buffers_pending.pop(1300, None)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,301 @@
+import sys
+import time
+import random
+import threading
+import unittest
+
+from FoxDot.lib.TempoClock import TempoClock, Queue, QueueBlock, BlockExecutor, LatencyController
+from FoxDot.lib.OSC3 import OSCBundle
+from FoxDot.lib.TimeSource import VirtualClock, MonotonicClock
+
+class StubClock(object):
+    server = None
+
+def callback():
+    return
+
+class TestQueue(unittest.TestCase):
+    def setUp(self):
+        self.queue = Queue(StubClock())
+
+    def test_empty(self):
+        self.assertEqual(self.queue.pop(), [])
+        self.assertEqual(self.queue.next(), sys.maxsize)
+        self.assertTrue(self.queue.before_next_event(0))
+        self.assertFalse(self.queue.after_next_event(10000))
+
+    def test_pop_in_beat_order(self):
+        beats = [random.randint(0, 500) / 4 for n in range(1000)]
+        for beat in beats:
+            self.queue.add(callback, beat)
+        popped = []
+        while len(self.queue):
+            block = self.queue.pop()
+            self.assertIsInstance(block, QueueBlock)
+            popped.append(block.beat)
+        self.assertEqual(popped, sorted(set(beats)))
+
+    def test_same_beat_merges(self):
+        self.queue.add(callback, 4)
+        self.queue.add(lambda: None, 4.0)
+        self.assertEqual(len(self.queue), 1)
+        self.assertEqual(len(self.queue.pop()), 2)
+
+    def test_next_event(self):
+        self.queue.add(callback, 8)
+        self.queue.add(callback, 2)
+        self.assertEqual(self.queue.next(), 2)
+        self.assertTrue(self.queue.before_next_event(1.5))
+        self.assertFalse(self.queue.after_next_event(1.5))
+        self.assertTrue(self.queue.after_next_event(2))
+        self.assertEqual([block.beat for block in self.queue.data], [8, 2])
+
+    def test_clear(self):
+        for beat in range(10):
+            self.queue.add(callback, beat)
+        self.queue.clear()
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(self.queue.next(), sys.maxsize)
+
+class StubBlock(object):
+    def __init__(self, beat, log):
+        self.beat = beat
+        self.log = log
+    def send_osc_messages(self):
+        self.log.append(("sent", self.beat))
+
+class TestBlockExecutor(unittest.TestCase):
+    def setUp(self):
+        self.log = []
+        self.release = threading.Event()
+        self.done = threading.Semaphore(0)
+
+    def run_block(self, block, beat, send):
+        self.log.append(("run", block.beat))
+        if block.beat == 0:
+            self.release.wait(1)
+        self.done.release()
+
+    def run_policy(self, policy, n=4):
+        executor = BlockExecutor(self.run_block, workers=1, policy=policy)
+        for beat in range(n):
+            executor.submit(StubBlock(beat, self.log), beat)
+            time.sleep(0.01)
+        backlog = executor.backlog()
+        self.release.set()
+        for beat in range(n):
+            self.assertTrue(self.done.acquire(timeout=1))
+        time.sleep(0.01)
+        return executor, backlog
+
+    def test_queue(self):
+        executor, backlog = self.run_policy("queue")
+        self.assertEqual(backlog, 3)
+        self.assertEqual(executor.stats["queued"], 3)
+        self.assertEqual([beat for action, beat in self.log if action == "run"], [0, 1, 2, 3])
+        self.assertEqual([beat for action, beat in self.log if action == "sent"], [0, 1, 2, 3])
+
+    def test_merge(self):
+        executor, backlog = self.run_policy("merge")
+        self.assertEqual(executor.stats["merged"], 2)
+        self.assertEqual(self.log[2:], [("run", 1), ("run", 2), ("run", 3), ("sent", 1), ("sent", 2), ("sent", 3)])
+
+    def test_drop(self):
+        executor, backlog = self.run_policy("drop")
+        self.assertEqual(executor.stats["dropped"], 3)
+        self.assertEqual([beat for action, beat in self.log if action == "run"], [0, 1, 2, 3])
+        self.assertEqual([beat for action, beat in self.log if action == "sent"], [0])
+
+class TestEventDrivenClock(unittest.TestCase):
+    def setUp(self):
+        self.clock = TempoClock(bpm=240)
+        self.clock.set_time_source(VirtualClock())
+        # Virtual time has no wake up jitter so the clock doesn't need to wake early
+        self.clock.set_scheduling_mode("event", lead=0)
+
+    def run_once(self):
+        """ Runs one pass of the event loop in `TempoClock.run` """
+        self.clock._wait_for_next_block()
+        self.clock.tick(threaded=False)
+
+    def test_wakes_for_earlier_block(self):
+        called = threading.Event()
+        self.clock.schedule(callback, self.clock.now() + 100)
+        self.run_once()
+        self.clock.schedule(called.set, self.clock.now() + 0.5)
+        for i in range(1000):
+            if called.is_set():
+                break
+            self.run_once()
+        self.assertTrue(called.is_set())
+        self.assertEqual(self.clock.get_block_lateness()["blocks"], 1)
+        self.assertLess(self.clock.get_block_lateness()["max"], 1e-6)
+        # The later block is still waiting
+        self.assertEqual(len(self.clock.queue), 1)
+
+class TestVirtualClock(unittest.TestCase):
+    def setUp(self):
+        self.clock = TempoClock(bpm=120)
+        self.clock.set_time_source(VirtualClock())
+
+    def test_time_only_moves_when_stepped(self):
+        beat = self.clock.now()
+        self.assertEqual(self.clock.now(), beat)
+        self.clock.step(1.5)
+        self.assertAlmostEqual(self.clock.now(), beat + 3)
+        self.assertAlmostEqual(self.clock.osc_message_time(), self.clock.get_machine_time() + self.clock.latency)
+
+    def test_step_runs_due_blocks(self):
+        log = []
+        for beat in (1, 2, 2.5, 6):
+            self.clock.schedule(lambda beat=beat: log.append(beat), beat)
+        start = time.time()
+        self.assertEqual(self.clock.step(0), 0)
+        self.assertEqual(self.clock.step(0.5), 1)
+        self.assertEqual(self.clock.step(0.75), 2)
+        self.assertEqual(log, [1, 2, 2.5])
+        self.assertEqual(self.clock.step(10), 1)
+        self.assertEqual(self.clock.get_block_lateness()["blocks"], 4)
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_sleep_does_not_block(self):
+        source = self.clock.time_source
+        start = source.time()
+        source.sleep(100)
+        self.assertEqual(source.time(), start + 100)
+
+    def test_backlog_does_not_delay_messages(self):
+        self.clock.set_executor(workers=1)
+        started, release, done = threading.Event(), threading.Event(), threading.Event()
+        def slow():
+            started.set()
+            release.wait(5)
+        self.clock.schedule(slow, 1)
+        self.clock.schedule(done.set, 2)
+        self.clock.time_source.advance(0.5)
+        self.clock.tick()
+        self.assertTrue(started.wait(5))
+        self.clock.time_source.advance(0.5)
+        block = self.clock.tick()
+        due = self.clock.get_machine_time()
+        # The block waits for the worker while time moves on
+        self.clock.time_source.advance(0.3)
+        release.set()
+        self.assertTrue(done.wait(5))
+        self.assertAlmostEqual(block.due, due)
+        self.assertAlmostEqual(block.time, due + self.clock.latency)
+
+    def test_monotonic_clock(self):
+        source = MonotonicClock()
+        self.assertAlmostEqual(source.time(), time.time(), places=1)
+        self.assertLessEqual(source.time(), source.time())
+
+class TestLatencyController(unittest.TestCase):
+    def setUp(self):
+        self.clock = TempoClock(bpm=120)
+        self.clock.set_time_source(VirtualClock())
+        self.clock.latency = 0.25
+
+    def update(self, controller, used, dropped=0, messages=0, seconds=0.5):
+        self.clock.time_source.advance(seconds)
+        return controller.update(used, dropped, messages)
+
+    def test_raise_and_lower(self):
+        controller = LatencyController(self.clock, verbose=False)
+        for i in range(20):
+            self.update(controller, 0.2)
+        self.assertAlmostEqual(self.clock.latency, 0.4, places=1)
+        self.assertLessEqual(self.clock.latency, 0.4)
+        changes = list(controller.history)
+        self.assertGreater(len(changes), 1)
+        self.assertTrue(all(change["new"] > change["old"] for change in changes))
+        for change in changes:
+            self.assertGreaterEqual(abs(change["new"] - change["old"]), controller.resolution)
+            self.assertLess(change["new"] - change["old"], 0.1)
+        # The load falls and the latency is lowered gradually to the minimum
+        for i in range(2000):
+            self.update(controller, 0.01)
+        self.assertAlmostEqual(self.clock.latency, controller.minimum, places=1)
+        self.assertTrue(all(change["new"] < change["old"] for change in list(controller.history)[len(changes):]))
+
+    def test_dropped_messages(self):
+        controller = LatencyController(self.clock, maximum=0.5, verbose=False)
+        change = self.update(controller, 0.01, dropped=3, seconds=1)
+        self.assertEqual(change["dropped"], 3)
+        self.assertAlmostEqual(self.clock.latency, 0.3)
+        for i in range(10):
+            self.update(controller, 0.01, dropped=1, seconds=1)
+        self.assertAlmostEqual(self.clock.latency, 0.5, places=2)
+
+    def test_changes_are_limited(self):
+        controller = LatencyController(self.clock, verbose=False)
+        # No clock time has passed since the last block, so nothing can change
+        self.assertIsNone(controller.update(0.01, dropped=10))
+        self.assertIsNone(self.update(controller, 0.01, dropped=10, seconds=0))
+        self.assertEqual(self.clock.latency, 0.25)
+        # Consecutive blocks 10ms apart only move it by half a millisecond each
+        for i in range(40):
+            self.update(controller, 0.01, dropped=10, seconds=0.01)
+        self.assertAlmostEqual(self.clock.latency, 0.27)
+        self.assertTrue(all(change["new"] - change["old"] < 0.011 for change in controller.history))
+
+    def test_drop_rate(self):
+        controller = LatencyController(self.clock, verbose=False)
+        # One message out of a hundred barely raises the target
+        self.assertIsNone(self.update(controller, 0.01, dropped=1, messages=99, seconds=10))
+        self.assertAlmostEqual(controller.target, 0.2525)
+        self.update(controller, 0.01, dropped=25, messages=75, seconds=10)
+        self.assertAlmostEqual(controller.target, 0.3125)
+        self.update(controller, 0.01, dropped=100, seconds=10)
+        self.assertGreater(controller.target, 0.5)
+
+    def test_user_latency(self):
+        controller = LatencyController(self.clock, verbose=False)
+        self.clock.latency = 0.75
+        self.assertIsNone(self.update(controller, 0.3))
+        self.assertEqual(self.clock.latency, 0.75)
+
+    def test_late_messages_are_counted(self):
+        bundle = OSCBundle(time=self.clock.get_machine_time() - 1)
+        self.clock.set_adaptive_latency(True, verbose=False)
+        self.clock.schedule(lambda: self.clock.current_block.append_osc_message(bundle), 1)
+        self.clock.schedule(lambda: None, 2)
+        self.clock.step(0.5)
+        self.clock.step(0.5)
+        self.assertEqual(self.clock.late_messages, 1)
+        self.assertEqual(self.clock.stats()["blocks"]["dropped"]["max"], 1)
+        self.assertEqual(len(self.clock.latency_controller.history), 1)
+        self.assertGreater(self.clock.latency, 0.25)
+        self.clock.set_adaptive_latency(False)
+        self.assertEqual(self.clock.latency, 0.25)
+
+    def test_queue_wait_is_counted(self):
+        self.clock.set_executor(workers=1)
+        self.clock.set_adaptive_latency(True, verbose=False)
+        used = []
+        self.clock.latency_controller.update = lambda seconds, dropped=0, messages=0: used.append(seconds)
+        started, release = threading.Event(), threading.Event()
+        def slow():
+            started.set()
+            release.wait(5)
+        self.clock.schedule(slow, 1)
+        self.clock.schedule(callback, 2)
+        self.clock.time_source.advance(0.5)
+        self.clock.tick()
+        self.assertTrue(started.wait(5))
+        self.clock.time_source.advance(0.5)
+        block = self.clock.tick()
+        # The second block waits for the worker, which is still running the first
+        time.sleep(0.2)
+        release.set()
+        for i in range(500):
+            if len(used) == 2:
+                break
+            time.sleep(0.01)
+        self.assertGreaterEqual(block.wait, 0.2)
+        self.assertGreaterEqual(used[1], block.wait)
+        self.assertLess(block.late, 0.01)
+
+if __name__ == "__main__":
+
+    unittest.main()
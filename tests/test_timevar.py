@@ -0,0 +1,71 @@
+import random
+import unittest
+
+from FoxDot.lib.TimeVar import TimeVar, var, linvar, expvar, sinvar
+from FoxDot.lib.Constants import inf
+from FoxDot.lib.Utils import DurationIndex
+
+
+def walking(cls):
+    """ Returns a subclass of a TimeVar type that always walks through its durations """
+    class Walking(cls):
+        def get_dur_index(self):
+            return None
+    return Walking
+
+
+class TestDurationIndex(unittest.TestCase):
+    def test_find(self):
+        index = DurationIndex([1, 2, 0.5])
+        self.assertEqual(index.find(0), (0, 0, 1))
+        self.assertEqual(index.find(1), (1, 1, 3))
+        self.assertEqual(index.find(3.25), (2, 3, 3.5))
+        self.assertEqual(index.find(3.5), (3, 3.5, 4.5))
+        self.assertEqual(index.find(352.1), (301, 351, 353))
+
+    def test_infinite_duration(self):
+        index = DurationIndex([1, float("inf"), 2])
+        self.assertEqual(index.find(0.5)[0], 0)
+        self.assertEqual(index.find(1)[0], 1)
+        self.assertEqual(index.find(10 ** 9)[0], 1)
+
+    def test_from_pattern(self):
+        self.assertEqual(DurationIndex.from_pattern(var([0, 1], [4, inf]).dur, inf=inf).total, float("inf"))
+        self.assertEqual(DurationIndex.from_pattern(var([0, 1], [2, [1, 3]]).dur).durations, [2, 1, 2, 3])
+        self.assertIsNone(DurationIndex.from_pattern(var([0, 1], [2, "x"]).dur))
+
+
+class TestTimeVarIndex(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+
+    def compare(self, cls, values, dur, times):
+        walked = walking(cls)(values, dur)
+        indexed = cls(values, dur)
+        for t in times:
+            self.assertEqual(indexed.now(t), walked.now(t), "{} at time {}".format(cls.__name__, t))
+
+    def test_sequential(self):
+        times = [i * 0.25 for i in range(400)]
+        for cls in (TimeVar, linvar, expvar, sinvar):
+            self.compare(cls, [0, 4, 2, 7], [1, 0.5, [2, 3], 1.5], times)
+
+    def test_random_access(self):
+        values, dur = [0, 4, 2], [1, [0.5, 2.5], 3]
+        times = [random.random() * 100 for i in range(200)]
+        indexed = linvar(values, dur)
+        for t in times:
+            self.assertEqual(indexed.now(t), walking(linvar)(values, dur).now(t))
+
+    def test_backwards(self):
+        v = var([0, 1, 2], [1, 2, 4])
+        forward = [v.now(i * 0.5) for i in range(100)]
+        backward = [v.now(i * 0.5) for i in reversed(range(100))]
+        self.assertEqual(forward, list(reversed(backward)))
+
+    def test_inf(self):
+        v = var([0, 1, 2], [4, inf])
+        self.assertEqual(v.now(0), 0)
+        self.assertEqual(v.now(5), 1)
+        self.assertEqual(v.now(10 ** 6), 1)
+        self.assertEqual(v.now(1), 0)